@@ -1,45 +1,184 @@
+import click
 from flask import Flask
 from flask_mail import Mail
-from flask_migrate import Migrate
 from flask_sqlalchemy import SQLAlchemy
 import os
+from . import database
 
 
 # Initialize extensions
-db = SQLAlchemy()
-migrate = Migrate()
+db = SQLAlchemy(session_options={'class_': database.RoutingSession})  # Reads may go to a replica
 mail = Mail()
 
+# What each APP_PROFILE loads: 'api' serves HTTP requests, 'worker' runs the
+# background commands (and push_asgi.py), 'full' does both
+APP_PROFILES = ('full', 'api', 'worker')
 
-def create_app():
+
+class _LazyMigrateGroup(click.Group):
+    """Stand-in for Flask-Migrate's 'flask db' group. Flask-Migrate pulls in
+    all of Alembic, which takes longer to import than the rest of the app
+    together, so it is only set up once a 'db' command is looked up.
+    """
+
+    def __init__(self, app):
+        super().__init__('db', help='Perform database migrations.')
+        self.app = app
+
+    # Flask-Migrate replaces this group with its own when set up
+    def _migrate_group(self):
+        if 'migrate' not in self.app.extensions:
+            from flask_migrate import Migrate
+            Migrate(self.app, db)
+
+        return self.app.cli.commands['db']
+
+    def list_commands(self, ctx):
+        return self._migrate_group().list_commands(ctx)
+
+    def get_command(self, ctx, name):
+        return self._migrate_group().get_command(ctx, name)
+
+def _init_migrate(app):
+    if app.config['MIGRATE']:
+        from flask_migrate import Migrate
+        Migrate(app, db)
+    else:
+        app.cli.add_command(_LazyMigrateGroup(app))
+
+
+def create_app(test_config=None, profile=None):
     app = Flask(__name__)
 
-    # Configuration for the app
-    app.config.from_object('app.config.Config')
+    # Configuration for the app (a mapping may be passed for tests/benchmarks)
+    if test_config is None:
+        app.config.from_object('app.config.Config')
+    else:
+        app.config.from_mapping(test_config)
+
+    if profile is not None:
+        app.config['APP_PROFILE'] = profile
+    profile = app.config.setdefault('APP_PROFILE', os.getenv('DAYMINDER_PROFILE', 'full'))
+    if profile not in APP_PROFILES:
+        raise ValueError(f'Unknown APP_PROFILE {profile!r}; expected one of {APP_PROFILES}')
+    serves_api = profile in ('full', 'api')
+    runs_workers = profile in ('full', 'worker')
+    app.config.setdefault('MIGRATE', False)  # Set up Flask-Migrate eagerly
 
     # SMTP email settings
-    app.config['MAIL_SERVER'] = 'smtp.gmail.com'
-    app.config['MAIL_PORT'] = 587
-    app.config['MAIL_USE_TLS'] = True
-    app.config['MAIL_USERNAME'] = os.getenv('GMAIL_USER')
-    app.config['MAIL_PASSWORD'] = os.getenv('GMAIL_PASSWORD')
-    app.config['MAIL_DEFAULT_SENDER'] = ('DayMinder', os.getenv('GMAIL_USER'))
-
-    # Initialize extensions
+    if runs_workers:
+        app.config['MAIL_SERVER'] = 'smtp.gmail.com'
+        app.config['MAIL_PORT'] = 587
+        app.config['MAIL_USE_TLS'] = True
+        app.config['MAIL_USERNAME'] = os.getenv('GMAIL_USER')
+        app.config['MAIL_PASSWORD'] = os.getenv('GMAIL_PASSWORD')
+        app.config['MAIL_DEFAULT_SENDER'] = ('DayMinder', os.getenv('GMAIL_USER'))
+
+    # Initialize extensions (pool, timeout and replica settings first)
+    database.configure_engines(app)
     db.init_app(app)
-    migrate.init_app(app, db)
-    mail.init_app(app)
+    database.init_app(app, db)
+    _init_migrate(app)
+    if runs_workers:
+        mail.init_app(app)
+
+    # Import models to ensure they are registered with SQLAlchemy
+    from .models import User, Task, Reminder, TaskOccurrence, ReminderArchive, Notification, UserPurge, DigestDelivery, SyncTombstone, TaskDailyStat, JobCheckpoint
+
+    # Version stamping for the delta-sync change feed
+    from . import sync
+    sync.init_app(app)
+
+    # Task completion rollups and their backfill command
+    from . import stats
+    stats.init_app(app)
+
+    # Materialized occurrences and reminders of recurring tasks
+    from . import occurrences
+    occurrences.init_app(app)
+
+    if serves_api:
+        _init_api(app)
+    if runs_workers:
+        _init_workers(app)
+
+    return app
+
+
+def _init_api(app):
+    # Request timing, SQL statement counts and the /metrics endpoint
+    from . import metrics
+    metrics.init_app(app)
+
+    # Optional fast JSON encoding for large list responses
+    from . import serializers
+    serializers.init_app(app)
+
+    # Resolve the logged-in user once per request
+    from . import auth
+    auth.init_app(app)
+
+    # Password hashing off the request thread, on a bounded process pool
+    from . import passwords
+    passwords.init_app(app)
+
+    # Cached task and reminder payloads, keyed by their user's sync_version
+    from . import hot_cache
+    hot_cache.init_app(app)
+
+    # Per-user interval index for task overlap checks
+    from . import conflicts
+    conflicts.init_app(app)
+
+    # Full-text task search (SQLite index and rebuild command)
+    from . import search
+    search.init_app(app)
 
-    # Import and register blueprints for users, tasks, and reminders
+    # Import and register blueprints for users, tasks, reminders, the calendar, sync and stats
     from .user_routes import user_bp
     from .task_routes import task_bp
     from .reminder_routes import reminder_bp
+    from .calendar_routes import calendar_bp
+    from .sync_routes import sync_bp
+    from .stats_routes import stats_bp
 
     app.register_blueprint(user_bp, url_prefix='/api')  # Prefix all user routes with /api
     app.register_blueprint(task_bp, url_prefix='/api')  # Prefix all task routes with /api
     app.register_blueprint(reminder_bp, url_prefix='/api')  # Prefix all reminder routes with /api
+    app.register_blueprint(calendar_bp, url_prefix='/api')  # Prefix all calendar routes with /api
+    app.register_blueprint(sync_bp, url_prefix='/api')  # Prefix all sync routes with /api
+    app.register_blueprint(stats_bp, url_prefix='/api')  # Prefix all stats routes with /api
 
-    # Import models to ensure they are registered with SQLAlchemy
-    from .models import User, Task, Reminder
 
-    return app
+def _init_workers(app):
+    # Metrics endpoint for the long-running worker commands
+    from . import metrics
+    metrics.init_worker(app)
+
+    # Pooled SMTP delivery used by every outgoing email
+    from . import mailer
+    mailer.init_app(app)
+
+    # Outbound email queue and its worker command
+    from . import notifications
+    notifications.init_app(app)
+
+    # In-app push of fired reminders (served by 'push_asgi.py')
+    from . import push
+    push.init_app(app)
+
+    # Due-reminder dispatcher command
+    from . import dispatcher
+    dispatcher.init_app(app)
+
+    # Background purge of deleted accounts
+    from . import purge
+    purge.init_app(app)
+
+    # Daily schedule digests
+    from . import digest
+    digest.init_app(app)
+
+    # Off-peak archiving of old sent reminders
+    from . import archive
+    archive.init_app(app)
@@ -0,0 +1,121 @@
+from . import db
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+import time
+from .models import User, Reminder, ReminderArchive
+
+
+# Columns shared by 'reminders' and 'reminders_archive'
+ARCHIVED_COLUMNS = (
+    'reminder_id', 'task_id', 'user_id', 'reminder_time', 'sent', 'sent_time',
+    'version', 'updated_at',
+)
+
+def reminder_history(columns, criteria):
+    """Live and archived reminders as one subquery with the given columns.
+    'criteria(model)' returns the filters for either table, so they are
+    applied inside each half of the union where their indexes can be used.
+    """
+    return db.union_all(*(
+        db.select(*(getattr(model, column) for column in columns))
+        .where(*criteria(model))
+        for model in (Reminder, ReminderArchive)
+    )).subquery('reminder_history')
+
+# True when 'now' falls in ARCHIVE_WINDOW, an (hour, hour) range in UTC
+# that may wrap past midnight, or when no window is set
+def in_archive_window(now=None):
+    window = current_app.config['ARCHIVE_WINDOW']
+    if window is None:
+        return True
+    start, end = window
+    hour = (now or datetime.utcnow()).hour
+    if start <= end:
+        return start <= hour < end
+
+    return hour >= start or hour < end
+
+def archive_batch(cutoff, batch_size):
+    """Move up to 'batch_size' sent reminders due before 'cutoff' to the
+    archive in one transaction. Returns the number moved.
+    """
+    rows = db.session.execute(
+        db.select(Reminder.reminder_id, Reminder.user_id)
+        .where(Reminder.sent.is_(True), Reminder.reminder_time < cutoff)
+        .order_by(Reminder.reminder_time)
+        .limit(batch_size)
+    ).all()
+    if not rows:
+        return 0
+
+    ids = [reminder_id for reminder_id, _ in rows]
+    db.session.execute(
+        db.insert(ReminderArchive).from_select(
+            ARCHIVED_COLUMNS + ('archived_at',),
+            db.select(
+                *(getattr(Reminder, column) for column in ARCHIVED_COLUMNS),
+                db.literal(datetime.utcnow(), db.DateTime)
+            ).where(Reminder.reminder_id.in_(ids))
+        )
+    )
+    db.session.execute(
+        db.delete(Reminder)
+        .where(Reminder.reminder_id.in_(ids))
+        .execution_options(synchronize_session=False)
+    )
+    # The users' reminder lists changed; bump their versions so cached
+    # list ETags are not reused. Nothing was deleted as far as sync goes.
+    db.session.execute(
+        db.update(User)
+        .where(User.user_id.in_({user_id for _, user_id in rows}))
+        .values(sync_version=User.sync_version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+    return len(ids)
+
+def run_archive(once=False, ignore_window=False):
+    """Archive reminders sent more than ARCHIVE_AFTER_DAYS ago, a batch at
+    a time with a pause in between, only during ARCHIVE_WINDOW. With
+    'once', return when nothing is left or the window closes.
+    """
+    config = current_app.config
+    while True:
+        if ignore_window or in_archive_window():
+            cutoff = datetime.utcnow() - timedelta(days=config['ARCHIVE_AFTER_DAYS'])
+            try:
+                moved = archive_batch(cutoff, config['ARCHIVE_BATCH_SIZE'])
+            except Exception:
+                db.session.rollback()
+                current_app.logger.exception('Reminder archive batch failed')
+                moved = 0
+            if moved:
+                current_app.logger.info('Archived %s reminders', moved)
+                time.sleep(config['ARCHIVE_BATCH_PAUSE'])  # Leave room for live traffic
+                continue
+        if once:
+            return
+        time.sleep(config['ARCHIVE_POLL_INTERVAL'])
+
+
+@click.command('archive-reminders')
+@click.option('--once', is_flag=True, help='Exit when nothing is left to archive.')
+@click.option('--ignore-window', is_flag=True, help='Run outside ARCHIVE_WINDOW.')
+@with_appcontext
+def archive_reminders_command(once, ignore_window):
+    """Move old sent reminders to the archive table."""
+    run_archive(once=once, ignore_window=ignore_window)
+
+
+def init_app(app):
+    app.config.setdefault('ARCHIVE_AFTER_DAYS', 30)
+    app.config.setdefault('ARCHIVE_BATCH_SIZE', 500)
+    app.config.setdefault('ARCHIVE_BATCH_PAUSE', 0.5)  # Seconds between batches
+    app.config.setdefault('ARCHIVE_POLL_INTERVAL', 300)
+    # Off-peak hours (UTC) as (start, end), e.g. (1, 5); None runs any time
+    app.config.setdefault('ARCHIVE_WINDOW', None)
+
+    app.cli.add_command(archive_reminders_command)
@@ -0,0 +1,70 @@
+from . import db
+from collections import namedtuple
+from flask import current_app, g, jsonify, session
+from functools import wraps
+from .cache import TTLCache
+from .models import User
+
+
+# Read-only snapshot of a user row, safe to share between requests
+UserRecord = namedtuple('UserRecord', [c.name for c in User.__table__.columns])
+
+def _snapshot(user):
+    return UserRecord(*(getattr(user, field) for field in UserRecord._fields))
+
+def get_user_cache():
+    return current_app.extensions['user_cache']
+
+# Drop a user from the cache after their row changes. The cache is
+# process-local, so other processes see the change once their entry expires.
+def invalidate_user(user_id):
+    get_user_cache().delete(user_id)
+
+# Resolve the session user once per request into 'g.user'. Cached records
+# save a primary-key SELECT on every authenticated request.
+def load_logged_in_user():
+    g.user = None
+    user_id = session.get('user_id')
+    if user_id is None:
+        return
+
+    cache = get_user_cache()
+    record = cache.get(user_id)
+    if record is None:
+        user = db.session.get(User, user_id)
+        if user is None:
+            return
+        record = _snapshot(user)
+        cache.set(user_id, record)
+
+    # Accounts scheduled for deletion can no longer be used
+    if record.deleted_at is None:
+        g.user = record
+
+# Load the logged-in user as an ORM instance, for routes that modify it
+def get_current_user_model():
+    return db.session.get(User, g.user.user_id)
+
+# Decorator for routes that need a logged-in user
+def login_required(view):
+    @wraps(view)
+    def wrapped_view(*args, **kwargs):
+        if session.get('user_id') is None:
+            return jsonify({'error': 'User not logged in'}), 401
+        if g.user is None:
+            return jsonify({'error': 'User not found'}), 404
+
+        return view(*args, **kwargs)
+
+    return wrapped_view
+
+
+def init_app(app):
+    app.config.setdefault('USER_CACHE_SIZE', 10000)
+    app.config.setdefault('USER_CACHE_TTL', 60)
+
+    app.extensions['user_cache'] = TTLCache(
+        maxsize=app.config['USER_CACHE_SIZE'],
+        ttl=app.config['USER_CACHE_TTL']
+    )
+    app.before_request(load_logged_in_user)
@@ -0,0 +1,48 @@
+import json
+from marshmallow import EXCLUDE, ValidationError
+
+
+# Rows validated and inserted per transaction
+CHUNK_SIZE = 1000
+
+# Read an NDJSON stream lazily and yield chunks of (line number, record).
+# Lines that are not JSON objects are yielded with the error in place of the
+# record, so they can be reported alongside validation errors.
+def read_ndjson_chunks(stream, chunk_size=CHUNK_SIZE):
+    chunk = []
+    for line_number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError('Expected a JSON object')
+        except ValueError as e:
+            record = ValidationError(str(e))
+        chunk.append((line_number, record))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+# Validate a chunk with a marshmallow schema. Fields the schema does not
+# load (such as IDs in exported rows) are ignored. Returns the loaded rows
+# as (line number, data) pairs and a list of per-line errors.
+def load_chunk(schema, chunk):
+    rows, errors = [], []
+    for line_number, record in chunk:
+        if isinstance(record, ValidationError):
+            errors.append({'line': line_number, 'error': record.messages})
+            continue
+        try:
+            rows.append((line_number, schema.load(record, unknown=EXCLUDE)))
+        except ValidationError as e:
+            errors.append({'line': line_number, 'error': e.messages})
+
+    return rows, errors
+
+# Encode one NDJSON line
+def ndjson_line(record):
+    return json.dumps(record) + '\n'
@@ -0,0 +1,206 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+import json
+import threading
+import time
+
+
+class CacheBackend(ABC):
+    """Storage behind a HotCache. 'get' returns None for a missing or
+    expired key. Values are JSON-compatible, so a backend may serialize
+    them, e.g. to keep them in an external cache shared by processes.
+    """
+
+    @abstractmethod
+    def get(self, key):
+        pass
+
+    @abstractmethod
+    def set(self, key, value, ttl=None):
+        pass
+
+    @abstractmethod
+    def delete(self, key):
+        pass
+
+
+class TTLCache(CacheBackend):
+    """A thread-safe, process-local LRU cache whose entries expire after
+    'ttl' seconds. Hits and misses are counted so the hit rate can be
+    reported.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+class LoopbackBackend(CacheBackend):
+    """Stand-in for an external cache such as Redis or Memcached, kept in
+    this process. Values are stored as JSON text, as they would be sent
+    over the network, so a payload that would not survive the trip fails
+    here too, and every call sleeps 'latency' seconds. Share one instance
+    between apps to give them a cache in common. Expired entries are only
+    dropped when read; use it for tests and benchmarks.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _round_trip(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def get(self, key):
+        self._round_trip()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] is not None and entry[1] < time.monotonic():
+                del self._entries[key]
+                entry = None
+        return None if entry is None else json.loads(entry[0])
+
+    def set(self, key, value, ttl=None):
+        data = json.dumps(value)
+        self._round_trip()
+        with self._lock:
+            self._entries[key] = (data, None if ttl is None else time.monotonic() + ttl)
+
+    def delete(self, key):
+        self._round_trip()
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class _Load:
+    """A load of one key in progress, which other readers of the key wait
+    for instead of running it again.
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.ok = False
+        self.value = None
+
+
+class HotCache:
+    """Read-through cache of serialized payloads on a CacheBackend.
+
+    Callers make the version of the data part of each key, so a write
+    makes the old entries unreachable, in every process, and they expire
+    on their own. Concurrent misses on the same key in this process are
+    coalesced: one caller loads, the others wait up to 'wait_timeout'
+    seconds for its result (stampede protection).
+    """
+
+    def __init__(self, backend, ttl=30, wait_timeout=5):
+        self.backend = backend
+        self.ttl = ttl
+        self.wait_timeout = wait_timeout
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._loads = {}
+        self._lock = threading.Lock()
+
+    def _count(self, result):
+        with self._lock:
+            setattr(self, result, getattr(self, result) + 1)
+
+    def get(self, key):
+        """The cached value of 'key', or None. Only hits are counted; a
+        caller that misses goes on to 'get_or_load'.
+        """
+        value = self.backend.get(key)
+        if value is not None:
+            self._count('hits')
+
+        return value
+
+    def get_or_load(self, key, loader):
+        """The cached value of 'key', or the result of 'loader()', which is
+        then cached. 'loader' must not return None.
+        """
+        value = self.backend.get(key)
+        if value is not None:
+            self._count('hits')
+            return value
+
+        with self._lock:
+            load = self._loads.get(key)
+            leader = load is None
+            if leader:
+                load = self._loads[key] = _Load()
+        if not leader:
+            # A failed or slow load is not waited for again; load it here
+            if load.done.wait(self.wait_timeout) and load.ok:
+                self._count('coalesced')
+                return load.value
+            self._count('misses')
+            return loader()
+
+        try:
+            load.value = loader()
+            load.ok = True
+            self.backend.set(key, load.value, self.ttl)
+        finally:
+            with self._lock:
+                del self._loads[key]
+            load.done.set()
+        self._count('misses')
+
+        return load.value
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'hit_rate': (self.hits + self.coalesced) / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,108 @@
+from flask import Blueprint, g, jsonify, request, Response, stream_with_context
+from . import db
+from .auth import login_required
+from datetime import timedelta
+import heapq
+import json
+from .models import Task
+from .pagination import PaginationError, parse_datetime_arg
+from .recurrence import expand_occurrences, MAX_RANGE_DAYS, RECURRENCE_STEPS
+
+
+# Columns needed to describe an occurrence
+OCCURRENCE_COLUMNS = (
+    Task.task_id, Task.title, Task.start_time, Task.end_time, Task.location,
+    Task.priority, Task.status, Task.recurrence
+)
+
+# Create a Blueprint for the calendar routes
+calendar_bp = Blueprint('calendar', __name__)
+
+def _occurrence(row, start, end):
+    return {
+        'task_id': row.task_id,
+        'title': row.title,
+        'start_time': start.isoformat(),
+        'end_time': end.isoformat(),
+        'location': row.location,
+        'priority': row.priority,
+        'status': row.status,
+        'recurrence': row.recurrence,
+    }
+
+# One-off tasks overlapping the window, streamed from the database in
+# (start_time, task_id) order
+def _single_occurrences(user_id, window_start, window_end):
+    rows = db.session.execute(
+        db.select(*OCCURRENCE_COLUMNS)
+        .where(
+            Task.user_id == user_id,
+            db.or_(
+                Task.recurrence.is_(None),
+                Task.recurrence.not_in(list(RECURRENCE_STEPS))
+            ),
+            Task.start_time < window_end,
+            db.or_(
+                Task.end_time > window_start,
+                db.and_(Task.end_time.is_(None), Task.start_time >= window_start)
+            )
+        )
+        .order_by(Task.start_time, Task.task_id)
+        .execution_options(yield_per=500)
+    )
+    for row in rows:
+        for start, end in expand_occurrences(
+            row.start_time, row.end_time, None, window_start, window_end
+        ):
+            yield start, row.task_id, _occurrence(row, start, end)
+
+def _recurring_occurrences(row, window_start, window_end):
+    for start, end in expand_occurrences(
+        row.start_time, row.end_time, row.recurrence, window_start, window_end
+    ):
+        yield start, row.task_id, _occurrence(row, start, end)
+
+# Route for streaming the logged-in user's occurrences in a time window
+# (Query parameters: from, to as ISO 8601 datetimes)
+@calendar_bp.route('/calendar', methods=['GET'])
+@login_required
+def get_calendar():
+    user = g.user
+
+    try:
+        window_start = parse_datetime_arg(request.args, 'from')
+        window_end = parse_datetime_arg(request.args, 'to')
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+    if window_start is None or window_end is None:
+        return jsonify({'error': "Both 'from' and 'to' are required"}), 400
+    if window_end <= window_start:
+        return jsonify({'error': "'to' must be after 'from'"}), 400
+    if window_end - window_start > timedelta(days=MAX_RANGE_DAYS):
+        return jsonify({'error': f'Range cannot exceed {MAX_RANGE_DAYS} days'}), 400
+
+    # Recurring series that start before the window ends; each one becomes
+    # a lazy generator, so only occurrences inside the window are built
+    recurring = db.session.execute(
+        db.select(*OCCURRENCE_COLUMNS).where(
+            Task.user_id == user.user_id,
+            Task.recurrence.in_(list(RECURRENCE_STEPS)),
+            Task.start_time < window_end
+        )
+    ).all()
+    user_id = user.user_id
+
+    def generate():
+        streams = [_single_occurrences(user_id, window_start, window_end)]
+        streams.extend(
+            _recurring_occurrences(row, window_start, window_end)
+            for row in recurring
+        )
+
+        yield '['
+        merged = heapq.merge(*streams, key=lambda item: (item[0], item[1]))
+        for index, (_, _, occurrence) in enumerate(merged):
+            yield (',' if index else '') + json.dumps(occurrence)
+        yield ']'
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
@@ -0,0 +1,64 @@
+from . import db
+from flask import jsonify, request
+import hashlib
+import pytz
+from werkzeug.http import http_date
+from .models import User
+
+
+# ETags are built from row versions (see 'app/sync.py'), so they can be
+# compared without serializing the resource
+def resource_etag(kind, resource_id, version):
+    return f'{kind}-{resource_id}-v{version}'
+
+# The user's 'sync_version', which any write to their tasks or reminders
+# bumps
+def user_sync_version(user_id):
+    return db.session.execute(
+        db.select(User.sync_version).where(User.user_id == user_id)
+    ).scalar_one()
+
+# ETag for a list of the user's rows; the query string selects the page
+def user_list_etag(kind, user_id, sync_version=None):
+    if sync_version is None:
+        sync_version = user_sync_version(user_id)
+    query = hashlib.sha1(request.query_string).hexdigest()[:12]
+
+    return f'{kind}-u{user_id}-v{sync_version}-{query}'
+
+# ETag for a value already in memory, such as a cached user record
+def value_etag(kind, value):
+    return f'{kind}-{hashlib.sha1(repr(value).encode()).hexdigest()[:16]}'
+
+def etag_headers(etag, last_modified=None):
+    headers = {'ETag': f'"{etag}"'}
+    if last_modified is not None:
+        headers['Last-Modified'] = http_date(last_modified.replace(tzinfo=pytz.utc))
+
+    return headers
+
+# A 304 response if the client's copy is current, otherwise None.
+# 'If-None-Match' wins over 'If-Modified-Since' when both are sent.
+def not_modified(etag, last_modified=None):
+    if request.if_none_match:
+        fresh = request.if_none_match.contains_weak(etag)
+    elif last_modified is not None and request.if_modified_since is not None:
+        # HTTP dates have whole-second precision
+        fresh = (
+            last_modified.replace(tzinfo=pytz.utc, microsecond=0)
+            <= request.if_modified_since
+        )
+    else:
+        fresh = False
+    if not fresh:
+        return None
+
+    return '', 304, etag_headers(etag, last_modified)
+
+# A 412 response if the client sent 'If-Match' for another version,
+# otherwise None
+def precondition_failed(etag):
+    if not request.if_match or request.if_match.contains(etag):
+        return None
+
+    return jsonify({'error': 'Resource has been modified'}), 412, etag_headers(etag)
@@ -0,0 +1,242 @@
+from . import db
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from flask import current_app
+import heapq
+from itertools import accumulate
+import pytz
+from .cache import TTLCache
+from .models import User, Task
+from .recurrence import expand_occurrences, is_recurring
+
+
+# How task writes treat overlaps (see TASK_CONFLICTS)
+CONFLICT_MODES = ('ignore', 'flag', 'reject')
+
+# Only tasks with a real time range can overlap; point-in-time tasks and
+# completed tasks never conflict
+def _conflict_candidates():
+    return db.and_(
+        Task.start_time.is_not(None),
+        Task.end_time.is_not(None),
+        Task.end_time > Task.start_time,
+        db.or_(Task.status.is_(None), Task.status != 'Completed')
+    )
+
+
+def _series_occurrences(row, window_start, window_end):
+    for start, end in expand_occurrences(
+        row.start_time, row.end_time, row.recurrence, window_start, window_end
+    ):
+        yield start, end, row
+
+
+class IntervalIndex:
+    """A user's tasks arranged for overlap queries.
+
+    One-off tasks, and the occurrences of recurring tasks between
+    'covered_from' and 'covered_until', are sorted by start alongside a
+    running maximum of their ends. Both lists are sorted, so the
+    occurrences that can overlap [start, end) form a slice found with two
+    bisections: those starting before 'end', from the first one where the
+    running maximum passes 'start'. Series are expanded once, when the
+    index is built; only a check reaching outside the covered span expands
+    them again.
+    """
+
+    def __init__(self, single, recurring, covered_from, covered_until):
+        # (start, task ID, end, row): sorts on start, then task ID
+        entries = [(row.start_time, row.task_id, row.end_time, row) for row in single]
+        for row in recurring:
+            entries.extend(
+                (start, row.task_id, end, row)
+                for start, end in expand_occurrences(
+                    row.start_time, row.end_time, row.recurrence, covered_from, covered_until
+                )
+            )
+        entries.sort()
+        self.entries = entries
+        self.starts = [entry[0] for entry in entries]
+        self.max_ends = list(accumulate((entry[2] for entry in entries), max))
+        self.recurring = recurring
+        self.covered_from = covered_from
+        self.covered_until = covered_until
+
+    def _covers(self, start, end):
+        return self.covered_from <= start and end <= self.covered_until
+
+    # Stored occurrences overlapping [start, end), in start order. Outside
+    # the covered span, only those of one-off tasks are complete.
+    def _stored(self, start, end, covered):
+        first = bisect_right(self.max_ends, start)
+        last = bisect_left(self.starts, end)
+        for occurrence_start, _, occurrence_end, row in self.entries[first:last]:
+            if occurrence_end > start and (covered or not is_recurring(row.recurrence)):
+                yield occurrence_start, occurrence_end, row
+
+    def overlapping(self, start, end, exclude_task_id=None):
+        """Tasks with an occurrence overlapping [start, end), as
+        (task row, occurrence start, occurrence end) tuples, with the first
+        such occurrence of each task.
+        """
+        covered = self._covers(start, end)
+        found = []
+        seen = {exclude_task_id}
+        for occurrence_start, occurrence_end, row in self._stored(start, end, covered):
+            if row.task_id not in seen:
+                seen.add(row.task_id)
+                found.append((row, occurrence_start, occurrence_end))
+        if covered:
+            return found
+
+        for row in self.recurring:
+            if row.task_id == exclude_task_id:
+                continue
+            for occurrence_start, occurrence_end in expand_occurrences(
+                row.start_time, row.end_time, row.recurrence, start, end
+            ):
+                found.append((row, occurrence_start, occurrence_end))
+                break
+
+        return found
+
+    def occurrences(self, window_start, window_end):
+        """Every occurrence overlapping the window, in start order."""
+        covered = self._covers(window_start, window_end)
+        streams = [self._stored(window_start, window_end, covered)]
+        if not covered:
+            streams.extend(
+                _series_occurrences(row, window_start, window_end)
+                for row in self.recurring
+            )
+
+        return heapq.merge(*streams, key=lambda item: (item[0], item[2].task_id))
+
+    def conflicts(self, window_start, window_end):
+        """All pairs of overlapping occurrences of different tasks in the
+        window, by sweeping occurrences in start order while keeping the
+        ones still running in a heap keyed on their end.
+        """
+        pairs = []
+        active = []  # (end, sequence, occurrence)
+        for sequence, (start, end, row) in enumerate(
+            self.occurrences(window_start, window_end)
+        ):
+            while active and active[0][0] <= start:
+                heapq.heappop(active)
+            for _, _, (other_start, other_end, other) in active:
+                if other.task_id != row.task_id:
+                    pairs.append(((other, other_start, other_end), (row, start, end)))
+            heapq.heappush(active, (end, sequence, (start, end, row)))
+
+        return pairs
+
+
+def _build_index(user_id):
+    rows = db.session.execute(
+        db.select(
+            Task.task_id, Task.title, Task.start_time, Task.end_time,
+            Task.recurrence
+        )
+        .where(Task.user_id == user_id, _conflict_candidates())
+    ).all()
+    single = [row for row in rows if not is_recurring(row.recurrence)]
+    recurring = [row for row in rows if is_recurring(row.recurrence)]
+    covered_from = datetime.utcnow()
+    covered_until = covered_from + timedelta(days=current_app.config['CONFLICT_INDEX_DAYS'])
+
+    return IntervalIndex(single, recurring, covered_from, covered_until)
+
+def get_interval_index(user_id):
+    """The user's interval index, rebuilt only when their data has changed.
+
+    Entries are tagged with the user's 'sync_version', which every task
+    write bumps, so a stale index is never used, even when the write
+    happened in another process.
+    """
+    version = db.session.execute(
+        db.select(User.sync_version).where(User.user_id == user_id)
+    ).scalar_one()
+    cache = current_app.extensions['conflict_index_cache']
+    entry = cache.get(user_id)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+
+    index = _build_index(user_id)
+    cache.set(user_id, (version, index))
+
+    return index
+
+# Accept a datetime or an ISO 8601 string (as sent in task payloads) and
+# return a naive UTC datetime
+def as_utc_datetime(value):
+    if value is None or isinstance(value, datetime):
+        parsed = value
+    else:
+        parsed = datetime.fromisoformat(value)
+    if parsed is not None and parsed.tzinfo is not None:
+        parsed = parsed.astimezone(pytz.utc).replace(tzinfo=None)
+
+    return parsed
+
+# Task fields holding datetimes
+TASK_TIME_FIELDS = ('start_time', 'end_time', 'reminder_time')
+
+# Loaded task fields with their datetimes as naive UTC, ready to insert
+def with_utc_task_times(data):
+    return {
+        key: as_utc_datetime(value) if key in TASK_TIME_FIELDS else value
+        for key, value in data.items()
+    }
+
+def find_conflicts(user_id, start, end, recurrence=None, exclude_task_id=None):
+    """Existing tasks overlapping a task with the given times. A recurring
+    task is checked over CONFLICT_HORIZON_DAYS of occurrences.
+    """
+    start, end = as_utc_datetime(start), as_utc_datetime(end)
+    if start is None or end is None or end <= start:
+        return []
+
+    index = get_interval_index(user_id)
+    if is_recurring(recurrence):
+        horizon = start + timedelta(days=current_app.config['CONFLICT_HORIZON_DAYS'])
+        windows = expand_occurrences(start, end, recurrence, start, horizon)
+    else:
+        windows = [(start, end)]
+
+    found = {}
+    for window_start, window_end in windows:
+        for row, occurrence_start, occurrence_end in index.overlapping(
+            window_start, window_end, exclude_task_id
+        ):
+            if row.task_id not in found:
+                found[row.task_id] = occurrence_dict(
+                    row, occurrence_start, occurrence_end
+                )
+
+    return sorted(found.values(), key=lambda item: item['start_time'])
+
+def occurrence_dict(row, start, end):
+    return {
+        'task_id': row.task_id,
+        'title': row.title,
+        'start_time': start.isoformat(),
+        'end_time': end.isoformat(),
+    }
+
+
+def init_app(app):
+    # How to treat overlaps on task writes: 'ignore', 'flag' (list them in
+    # the response) or 'reject' (409). Requests may pass '?conflicts='.
+    app.config.setdefault('TASK_CONFLICTS', 'ignore')
+    app.config.setdefault('CONFLICT_HORIZON_DAYS', 90)
+    # Days ahead whose recurring occurrences the index stores; enough for a
+    # recurring task starting within the horizon to be checked over its own
+    app.config.setdefault('CONFLICT_INDEX_DAYS', 2 * app.config['CONFLICT_HORIZON_DAYS'])
+    app.config.setdefault('CONFLICT_CACHE_SIZE', 1000)
+    app.config.setdefault('CONFLICT_CACHE_TTL', 300)
+
+    app.extensions['conflict_index_cache'] = TTLCache(
+        maxsize=app.config['CONFLICT_CACHE_SIZE'],
+        ttl=app.config['CONFLICT_CACHE_TTL']
+    )
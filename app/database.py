@@ -0,0 +1,141 @@
+from flask import g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+import time
+
+
+REPLICA_BIND = 'replica'
+
+# GET requests to these blueprints read from the replica when one is set
+REPLICA_BLUEPRINTS = ('tasks', 'reminders', 'users', 'stats')
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that reports how long each checkout waited for a free
+    connection to 'observe_wait(seconds)'.
+    """
+
+    observe_wait = None
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            if self.observe_wait is not None:
+                self.observe_wait(time.perf_counter() - started)
+
+    # 'dispose' swaps in a fresh pool; keep reporting from it
+    def recreate(self):
+        pool = super().recreate()
+        pool.observe_wait = self.observe_wait
+
+        return pool
+
+
+class RoutingSession(Session):
+    """Session that sends SELECTs to the read replica during requests
+    routed there (see '_route_reads'), and everything else to the primary.
+    Flushes always go to the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (
+            bind is None
+            and not self._flushing
+            and getattr(clause, 'is_select', False)
+            and has_request_context()
+            and g.get('read_from_replica')
+        ):
+            replica = self._db.engines.get(REPLICA_BIND)
+            if replica is not None:
+                return replica
+
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _is_sqlite_memory(url):
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+# Engine options for one database URL from the DB_* settings
+def engine_options(config, uri):
+    url = make_url(uri)
+    options = {
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+    }
+    # In-memory SQLite lives in a single shared connection; there is no
+    # pool to size
+    if not _is_sqlite_memory(url):
+        options['poolclass'] = TimedQueuePool
+        for option, setting in (
+            ('pool_size', 'DB_POOL_SIZE'),
+            ('max_overflow', 'DB_MAX_OVERFLOW'),
+            ('pool_timeout', 'DB_POOL_TIMEOUT'),
+        ):
+            if config[setting] is not None:
+                options[option] = config[setting]
+
+    # Abort statements running longer than DB_STATEMENT_TIMEOUT_MS, on
+    # every new connection. SQLite has no equivalent.
+    timeout = config['DB_STATEMENT_TIMEOUT_MS']
+    backend = url.get_backend_name()
+    if timeout and backend in ('mysql', 'mariadb'):
+        options['connect_args'] = {
+            'init_command': f'SET SESSION max_execution_time={int(timeout)}'
+        }
+    elif timeout and backend == 'postgresql':
+        options['connect_args'] = {'options': f'-c statement_timeout={int(timeout)}'}
+
+    return options
+
+def configure_engines(app):
+    """Translate the DB_* settings into engine options. Runs before
+    'db.init_app', which creates the engines; explicit
+    SQLALCHEMY_ENGINE_OPTIONS entries take precedence.
+    """
+    config = app.config
+    config.setdefault('DB_POOL_SIZE', None)  # None keeps SQLAlchemy's default
+    config.setdefault('DB_MAX_OVERFLOW', None)
+    config.setdefault('DB_POOL_TIMEOUT', None)
+    # Recycle connections before MySQL's wait_timeout drops them, and test
+    # each one on checkout in case it was dropped anyway
+    config.setdefault('DB_POOL_RECYCLE', 3600)
+    config.setdefault('DB_POOL_PRE_PING', True)
+    config.setdefault('DB_STATEMENT_TIMEOUT_MS', None)
+    config.setdefault('SQLALCHEMY_DATABASE_REPLICA_URI', None)
+
+    primary = config.get('SQLALCHEMY_DATABASE_URI')
+    if primary:
+        explicit = config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+        for option, value in engine_options(config, primary).items():
+            explicit.setdefault(option, value)
+
+    replica = config['SQLALCHEMY_DATABASE_REPLICA_URI']
+    if replica:
+        binds = dict(config.get('SQLALCHEMY_BINDS') or {})
+        binds.setdefault(REPLICA_BIND, dict(engine_options(config, replica), url=replica))
+        config['SQLALCHEMY_BINDS'] = binds
+
+
+# Mark reads of GET requests to the API blueprints for the replica
+def _route_reads():
+    g.read_from_replica = (
+        request.method in ('GET', 'HEAD') and request.blueprint in REPLICA_BLUEPRINTS
+    )
+
+def init_app(app, db):
+    from .metrics import DB_POOL_WAIT
+
+    with app.app_context():
+        engines = dict(db.engines)
+    for key, engine in engines.items():
+        if isinstance(engine.pool, TimedQueuePool):
+            name = key or 'primary'
+            engine.pool.observe_wait = (
+                lambda seconds, name=name: DB_POOL_WAIT.observe(seconds, bind=name)
+            )
+
+    if REPLICA_BIND in engines:
+        app.before_request(_route_reads)
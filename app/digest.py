@@ -0,0 +1,210 @@
+from . import db
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, time, timedelta
+from itertools import groupby
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy.exc import IntegrityError
+from .models import User, Task, Notification, DigestDelivery
+from .recurrence import RECURRENCE_STEPS, expand_occurrences
+
+
+DIGEST_TEMPLATE = 'email/digest.txt'
+
+# Users who get digests by email. SMS and push have no digest channel, and
+# a user who never chose a preference gets email, like every other message.
+def _wants_email():
+    return db.or_(
+        User.notification_preference.is_(None),
+        User.notification_preference == 'Email'
+    )
+
+# Every task on 'day' for users in [first_id, last_id] still owed a digest,
+# as one query ordered by user. Recurring tasks are fetched whole and
+# expanded in Python.
+def _digest_rows_query(day_start, day_end, digest_date, first_id, last_id):
+    delivered = (
+        db.select(DigestDelivery.delivery_id)
+        .where(
+            DigestDelivery.user_id == User.user_id,
+            DigestDelivery.digest_date == digest_date
+        )
+        .exists()
+    )
+
+    return (
+        db.select(
+            User.user_id, User.username, User.email,
+            Task.title, Task.start_time, Task.end_time, Task.location,
+            Task.priority, Task.recurrence
+        )
+        .join(Task, Task.user_id == User.user_id)
+        .where(
+            User.user_id.between(first_id, last_id),
+            User.deleted_at.is_(None),
+            _wants_email(),
+            ~delivered,
+            db.or_(Task.status.is_(None), Task.status != 'Completed'),
+            db.or_(
+                db.and_(Task.start_time >= day_start, Task.start_time < day_end),
+                db.and_(
+                    Task.recurrence.in_(list(RECURRENCE_STEPS)),
+                    Task.start_time < day_end
+                )
+            )
+        )
+        .order_by(User.user_id)
+    )
+
+# The day's schedule for one user, in chronological order
+def _schedule_items(rows, day_start, day_end):
+    items = []
+    for row in rows:
+        for start, end in expand_occurrences(
+            row.start_time, row.end_time, row.recurrence, day_start, day_end
+        ):
+            items.append({
+                'title': row.title,
+                'start': start,
+                'end': end,
+                'location': row.location,
+                'priority': row.priority,
+            })
+    items.sort(key=lambda item: item['start'])
+
+    return items
+
+def _send_window(template, digest_date, first_id, last_id):
+    day_start = datetime.combine(digest_date, time.min)
+    day_end = day_start + timedelta(days=1)
+    subject = f"Your DayMinder schedule for {digest_date.strftime('%A, %d %B')}"
+    now = datetime.utcnow()
+
+    rows = db.session.execute(
+        _digest_rows_query(day_start, day_end, digest_date, first_id, last_id)
+    ).all()
+
+    notifications, deliveries = [], []
+    for user_id, user_rows in groupby(rows, key=lambda row: row.user_id):
+        user_rows = list(user_rows)
+        items = _schedule_items(user_rows, day_start, day_end)
+        if not items:
+            continue  # Only recurring tasks, none of them on this day
+        notifications.append({
+            'user_id': user_id,
+            'recipient': user_rows[0].email,
+            'subject': subject,
+            'body': template.render(
+                username=user_rows[0].username, day=digest_date, items=items
+            ),
+            'status': 'Pending',
+            'attempts': 0,
+            'next_attempt_at': now,
+            'created_at': now,
+        })
+        deliveries.append({
+            'user_id': user_id, 'digest_date': digest_date, 'created_at': now
+        })
+
+    # The delivery markers commit with the queued emails, so a rerun skips
+    # exactly the users whose digest is already on the outbox
+    if deliveries:
+        db.session.execute(db.insert(DigestDelivery), deliveries)
+        db.session.execute(db.insert(Notification), notifications)
+    db.session.commit()
+
+    return len(deliveries)
+
+def send_digest_range(digest_date, first_id, last_id):
+    """Queue the digests for users in [first_id, last_id], one window of
+    DIGEST_BATCH_SIZE user IDs per query and transaction. Returns the number
+    of digests queued.
+    """
+    template = current_app.jinja_env.get_template(DIGEST_TEMPLATE)
+    window = current_app.config['DIGEST_BATCH_SIZE']
+
+    queued = 0
+    for window_start in range(first_id, last_id + 1, window):
+        window_end = min(window_start + window - 1, last_id)
+        try:
+            queued += _send_window(template, digest_date, window_start, window_end)
+        except IntegrityError:
+            # Another run queued some of these users first; the retry
+            # skips them
+            db.session.rollback()
+            queued += _send_window(template, digest_date, window_start, window_end)
+        except Exception:
+            db.session.rollback()
+            raise
+
+    return queued
+
+
+# Each worker process builds its own app, and with it its own engine
+_worker_app = None
+
+def _init_worker(test_config):
+    global _worker_app
+    from . import create_app
+    _worker_app = create_app(test_config, profile='worker')
+
+def _send_shard(digest_date, first_id, last_id):
+    with _worker_app.app_context():
+        return send_digest_range(digest_date, first_id, last_id)
+
+def _shard_bounds(first_id, last_id, shards):
+    size = max(-(-(last_id - first_id + 1) // shards), 1)
+
+    return [
+        (start, min(start + size - 1, last_id))
+        for start in range(first_id, last_id + 1, size)
+    ]
+
+def run_digests(digest_date, processes=None, shards=None, test_config=None):
+    """Queue every user's digest for 'digest_date'. User IDs are split into
+    ranges that run on a pool of 'processes' worker processes; with a single
+    process everything runs in this one. Safe to rerun after a crash.
+    """
+    processes = processes or current_app.config['DIGEST_PROCESSES']
+    shards = shards or processes * 4  # Smaller shards even out the load
+
+    first_id, last_id = db.session.execute(
+        db.select(db.func.min(User.user_id), db.func.max(User.user_id))
+    ).one()
+    db.session.commit()
+    if first_id is None:
+        return 0
+
+    bounds = _shard_bounds(first_id, last_id, shards)
+    if processes == 1:
+        return sum(send_digest_range(digest_date, *b) for b in bounds)
+
+    with ProcessPoolExecutor(
+        max_workers=processes, initializer=_init_worker, initargs=(test_config,)
+    ) as pool:
+        futures = [pool.submit(_send_shard, digest_date, *b) for b in bounds]
+        return sum(future.result() for future in futures)
+
+
+@click.command('send-digests')
+@click.option('--date', 'digest_date', type=click.DateTime(formats=['%Y-%m-%d']),
+              default=None, help='Day to send the schedule for (default: tomorrow, UTC).')
+@click.option('--processes', type=int, default=None, help='Worker processes.')
+@click.option('--shards', type=int, default=None, help='User-ID ranges to split the work into.')
+@with_appcontext
+def send_digests_command(digest_date, processes, shards):
+    """Queue each user's daily schedule email."""
+    digest_date = (
+        digest_date.date() if digest_date
+        else datetime.utcnow().date() + timedelta(days=1)
+    )
+    queued = run_digests(digest_date, processes=processes, shards=shards)
+    click.echo(f'Queued {queued} digests for {digest_date.isoformat()}')
+
+
+def init_app(app):
+    app.config.setdefault('DIGEST_PROCESSES', 4)
+    app.config.setdefault('DIGEST_BATCH_SIZE', 1000)
+
+    app.cli.add_command(send_digests_command)
@@ -0,0 +1,176 @@
+from . import db
+from datetime import datetime
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+import time
+from .metrics import start_metrics_server
+from .models import User, Task, Reminder
+from .notifications import enqueue_email
+from .push import publish_reminder
+from .sync import touch_rows
+
+
+# Dialects that understand 'SELECT ... FOR UPDATE SKIP LOCKED'
+SKIP_LOCKED_DIALECTS = ('mysql', 'mariadb', 'postgresql')
+
+# Due reminders, skipping users whose accounts are scheduled for deletion
+def _due_reminders_query(now, limit):
+    return (
+        db.select(Reminder.reminder_id)
+        .join(User, Reminder.user_id == User.user_id)
+        .where(
+            Reminder.sent == db.false(),
+            Reminder.reminder_time <= now,
+            User.deleted_at.is_(None)
+        )
+        .order_by(Reminder.reminder_time)
+        .limit(limit)
+    )
+
+# Lock a batch of due reminders. Rows already locked by another dispatcher
+# are skipped, so concurrent dispatchers always work on disjoint batches.
+def _claim_skip_locked(now, limit):
+    reminder_ids = db.session.execute(
+        _due_reminders_query(now, limit).with_for_update(
+            skip_locked=True, of=Reminder
+        )
+    ).scalars().all()
+    if reminder_ids:
+        db.session.execute(
+            db.update(Reminder)
+            .where(Reminder.reminder_id.in_(reminder_ids))
+            .values(sent=True, sent_time=now)
+        )
+
+    return reminder_ids
+
+# SQLite has no row locks; flip 'sent' with a compare-and-set UPDATE per row
+# and keep only the rows this dispatcher won.
+def _claim_compare_and_set(now, limit):
+    candidates = db.session.execute(
+        _due_reminders_query(now, limit)
+    ).scalars().all()
+
+    reminder_ids = []
+    for reminder_id in candidates:
+        result = db.session.execute(
+            db.update(Reminder)
+            .where(
+                Reminder.reminder_id == reminder_id,
+                Reminder.sent == db.false()
+            )
+            .values(sent=True, sent_time=now)
+        )
+        if result.rowcount == 1:
+            reminder_ids.append(reminder_id)
+
+    return reminder_ids
+
+def claim_due_reminders(limit, now=None):
+    now = now or datetime.utcnow()
+    if db.session.get_bind().dialect.name in SKIP_LOCKED_DIALECTS:
+        return _claim_skip_locked(now, limit)
+
+    return _claim_compare_and_set(now, limit)
+
+def _enqueue_reminder_email(user, reminder_id, reminder_time, title):
+    email_subject = f"Reminder: {title}"
+    email_body = f"Dear {user.username},\n\nThis is your reminder for '{title}', set for {reminder_time}."
+    enqueue_email(user, email_subject, email_body, reminder_id=reminder_id)
+
+# Mark one batch of due reminders as sent and queue their notifications in
+# the same transaction. Returns the number of reminders dispatched.
+def dispatch_due_reminders(limit, now=None):
+    try:
+        reminder_ids = claim_due_reminders(limit, now)
+        if not reminder_ids:
+            db.session.commit()
+            return 0
+
+        # Clients syncing changes should see the reminders flip to sent
+        touch_rows(Reminder, Reminder.reminder_id, reminder_ids)
+
+        rows = db.session.execute(
+            db.select(Reminder.reminder_id, Reminder.reminder_time, Task.title, User)
+            .join(Task, Reminder.task_id == Task.task_id)
+            .join(User, Task.user_id == User.user_id)
+            .where(Reminder.reminder_id.in_(reminder_ids))
+        ).all()
+
+        pushes = []
+        for reminder_id, reminder_time, title, user in rows:
+            if user.notification_preference == 'Push notifications':
+                pushes.append((user, reminder_id, reminder_time, title))
+                continue
+            _enqueue_reminder_email(user, reminder_id, reminder_time, title)
+
+        db.session.commit()
+
+        # Pushes go out only once the reminders are committed as sent. A
+        # push that reaches no open connection is emailed instead; with a
+        # LocalBroker that is every push unless this dispatcher runs in the
+        # process serving the user's connection.
+        unreached = [
+            (user, reminder_id, reminder_time, title)
+            for user, reminder_id, reminder_time, title in pushes
+            if not publish_reminder(user.user_id, reminder_id, reminder_time, title)
+        ]
+        if unreached:
+            for push in unreached:
+                _enqueue_reminder_email(*push)
+            db.session.commit()
+
+        return len(reminder_ids)
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+class ReminderDispatcher:
+    """Polls for due reminders and hands them to the notification outbox."""
+
+    def __init__(self, app, batch_size=None, poll_interval=None):
+        self.app = app
+        self.batch_size = batch_size or app.config['DISPATCHER_BATCH_SIZE']
+        self.poll_interval = (
+            poll_interval or app.config['DISPATCHER_POLL_INTERVAL']
+        )
+
+    def run_once(self):
+        with self.app.app_context():
+            return dispatch_due_reminders(self.batch_size)
+
+    def run(self, once=False):
+        while True:
+            try:
+                dispatched = self.run_once()
+            except Exception:
+                self.app.logger.exception('Reminder dispatch failed')
+                dispatched = 0
+            if once:
+                return
+            # Keep draining while there is a backlog
+            if dispatched < self.batch_size:
+                time.sleep(self.poll_interval)
+
+
+@click.command('dispatch-reminders')
+@click.option('--batch-size', type=int, default=None, help='Reminders per claim.')
+@click.option('--metrics-port', type=int, default=None, help='Serve /metrics on this port.')
+@click.option('--once', is_flag=True, help='Dispatch one batch and exit.')
+@with_appcontext
+def dispatch_reminders_command(batch_size, metrics_port, once):
+    """Fire reminders whose time has passed."""
+    dispatcher = ReminderDispatcher(
+        current_app._get_current_object(), batch_size=batch_size
+    )
+    start_metrics_server(current_app._get_current_object(), metrics_port)
+    dispatcher.run(once=once)
+
+
+def init_app(app):
+    app.config.setdefault('DISPATCHER_BATCH_SIZE', 500)
+    app.config.setdefault('DISPATCHER_POLL_INTERVAL', 5)
+
+    app.cli.add_command(dispatch_reminders_command)
@@ -0,0 +1,59 @@
+from flask import current_app
+from .cache import HotCache, TTLCache
+from .conditional import user_sync_version
+
+
+def get_hot_cache():
+    return current_app.extensions.get('hot_cache')
+
+# Keys include the user's 'sync_version', which every write to their tasks
+# or reminders bumps in the same transaction, whichever process it runs in,
+# so an entry is never served after its data changed
+def _cache_key(user_id, sync_version, key):
+    if sync_version is None:
+        sync_version = user_sync_version(user_id)
+
+    return f'user:{user_id}:v{sync_version}:{key}'
+
+# A serialized payload of the user's from the hot cache, or None on a miss
+# or with the cache disabled. Pass 'sync_version' if already read.
+def cached_entry(user_id, key, sync_version=None):
+    cache = get_hot_cache()
+    if cache is None:
+        return None
+
+    return cache.get(_cache_key(user_id, sync_version, key))
+
+# A serialized payload of the user's from the hot cache, or 'loader()' on a
+# miss. Pass 'sync_version' if already read. Loaders may abort, e.g. with a
+# 404; nothing is cached then.
+def cached_payload(user_id, key, loader, sync_version=None):
+    cache = get_hot_cache()
+    if cache is None:
+        return loader()
+
+    return cache.get_or_load(_cache_key(user_id, sync_version, key), loader)
+
+
+def init_app(app):
+    app.config.setdefault('HOT_CACHE_ENABLED', True)
+    # A CacheBackend instance, e.g. one shared by all processes; None keeps
+    # entries in this process
+    app.config.setdefault('HOT_CACHE_BACKEND', None)
+    app.config.setdefault('HOT_CACHE_SIZE', 10000)
+    app.config.setdefault('HOT_CACHE_TTL', 30)
+    # Seconds a reader waits for another's load of the same key
+    app.config.setdefault('HOT_CACHE_WAIT_TIMEOUT', 5)
+
+    cache = None
+    if app.config['HOT_CACHE_ENABLED']:
+        backend = app.config['HOT_CACHE_BACKEND'] or TTLCache(
+            maxsize=app.config['HOT_CACHE_SIZE'],
+            ttl=app.config['HOT_CACHE_TTL']
+        )
+        cache = HotCache(
+            backend,
+            ttl=app.config['HOT_CACHE_TTL'],
+            wait_timeout=app.config['HOT_CACHE_WAIT_TIMEOUT']
+        )
+    app.extensions['hot_cache'] = cache
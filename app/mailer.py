@@ -0,0 +1,175 @@
+from . import mail
+from contextlib import contextmanager
+from flask import current_app
+from .metrics import observe_mail
+import queue
+import threading
+import time
+
+
+class FlaskMailTransport:
+    """Opens real SMTP connections through Flask-Mail's 'mail.connect()'."""
+
+    def open(self):
+        connection = mail.connect()
+        connection.__enter__()
+
+        return connection
+
+    def send(self, connection, message):
+        connection.send(message)
+
+    def close(self, connection):
+        try:
+            connection.__exit__(None, None, None)
+        except Exception:
+            pass  # The server may already have dropped the connection
+
+
+class LocalTransport:
+    """In-process SMTP stand-in that keeps messages in memory.
+
+    'connect_latency' and 'send_latency' (seconds) simulate the TLS handshake
+    and per-message round-trip of a real server.
+    """
+
+    def __init__(self, connect_latency=0.0, send_latency=0.0):
+        self.connect_latency = connect_latency
+        self.send_latency = send_latency
+        self.outbox = []
+        self.connections_opened = 0
+        self._lock = threading.Lock()
+
+    def open(self):
+        time.sleep(self.connect_latency)
+        with self._lock:
+            self.connections_opened += 1
+
+        return object()
+
+    def send(self, connection, message):
+        time.sleep(self.send_latency)
+        with self._lock:
+            self.outbox.append(message)
+
+    def close(self, connection):
+        pass
+
+
+class ConnectionPool:
+    """A bounded pool of persistent transport connections."""
+
+    def __init__(self, transport, size):
+        self.transport = transport
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def discard(self, connection):
+        if connection is not None:
+            self.transport.close(connection)
+
+    # Borrow a connection as a one-item list, so the borrower can swap in a
+    # new connection after a failure. Idle connections are reused LIFO.
+    @contextmanager
+    def connection(self):
+        self._slots.acquire()
+        holder = [None]
+        try:
+            try:
+                holder[0] = self._idle.get_nowait()
+            except queue.Empty:
+                holder[0] = self.transport.open()
+            yield holder
+        except BaseException:
+            self.discard(holder[0])
+            holder[0] = None
+            raise
+        finally:
+            if holder[0] is not None:
+                self._idle.put(holder[0])
+            self._slots.release()
+
+    def close(self):
+        while True:
+            try:
+                self.discard(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+
+class DeliveryEngine:
+    """Sends messages in batches over pooled connections.
+
+    A message that fails is retried once on a fresh connection before it is
+    reported as failed.
+    """
+
+    def __init__(self, transport, pool_size=4, batch_size=50):
+        self.transport = transport
+        self.batch_size = batch_size
+        self.pool = ConnectionPool(transport, pool_size)
+
+    # Send over the borrowed connection, reconnecting and retrying once if
+    # the connection has gone stale
+    def _send_one(self, holder, message):
+        started = time.perf_counter()
+        for _ in range(2):
+            try:
+                if holder[0] is None:
+                    holder[0] = self.transport.open()
+                self.transport.send(holder[0], message)
+                observe_mail(time.perf_counter() - started, failed=False)
+                return None
+            except Exception as e:
+                error = str(e) or e.__class__.__name__
+                self.pool.discard(holder[0])
+                holder[0] = None
+
+        observe_mail(time.perf_counter() - started, failed=True)
+        return error
+
+    # Send one batch over a single pooled connection. Returns a list of
+    # errors aligned with 'messages' (None for each message that was sent).
+    def send_batch(self, messages):
+        errors = []
+        started = time.perf_counter()
+        try:
+            with self.pool.connection() as holder:
+                for message in messages:
+                    errors.append(self._send_one(holder, message))
+        except Exception as e:
+            # Could not even open a connection for this batch
+            unsent = len(messages) - len(errors)
+            errors.extend([str(e)] * unsent)
+            for _ in range(unsent):
+                observe_mail(time.perf_counter() - started, failed=True)
+
+        return errors
+
+    def send(self, messages):
+        errors = []
+        for start in range(0, len(messages), self.batch_size):
+            errors.extend(self.send_batch(messages[start:start + self.batch_size]))
+
+        return errors
+
+    def close(self):
+        self.pool.close()
+
+
+def get_delivery_engine():
+    return current_app.extensions['delivery_engine']
+
+def init_app(app):
+    app.config.setdefault('MAIL_TRANSPORT', None)
+    app.config.setdefault('MAIL_POOL_SIZE', 4)
+    app.config.setdefault('MAIL_BATCH_SIZE', 50)
+
+    # Any object with open/send/close may be configured as the transport
+    transport = app.config['MAIL_TRANSPORT'] or FlaskMailTransport()
+    app.extensions['delivery_engine'] = DeliveryEngine(
+        transport,
+        pool_size=app.config['MAIL_POOL_SIZE'],
+        batch_size=app.config['MAIL_BATCH_SIZE']
+    )
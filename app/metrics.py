@@ -0,0 +1,392 @@
+from . import db
+from bisect import bisect_left
+from collections import defaultdict, Counter as _Counts
+from flask import Blueprint, current_app, g, has_app_context, has_request_context, request, Response
+import os
+from sqlalchemy import event
+import sys
+import threading
+import time
+
+
+# Latency buckets in seconds, as used by Prometheus client libraries
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0
+)
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+        for k, v in labels
+    )
+    return '{' + pairs + '}'
+
+
+class Counter:
+    """A monotonically increasing value per label set."""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        with self._lock:
+            self._values[tuple(sorted(labels.items()))] += amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, labels, value) for labels, value in self._values.items()]
+
+
+class CallbackMetric(Counter):
+    """A metric whose samples are read from a callback at scrape time."""
+
+    def __init__(self, name, documentation, callback, kind='gauge'):
+        super().__init__(name, documentation)
+        self.callback = callback
+        self.kind = kind
+
+    def samples(self):
+        return [
+            (self.name, tuple(sorted(labels.items())), value)
+            for labels, value in self.callback()
+        ]
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count per label set."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            index = bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for labels, (counts, total, count) in self._series.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    samples.append((
+                        f'{self.name}_bucket', labels + (('le', repr(bound)),), cumulative
+                    ))
+                samples.append((f'{self.name}_bucket', labels + (('le', '+Inf'),), count))
+                samples.append((f'{self.name}_sum', labels, total))
+                samples.append((f'{self.name}_count', labels, count))
+
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    # Prometheus text exposition format
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{_format_labels(labels)} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+REQUEST_LATENCY = registry.register(Histogram(
+    'dayminder_request_duration_seconds', 'Request latency by endpoint.'
+))
+REQUEST_COUNT = registry.register(Counter(
+    'dayminder_requests_total', 'Requests by endpoint, method and status.'
+))
+REQUEST_QUERIES = registry.register(Histogram(
+    'dayminder_request_sql_statements', 'SQL statements executed per request.',
+    buckets=(1, 2, 3, 5, 10, 20, 50, 100, 250)
+))
+REQUEST_DB_TIME = registry.register(Histogram(
+    'dayminder_request_db_seconds', 'Time spent in SQL per request.'
+))
+DB_POOL_WAIT = registry.register(Histogram(
+    'dayminder_db_pool_wait_seconds', 'Time spent waiting for a pooled database connection.',
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+))
+MAIL_LATENCY = registry.register(Histogram(
+    'dayminder_mail_send_seconds', 'Time to send one email.'
+))
+MAIL_FAILURES = registry.register(Counter(
+    'dayminder_mail_failures_total', 'Emails that could not be sent.'
+))
+
+# Record the duration of one email delivery attempt
+def observe_mail(seconds, failed):
+    MAIL_LATENCY.observe(seconds)
+    if failed:
+        MAIL_FAILURES.inc()
+
+
+class SlowRequestProfiler:
+    """Samples the stacks of in-flight requests from a background thread.
+
+    Only requests slower than the threshold are written out, as
+    'folded' stacks (one 'frame;frame;frame count' line per stack) that
+    flamegraph.pl or speedscope can render.
+    """
+
+    def __init__(self, threshold, interval, output_dir):
+        self.threshold = threshold
+        self.interval = interval
+        self.output_dir = output_dir
+        self._active = {}  # Thread ID -> Counter of folded stacks
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(
+            target=self._sample_forever, name='slow-request-profiler', daemon=True
+        )
+        self._thread.start()
+
+    def start(self):
+        with self._lock:
+            self._active[threading.get_ident()] = _Counts()
+
+    def stop(self, name, duration):
+        with self._lock:
+            stacks = self._active.pop(threading.get_ident(), None)
+        if not stacks or duration < self.threshold:
+            return None
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(
+            self.output_dir,
+            f"{time.strftime('%Y%m%dT%H%M%S')}-{name.replace('/', '_')}-{int(duration * 1000)}ms.folded"
+        )
+        with open(path, 'w') as f:
+            for stack, count in stacks.most_common():
+                f.write(f'{stack} {count}\n')
+
+        return path
+
+    def _sample_forever(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._active:
+                    continue
+                frames = sys._current_frames()
+                for thread_id, stacks in self._active.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        stacks[self._fold(frame)] += 1
+
+    @staticmethod
+    def _fold(frame):
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+            frame = frame.f_back
+
+        return ';'.join(reversed(names))
+
+
+# Count statements and DB time against the current request. The start time
+# lives on the statement's execution context, which is dropped with it, so
+# a statement that raises leaves nothing behind on the pooled connection.
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context.metrics_started = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, 'metrics_started', None)
+    if started is None:
+        return
+    if has_request_context() and 'metrics_queries' in g:
+        g.metrics_queries += 1
+        g.metrics_db_time += time.perf_counter() - started
+
+def _endpoint_name():
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+def _start_request():
+    g.metrics_started = time.perf_counter()
+    g.metrics_queries = 0
+    g.metrics_db_time = 0.0
+    profiler = current_app.extensions.get('slow_request_profiler')
+    if profiler is not None:
+        profiler.start()
+
+def _finish_request(response):
+    if 'metrics_started' not in g:
+        return response
+    duration = time.perf_counter() - g.metrics_started
+    endpoint = _endpoint_name()
+
+    REQUEST_LATENCY.observe(duration, endpoint=endpoint, method=request.method)
+    REQUEST_COUNT.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    REQUEST_QUERIES.observe(g.metrics_queries, endpoint=endpoint)
+    REQUEST_DB_TIME.observe(g.metrics_db_time, endpoint=endpoint)
+
+    profiler = current_app.extensions.get('slow_request_profiler')
+    if profiler is not None:
+        path = profiler.stop(f'{request.method}{endpoint}', duration)
+        if path:
+            current_app.logger.warning(
+                'Slow request %s %s took %.3fs; stacks written to %s',
+                request.method, request.path, duration, path
+            )
+
+    return response
+
+def _cache_lookups():
+    if not has_app_context():
+        return []
+    samples = []
+    user_cache = current_app.extensions.get('user_cache')
+    if user_cache is not None:
+        stats = user_cache.stats()
+        samples += [
+            ({'cache': 'user', 'result': 'hit'}, stats['hits']),
+            ({'cache': 'user', 'result': 'miss'}, stats['misses']),
+        ]
+    hot_cache = current_app.extensions.get('hot_cache')
+    if hot_cache is not None:
+        stats = hot_cache.stats()
+        samples += [
+            ({'cache': 'hot', 'result': 'hit'}, stats['hits']),
+            ({'cache': 'hot', 'result': 'miss'}, stats['misses']),
+            # Misses served by another request's load of the same key
+            ({'cache': 'hot', 'result': 'coalesced'}, stats['coalesced']),
+        ]
+
+    return samples
+
+def _pool_connections():
+    if not has_app_context():
+        return []
+    samples = []
+    for key, engine in db.engines.items():
+        pool = engine.pool
+        if not hasattr(pool, 'checkedout'):
+            continue  # Not a queue pool
+        bind = key or 'primary'
+        samples.append(({'bind': bind, 'state': 'checked_out'}, pool.checkedout()))
+        samples.append(({'bind': bind, 'state': 'idle'}, pool.checkedin()))
+        samples.append(({'bind': bind, 'state': 'overflow'}, max(pool.overflow(), 0)))
+
+    return samples
+
+registry.register(CallbackMetric(
+    'dayminder_db_pool_connections', 'Pooled database connections by bind and state.',
+    _pool_connections
+))
+
+registry.register(CallbackMetric(
+    'dayminder_cache_lookups_total', 'Cache lookups by cache and result.',
+    _cache_lookups, kind='counter'
+))
+
+# Create a Blueprint for the metrics route
+metrics_bp = Blueprint('metrics', __name__)
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+# Worker commands such as 'flask send-notifications' have no HTTP server of
+# their own, so the metrics they record (mail latency and failures, pool
+# waits) are served from a background thread instead. Returns the server,
+# or None if no port is configured.
+def start_metrics_server(app, port=None):
+    port = app.config['WORKER_METRICS_PORT'] if port is None else port
+    if port is None or not app.config['METRICS_ENABLED']:
+        return None
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.partition('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            with app.app_context():
+                body = registry.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((app.config['WORKER_METRICS_HOST'], port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(
+        target=server.serve_forever, name='metrics-server', daemon=True
+    ).start()
+    app.logger.info('Serving metrics on port %d', server.server_address[1])
+
+    return server
+
+
+def init_worker(app):
+    app.config.setdefault('METRICS_ENABLED', True)
+    # Port for the worker commands' /metrics endpoint; None turns it off
+    app.config.setdefault('WORKER_METRICS_PORT', None)
+    app.config.setdefault('WORKER_METRICS_HOST', '0.0.0.0')
+
+
+def init_app(app):
+    app.config.setdefault('METRICS_ENABLED', True)
+    # Requests slower than this many seconds get their sampled stacks
+    # written to PROFILE_DIR; None turns the profiler off
+    app.config.setdefault('PROFILE_SLOW_REQUESTS', None)
+    app.config.setdefault('PROFILE_SAMPLE_INTERVAL', 0.005)
+    app.config.setdefault('PROFILE_DIR', os.path.join(app.instance_path, 'profiles'))
+
+    if not app.config['METRICS_ENABLED']:
+        return
+
+    if app.config['PROFILE_SLOW_REQUESTS'] is not None:
+        app.extensions['slow_request_profiler'] = SlowRequestProfiler(
+            app.config['PROFILE_SLOW_REQUESTS'],
+            app.config['PROFILE_SAMPLE_INTERVAL'],
+            app.config['PROFILE_DIR']
+        )
+
+    with app.app_context():
+        engines = list(db.engines.values())
+    for engine in engines:
+        if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.register_blueprint(metrics_bp)
@@ -1,5 +1,17 @@
 from . import db
 from datetime import datetime
+import sqlite3
+from sqlalchemy import DDL, event
+from sqlalchemy.engine import Engine
+
+
+# SQLite only enforces foreign keys (and so ON DELETE CASCADE) when asked to
+@event.listens_for(Engine, 'connect')
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
 
 
 class User(db.Model):
@@ -11,10 +23,21 @@ class User(db.Model):
     notification_preference = db.Column(
         db.Enum('Email', 'SMS', 'Push notifications')
     )
+    # Set when the account is scheduled for deletion
+    deleted_at = db.Column(db.DateTime, nullable=True)
+    # Last version handed out in the user's change feed (see 'app/sync.py')
+    sync_version = db.Column(db.Integer, default=0, nullable=False)
+    # Whether the user's task statistics rollups are complete. New users
+    # start with them; users from before the rollups existed get them from
+    # 'flask backfill-stats' (the column is added as false for them).
+    stats_ready = db.Column(
+        db.Boolean, default=True, server_default=db.false(), nullable=False
+    )
 
-    # Relationship to 'tasks'
+    # Relationship to 'tasks' (rows are removed by the database cascade)
     tasks = db.relationship(
-        'Task', back_populates='user', cascade='all, delete-orphan'
+        'Task', back_populates='user', cascade='all, delete-orphan',
+        passive_deletes=True
     )
 
     def __repr__(self):
@@ -25,7 +48,9 @@ class Task(db.Model):
     __tablename__ = 'tasks'
     task_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     user_id = db.Column(
-        db.Integer, db.ForeignKey('users.user_id'), nullable=False
+        db.Integer,
+        db.ForeignKey('users.user_id', ondelete='CASCADE'),
+        nullable=False
     )
     title = db.Column(db.String(45), nullable=False)
     description = db.Column(db.Text)
@@ -36,15 +61,56 @@ class Task(db.Model):
     status = db.Column(db.Enum('Pending', 'Completed'))
     recurrence = db.Column(db.Enum('None', 'Daily', 'Weekly'))
     reminder_time = db.Column(db.TIMESTAMP)
+    # Position in the owner's change feed, stamped on every write
+    version = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(
+        db.DateTime, default=datetime.utcnow, nullable=False
+    )
+    # End of the window whose occurrences have been materialized, for
+    # recurring tasks (see 'app/occurrences.py')
+    occurrences_until = db.Column(db.DateTime, nullable=True)
 
     # Relationship to 'users'
     user = db.relationship('User', back_populates='tasks')
 
-    # Relationship to 'reminders'
+    # Relationship to 'reminders' (rows are removed by the database cascade)
     reminders = db.relationship(
-        'Reminder', back_populates='task', cascade='all, delete-orphan'
+        'Reminder', back_populates='task', cascade='all, delete-orphan',
+        passive_deletes=True
         )
 
+    # Relationship to 'task_occurrences' (also removed by the cascade)
+    occurrences = db.relationship(
+        'TaskOccurrence', back_populates='task', cascade='all, delete-orphan',
+        passive_deletes=True
+    )
+
+    # Keyset pagination of a user's tasks, optionally filtered by status or
+    # priority, walks these indexes in (start_time, task_id) order. Calendar
+    # range queries prune on start_time and end_time. Delta sync reads a
+    # user's changes in version order. The occurrence job looks for
+    # recurring tasks whose window needs extending.
+    __table_args__ = (
+        db.Index('ix_tasks_user_version', 'user_id', 'version'),
+        db.Index('ix_tasks_recurrence_until', 'recurrence', 'occurrences_until'),
+        db.Index('ix_tasks_user_start', 'user_id', 'start_time', 'task_id'),
+        db.Index('ix_tasks_user_end', 'user_id', 'end_time'),
+        db.Index(
+            'ix_tasks_user_status_start',
+            'user_id', 'status', 'start_time', 'task_id'
+        ),
+        db.Index(
+            'ix_tasks_user_priority_start',
+            'user_id', 'priority', 'start_time', 'task_id'
+        ),
+        # Full-text search on MySQL; SQLite gets an FTS5 table instead
+        # (see 'app/search.py')
+        db.Index(
+            'ft_tasks_title_description_location',
+            'title', 'description', 'location', mysql_prefix='FULLTEXT'
+        ).ddl_if(dialect=('mysql', 'mariadb')),
+    )
+
     def __repr__(self):
         return (
             f"<Task(task_id='{self.task_id}', user_id='{self.user_id}', "
@@ -52,25 +118,349 @@ class Task(db.Model):
         )
 
 
+# SQLite keeps an FTS5 index over the same columns, stored as an
+# external-content table: it holds only the index and reads the text from
+# 'tasks'. Triggers keep it in step with every insert, update and delete,
+# including bulk inserts and cascaded deletes. They are declared with the
+# model so create_all() builds them under every app profile; searches run
+# in 'app/search.py'.
+TASKS_FTS_DDL = (
+    """CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5(
+        title, description, location,
+        content='tasks', content_rowid='task_id', tokenize='unicode61'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS tasks_fts_insert AFTER INSERT ON tasks BEGIN
+        INSERT INTO tasks_fts(rowid, title, description, location)
+        VALUES (new.task_id, new.title, new.description, new.location);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS tasks_fts_delete AFTER DELETE ON tasks BEGIN
+        INSERT INTO tasks_fts(tasks_fts, rowid, title, description, location)
+        VALUES ('delete', old.task_id, old.title, old.description, old.location);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS tasks_fts_update
+    AFTER UPDATE OF title, description, location ON tasks BEGIN
+        INSERT INTO tasks_fts(tasks_fts, rowid, title, description, location)
+        VALUES ('delete', old.task_id, old.title, old.description, old.location);
+        INSERT INTO tasks_fts(rowid, title, description, location)
+        VALUES (new.task_id, new.title, new.description, new.location);
+    END""",
+)
+
+for statement in TASKS_FTS_DDL:
+    event.listen(
+        Task.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite')
+    )
+event.listen(
+    Task.__table__, 'after_drop',
+    DDL('DROP TABLE IF EXISTS tasks_fts').execute_if(dialect='sqlite')
+)
+
+
 class Reminder(db.Model):
     __tablename__ = 'reminders'
     reminder_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     task_id = db.Column(
-        db.Integer, db.ForeignKey('tasks.task_id'), nullable=False
+        db.Integer,
+        db.ForeignKey('tasks.task_id', ondelete='CASCADE'),
+        nullable=False
+    )
+    # Owner of the task, denormalized so reminders can be listed per user
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.user_id', ondelete='CASCADE'),
+        nullable=False
     )
     # Set default as UTC
     reminder_time = db.Column(
         db.DateTime, default=datetime.utcnow, nullable=False
     )
-    sent = db.Column(db.Boolean, default=False)
+    sent = db.Column(db.Boolean, default=False, nullable=False)
     sent_time = db.Column(db.DateTime, nullable=True)
+    # Position in the owner's change feed, stamped on every write
+    version = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(
+        db.DateTime, default=datetime.utcnow, nullable=False
+    )
+    # Set on reminders generated for an occurrence of a recurring task
+    occurrence_id = db.Column(
+        db.Integer,
+        db.ForeignKey('task_occurrences.occurrence_id', ondelete='SET NULL'),
+        nullable=True
+    )
 
     # Relationship to 'tasks'
     task = db.relationship('Task', back_populates='reminders')
 
+    # The dispatcher scans unsent reminders in 'reminder_time' order; a
+    # user's reminders are paged in (reminder_time, reminder_id) order and
+    # synced in version order
+    __table_args__ = (
+        db.Index('ix_reminders_user_version', 'user_id', 'version'),
+        db.Index('ix_reminders_sent_reminder_time', 'sent', 'reminder_time'),
+        db.Index(
+            'ix_reminders_user_time',
+            'user_id', 'reminder_time', 'reminder_id'
+        ),
+        # At most one generated reminder per occurrence
+        db.Index('ix_reminders_occurrence_id', 'occurrence_id', unique=True),
+    )
+
     def __repr__(self):
         return (
             f"<Reminder(reminder_id='{self.reminder_id}', "
             f"task_id='{self.task_id}', "
             f"reminder_time='{self.reminder_time}', sent='{self.sent}')>"
         )
+
+
+class TaskOccurrence(db.Model):
+    """One upcoming occurrence of a recurring task, materialized a rolling
+    OCCURRENCE_HORIZON_DAYS ahead (see 'app/occurrences.py').
+    """
+    __tablename__ = 'task_occurrences'
+    occurrence_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    task_id = db.Column(
+        db.Integer,
+        db.ForeignKey('tasks.task_id', ondelete='CASCADE'),
+        nullable=False
+    )
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.user_id', ondelete='CASCADE'),
+        nullable=False
+    )
+    start_time = db.Column(db.DateTime, nullable=False)
+    end_time = db.Column(db.DateTime, nullable=False)
+
+    # Relationship to 'tasks'
+    task = db.relationship('Task', back_populates='occurrences')
+
+    # An occurrence is generated once; a user's are read in start order
+    __table_args__ = (
+        db.UniqueConstraint(
+            'task_id', 'start_time', name='uq_task_occurrences_task_start'
+        ),
+        db.Index('ix_task_occurrences_user_start', 'user_id', 'start_time'),
+        db.Index('ix_task_occurrences_start', 'start_time'),
+    )
+
+    def __repr__(self):
+        return (
+            f"<TaskOccurrence(occurrence_id='{self.occurrence_id}', "
+            f"task_id='{self.task_id}', start_time='{self.start_time}')>"
+        )
+
+class ReminderArchive(db.Model):
+    """Reminders sent long ago, moved out of 'reminders' by the archive job
+    (see 'app/archive.py') with their IDs and versions unchanged.
+    """
+    __tablename__ = 'reminders_archive'
+    reminder_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    task_id = db.Column(
+        db.Integer,
+        db.ForeignKey('tasks.task_id', ondelete='CASCADE'),
+        nullable=False
+    )
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.user_id', ondelete='CASCADE'),
+        nullable=False
+    )
+    reminder_time = db.Column(db.DateTime, nullable=False)
+    sent = db.Column(db.Boolean, default=True, nullable=False)
+    sent_time = db.Column(db.DateTime, nullable=True)
+    version = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False)
+    archived_at = db.Column(
+        db.DateTime, default=datetime.utcnow, nullable=False
+    )
+
+    # Read back per user in (reminder_time, reminder_id) order, or per task
+    __table_args__ = (
+        db.Index(
+            'ix_reminders_archive_user_time',
+            'user_id', 'reminder_time', 'reminder_id'
+        ),
+        db.Index('ix_reminders_archive_task_id', 'task_id'),
+    )
+
+    def __repr__(self):
+        return (
+            f"<ReminderArchive(reminder_id='{self.reminder_id}', "
+            f"task_id='{self.task_id}', "
+            f"reminder_time='{self.reminder_time}')>"
+        )
+
+class Notification(db.Model):
+    __tablename__ = 'notifications'
+    notification_id = db.Column(
+        db.Integer, primary_key=True, autoincrement=True
+    )
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.user_id', ondelete='CASCADE'),
+        nullable=False
+    )
+    reminder_id = db.Column(
+        db.Integer,
+        db.ForeignKey('reminders.reminder_id', ondelete='SET NULL'),
+        nullable=True
+    )
+    recipient = db.Column(db.String(45), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    # 'Sending' rows are leased to a worker until 'next_attempt_at'
+    status = db.Column(
+        db.Enum('Pending', 'Sending', 'Sent', 'Failed'),
+        default='Pending', nullable=False
+    )
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    next_attempt_at = db.Column(
+        db.DateTime, default=datetime.utcnow, nullable=False
+    )
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(
+        db.DateTime, default=datetime.utcnow, nullable=False
+    )
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+    # Workers poll on (status, next_attempt_at)
+    __table_args__ = (
+        db.Index(
+            'ix_notifications_status_next_attempt_at',
+            'status', 'next_attempt_at'
+        ),
+    )
+
+    def __repr__(self):
+        return (
+            f"<Notification(notification_id='{self.notification_id}', "
+            f"recipient='{self.recipient}', status='{self.status}')>"
+        )
+
+
+class UserPurge(db.Model):
+    __tablename__ = 'user_purges'
+    purge_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    # No foreign key: the record outlives the user row it describes
+    user_id = db.Column(db.Integer, nullable=False, index=True)
+    status = db.Column(
+        db.Enum('Pending', 'Running', 'Completed'),
+        default='Pending', nullable=False
+    )
+    requested_at = db.Column(
+        db.DateTime, default=datetime.utcnow, nullable=False
+    )
+    # Refreshed after every chunk so a stalled purge can be taken over
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    completed_at = db.Column(db.DateTime, nullable=True)
+    reminders_deleted = db.Column(db.Integer, default=0, nullable=False)
+    tasks_deleted = db.Column(db.Integer, default=0, nullable=False)
+    notifications_deleted = db.Column(db.Integer, default=0, nullable=False)
+
+    def __repr__(self):
+        return (
+            f"<UserPurge(purge_id='{self.purge_id}', "
+            f"user_id='{self.user_id}', status='{self.status}')>"
+        )
+
+
+class DigestDelivery(db.Model):
+    __tablename__ = 'digest_deliveries'
+    delivery_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.user_id', ondelete='CASCADE'),
+        nullable=False
+    )
+    # The day whose schedule was sent
+    digest_date = db.Column(db.Date, nullable=False)
+    created_at = db.Column(
+        db.DateTime, default=datetime.utcnow, nullable=False
+    )
+
+    # One digest per user per day, which makes reruns safe
+    __table_args__ = (
+        db.UniqueConstraint(
+            'user_id', 'digest_date', name='uq_digest_deliveries_user_date'
+        ),
+    )
+
+    def __repr__(self):
+        return (
+            f"<DigestDelivery(user_id='{self.user_id}', "
+            f"digest_date='{self.digest_date}')>"
+        )
+
+
+class SyncTombstone(db.Model):
+    """Record of a deleted task or reminder, so clients syncing changes
+    learn about the delete.
+    """
+    __tablename__ = 'sync_tombstones'
+    tombstone_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.user_id', ondelete='CASCADE'),
+        nullable=False
+    )
+    entity = db.Column(db.Enum('task', 'reminder'), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    version = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(
+        db.DateTime, default=datetime.utcnow, nullable=False
+    )
+
+    __table_args__ = (
+        db.Index('ix_sync_tombstones_user_version', 'user_id', 'version'),
+    )
+
+    def __repr__(self):
+        return (
+            f"<SyncTombstone(entity='{self.entity}', "
+            f"entity_id='{self.entity_id}', version='{self.version}')>"
+        )
+
+
+class TaskDailyStat(db.Model):
+    """Number of a user's tasks per day, priority and status, kept up to
+    date on every task write (see 'app/stats.py').
+    """
+    __tablename__ = 'task_daily_stats'
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.user_id', ondelete='CASCADE'),
+        primary_key=True
+    )
+    # Day of the task's start_time; unscheduled tasks are counted under
+    # 'stats.UNSCHEDULED_DAY'
+    day = db.Column(db.Date, primary_key=True)
+    # 'Unset' stands in for a NULL priority or status
+    priority = db.Column(db.String(10), primary_key=True)
+    status = db.Column(db.String(10), primary_key=True)
+    task_count = db.Column(db.Integer, default=0, nullable=False)
+
+    def __repr__(self):
+        return (
+            f"<TaskDailyStat(user_id='{self.user_id}', day='{self.day}', "
+            f"priority='{self.priority}', status='{self.status}', "
+            f"task_count='{self.task_count}')>"
+        )
+
+
+class JobCheckpoint(db.Model):
+    """Progress of a resumable maintenance job, by name."""
+    __tablename__ = 'job_checkpoints'
+    name = db.Column(db.String(64), primary_key=True)
+    # Last key the job has fully processed
+    position = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(
+        db.DateTime, default=datetime.utcnow, nullable=False
+    )
+    completed_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return (
+            f"<JobCheckpoint(name='{self.name}', position='{self.position}', "
+            f"completed_at='{self.completed_at}')>"
+        )
@@ -0,0 +1,207 @@
+from . import db
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+import time
+from .mailer import get_delivery_engine
+from .metrics import start_metrics_server
+from .models import User, Notification
+from .utils import build_message
+
+
+# Put an email on the outbox. The caller owns the transaction, so the
+# notification is only persisted if the surrounding write commits.
+def enqueue_email(user, subject, body, reminder_id=None):
+    notification = Notification(
+        user_id=user.user_id,
+        reminder_id=reminder_id,
+        recipient=user.email,
+        subject=subject,
+        body=body,
+        status='Pending',
+        attempts=0,
+        next_attempt_at=datetime.utcnow()
+    )
+    db.session.add(notification)
+
+    return notification
+
+# Delay before the next attempt, doubling on every failure
+def backoff_delay(attempts):
+    base = current_app.config['NOTIFICATION_BACKOFF_SECONDS']
+    cap = current_app.config['NOTIFICATION_BACKOFF_MAX_SECONDS']
+
+    return min(base * 2 ** max(attempts - 1, 0), cap)
+
+# Claim up to 'limit' due notifications for this worker. Rows are leased by
+# a compare-and-set UPDATE, so concurrent workers never claim the same row
+# and rows held by a crashed worker become claimable again once the lease
+# expires.
+def claim_notifications(limit):
+    now = datetime.utcnow()
+    lease_until = now + timedelta(
+        seconds=current_app.config['NOTIFICATION_LEASE_SECONDS']
+    )
+
+    candidates = db.session.execute(
+        db.select(
+            Notification.notification_id,
+            Notification.status,
+            Notification.next_attempt_at
+        )
+        .join(User, Notification.user_id == User.user_id)
+        .where(
+            Notification.status.in_(['Pending', 'Sending']),
+            Notification.next_attempt_at <= now,
+            User.deleted_at.is_(None)  # Never email deleted accounts
+        )
+        .order_by(Notification.next_attempt_at)
+        .limit(limit)
+    ).all()
+
+    claimed = []
+    for notification_id, status, next_attempt_at in candidates:
+        result = db.session.execute(
+            db.update(Notification)
+            .where(
+                Notification.notification_id == notification_id,
+                Notification.status == status,
+                Notification.next_attempt_at == next_attempt_at
+            )
+            .values(
+                status='Sending',
+                next_attempt_at=lease_until,
+                attempts=Notification.attempts + 1
+            )
+        )
+        if result.rowcount == 1:
+            claimed.append(notification_id)
+    db.session.commit()
+
+    return claimed
+
+# Record the outcome of a delivery attempt
+def record_result(notification, error=None):
+    if error is None:
+        notification.status = 'Sent'
+        notification.sent_at = datetime.utcnow()
+        notification.last_error = None
+    elif notification.attempts >= current_app.config['NOTIFICATION_MAX_ATTEMPTS']:
+        notification.status = 'Failed'
+        notification.last_error = error
+    else:
+        notification.status = 'Pending'
+        notification.next_attempt_at = datetime.utcnow() + timedelta(
+            seconds=backoff_delay(notification.attempts)
+        )
+        notification.last_error = error
+
+# Send a batch of claimed notifications over one pooled SMTP connection.
+# Returns the number of notifications that were sent.
+def deliver_notifications(notification_ids):
+    notifications = db.session.execute(
+        db.select(Notification).where(
+            Notification.notification_id.in_(notification_ids),
+            Notification.status == 'Sending'
+        )
+    ).scalars().all()
+
+    messages = [
+        build_message(n.subject, [n.recipient], n.body) for n in notifications
+    ]
+    errors = get_delivery_engine().send_batch(messages)
+
+    for notification, error in zip(notifications, errors):
+        if error is not None:
+            current_app.logger.warning(
+                'Failed to send notification %s: %s',
+                notification.notification_id, error
+            )
+        record_result(notification, error)
+    db.session.commit()
+
+    return errors.count(None)
+
+
+class NotificationWorker:
+    """Drains the outbox with a pool of sender threads."""
+
+    def __init__(self, app, workers=None, batch_size=None, poll_interval=None):
+        self.app = app
+        self.workers = workers or app.config['NOTIFICATION_WORKERS']
+        self.batch_size = batch_size or app.config['NOTIFICATION_BATCH_SIZE']
+        self.poll_interval = (
+            poll_interval or app.config['NOTIFICATION_POLL_INTERVAL']
+        )
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix='notification'
+        )
+
+    def _deliver(self, notification_ids):
+        with self.app.app_context():
+            try:
+                return deliver_notifications(notification_ids)
+            except Exception:
+                db.session.rollback()
+                self.app.logger.exception(
+                    'Notifications %s could not be processed', notification_ids
+                )
+                return 0
+
+    # Claim one batch and send it in per-connection chunks, returning the
+    # number of claimed rows
+    def run_once(self):
+        with self.app.app_context():
+            claimed = claim_notifications(self.batch_size)
+
+        chunk_size = self.app.config['MAIL_BATCH_SIZE']
+        chunks = [
+            claimed[start:start + chunk_size]
+            for start in range(0, len(claimed), chunk_size)
+        ]
+        list(self.executor.map(self._deliver, chunks))
+
+        return len(claimed)
+
+    def run(self, once=False):
+        try:
+            while True:
+                claimed = self.run_once()
+                if once:
+                    return
+                # Keep draining while there is a backlog
+                if claimed < self.batch_size:
+                    time.sleep(self.poll_interval)
+        finally:
+            self.executor.shutdown(wait=True)
+
+
+@click.command('send-notifications')
+@click.option('--workers', type=int, default=None, help='Sender threads.')
+@click.option('--batch-size', type=int, default=None, help='Rows per claim.')
+@click.option('--metrics-port', type=int, default=None, help='Serve /metrics on this port.')
+@click.option('--once', is_flag=True, help='Drain one batch and exit.')
+@with_appcontext
+def send_notifications_command(workers, batch_size, metrics_port, once):
+    """Deliver queued email notifications."""
+    worker = NotificationWorker(
+        current_app._get_current_object(),
+        workers=workers,
+        batch_size=batch_size
+    )
+    start_metrics_server(current_app._get_current_object(), metrics_port)
+    worker.run(once=once)
+
+
+def init_app(app):
+    app.config.setdefault('NOTIFICATION_WORKERS', 4)
+    app.config.setdefault('NOTIFICATION_BATCH_SIZE', 200)
+    app.config.setdefault('NOTIFICATION_POLL_INTERVAL', 5)
+    app.config.setdefault('NOTIFICATION_LEASE_SECONDS', 300)
+    app.config.setdefault('NOTIFICATION_MAX_ATTEMPTS', 5)
+    app.config.setdefault('NOTIFICATION_BACKOFF_SECONDS', 30)
+    app.config.setdefault('NOTIFICATION_BACKOFF_MAX_SECONDS', 3600)
+
+    app.cli.add_command(send_notifications_command)
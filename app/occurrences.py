@@ -0,0 +1,225 @@
+from . import db
+from collections import defaultdict
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from .conflicts import as_utc_datetime
+from .models import User, Task, Reminder, TaskOccurrence
+from .recurrence import expand_occurrences, is_recurring, RECURRENCE_STEPS
+from .sync import stamp_rows
+
+
+# Fields whose change moves a task's occurrences or their reminders
+SCHEDULE_FIELDS = ('start_time', 'end_time', 'recurrence', 'reminder_time')
+
+def _occurrence_rows(task, now, until):
+    window_start = max(task.occurrences_until or now, now)
+    for start, end in expand_occurrences(
+        task.start_time, task.end_time, task.recurrence, window_start, until
+    ):
+        # Skip one that began before the window; it is already stored or past
+        if start >= window_start:
+            yield {'task_id': task.task_id, 'user_id': task.user_id, 'start_time': start, 'end_time': end}
+
+# INSERT that skips occurrences already stored, e.g. by an edit of the task
+# racing the scheduled job
+def _insert_occurrences(rows):
+    table = TaskOccurrence.__table__
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('mysql', 'mariadb'):
+        statement = table.insert().prefix_with('IGNORE')
+    else:
+        insert = postgresql_insert if dialect == 'postgresql' else sqlite_insert
+        statement = insert(table).on_conflict_do_nothing()
+    db.session.execute(statement, rows)
+
+def _insert_reminders(task_ids, now):
+    """Create the missing reminders of the tasks' upcoming occurrences, in
+    one bulk insert per user. Returns the number created.
+    """
+    rows = db.session.execute(
+        db.select(
+            TaskOccurrence.occurrence_id, TaskOccurrence.start_time,
+            Task.task_id, Task.user_id, Task.start_time, Task.reminder_time
+        )
+        .join(Task, TaskOccurrence.task_id == Task.task_id)
+        .outerjoin(Reminder, Reminder.occurrence_id == TaskOccurrence.occurrence_id)
+        .where(
+            TaskOccurrence.task_id.in_(task_ids),
+            TaskOccurrence.start_time >= now,
+            Task.reminder_time.is_not(None),
+            Reminder.reminder_id.is_(None)
+        )
+    ).all()
+
+    values = defaultdict(list)
+    for occurrence_id, occurrence_start, task_id, user_id, start_time, reminder_time in rows:
+        # Each occurrence is reminded as long before it as the task's own
+        # reminder_time is before its start_time
+        lead = start_time - as_utc_datetime(reminder_time)
+        # An occurrence closer than that gets no reminder, rather than one
+        # in the past that the dispatcher would fire at once
+        if occurrence_start - lead < now:
+            continue
+        values[user_id].append({
+            'task_id': task_id,
+            'user_id': user_id,
+            'reminder_time': occurrence_start - lead,
+            'sent': False,
+            'occurrence_id': occurrence_id,
+        })
+    # Lock users in a fixed order, like the flush hook
+    for user_id in sorted(values):
+        db.session.execute(db.insert(Reminder), stamp_rows(user_id, values[user_id]))
+
+    return sum(len(user_values) for user_values in values.values())
+
+def materialize(tasks, until, now=None):
+    """Store the occurrences of 'tasks' (rows or Task objects) up to 'until'
+    and their reminders, with one bulk insert each, and move the tasks'
+    'occurrences_until' to 'until'. The caller commits. Returns the number
+    of occurrences generated.
+    """
+    now = now or datetime.utcnow()
+    tasks = [task for task in tasks if task.start_time is not None]
+    if not tasks:
+        return 0
+
+    occurrences = [row for task in tasks for row in _occurrence_rows(task, now, until)]
+    if occurrences:
+        _insert_occurrences(occurrences)
+    task_ids = [task.task_id for task in tasks]
+    _insert_reminders(task_ids, now)
+    db.session.execute(
+        db.update(Task)
+        .where(Task.task_id.in_(task_ids))
+        .values(occurrences_until=until)
+    )
+
+    return len(occurrences)
+
+def schedule_task(task, now=None):
+    """Regenerate a task's future occurrences after its times, recurrence or
+    reminder changed (or it was just created), within the same transaction.
+    Past occurrences and reminders already sent are left alone. The task
+    must be flushed.
+    """
+    now = now or datetime.utcnow()
+    future = db.select(TaskOccurrence.occurrence_id).where(
+        TaskOccurrence.task_id == task.task_id, TaskOccurrence.start_time >= now
+    )
+    # Deleted through the session so synced clients get tombstones
+    for reminder in Reminder.query.filter(
+        Reminder.occurrence_id.in_(future), Reminder.sent == db.false()
+    ):
+        db.session.delete(reminder)
+    db.session.flush()
+    db.session.execute(
+        db.update(Reminder)
+        .where(Reminder.occurrence_id.in_(future))
+        .values(occurrence_id=None)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.execute(
+        db.delete(TaskOccurrence)
+        .where(TaskOccurrence.task_id == task.task_id, TaskOccurrence.start_time >= now)
+        .execution_options(synchronize_session=False)
+    )
+
+    task.occurrences_until = None
+    if is_recurring(task.recurrence):
+        horizon = now + timedelta(days=current_app.config['OCCURRENCE_HORIZON_DAYS'])
+        db.session.flush()
+        materialize([task], horizon, now)
+
+def extend_horizon(now=None):
+    """Materialize every recurring task up to OCCURRENCE_HORIZON_DAYS from
+    now, OCCURRENCE_BATCH_SIZE tasks per transaction. Tasks already covered
+    are skipped by the query, so a run after a crash picks up where the
+    last one stopped. Returns the number of occurrences generated.
+    """
+    now = now or datetime.utcnow()
+    config = current_app.config
+    until = now + timedelta(days=config['OCCURRENCE_HORIZON_DAYS'])
+
+    stored, last_task_id = 0, 0
+    while True:
+        tasks = db.session.execute(
+            db.select(
+                Task.task_id, Task.user_id, Task.start_time, Task.end_time,
+                Task.recurrence, Task.occurrences_until
+            )
+            .join(User, Task.user_id == User.user_id)
+            .where(
+                Task.recurrence.in_(list(RECURRENCE_STEPS)),
+                Task.start_time.is_not(None),
+                db.or_(Task.occurrences_until.is_(None), Task.occurrences_until < until),
+                User.deleted_at.is_(None),
+                Task.task_id > last_task_id
+            )
+            .order_by(Task.task_id)
+            .limit(config['OCCURRENCE_BATCH_SIZE'])
+        ).all()
+        if not tasks:
+            return stored
+
+        try:
+            stored += materialize(tasks, until, now)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        last_task_id = tasks[-1].task_id
+
+def prune_occurrences(now=None):
+    """Delete occurrences that started more than OCCURRENCE_RETENTION_DAYS
+    ago, in batches. Their reminders stay, unlinked. Returns the number
+    deleted.
+    """
+    now = now or datetime.utcnow()
+    config = current_app.config
+    cutoff = now - timedelta(days=config['OCCURRENCE_RETENTION_DAYS'])
+
+    deleted = 0
+    while True:
+        ids = db.session.execute(
+            db.select(TaskOccurrence.occurrence_id)
+            .where(TaskOccurrence.start_time < cutoff)
+            .limit(config['OCCURRENCE_BATCH_SIZE'])
+        ).scalars().all()
+        if not ids:
+            return deleted
+
+        db.session.execute(
+            db.update(Reminder)
+            .where(Reminder.occurrence_id.in_(ids))
+            .values(occurrence_id=None)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.execute(
+            db.delete(TaskOccurrence)
+            .where(TaskOccurrence.occurrence_id.in_(ids))
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        deleted += len(ids)
+
+
+@click.command('schedule-occurrences')
+@with_appcontext
+def schedule_occurrences_command():
+    """Materialize upcoming occurrences and reminders of recurring tasks."""
+    stored = extend_horizon()
+    pruned = prune_occurrences()
+    click.echo(f'Generated {stored} occurrences, pruned {pruned}')
+
+
+def init_app(app):
+    app.config.setdefault('OCCURRENCE_HORIZON_DAYS', 14)
+    app.config.setdefault('OCCURRENCE_RETENTION_DAYS', 7)
+    app.config.setdefault('OCCURRENCE_BATCH_SIZE', 500)
+
+    app.cli.add_command(schedule_occurrences_command)
@@ -0,0 +1,98 @@
+import base64
+from datetime import datetime
+import json
+import pytz
+from sqlalchemy import and_, or_
+
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+class PaginationError(ValueError):
+    pass
+
+
+# Cursors are opaque to clients: base64 of the last row's (sort value, id)
+def encode_cursor(sort_value, row_id):
+    if isinstance(sort_value, datetime):
+        sort_value = sort_value.isoformat()
+    raw = json.dumps([sort_value, row_id], separators=(',', ':'))
+
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        if sort_value is not None:
+            sort_value = datetime.fromisoformat(sort_value)
+        return sort_value, int(row_id)
+    except (ValueError, TypeError):
+        raise PaginationError('Invalid cursor')
+
+# Ranked results are paged by position, which such a cursor carries in
+# place of the row ID
+def decode_offset_cursor(cursor):
+    offset = decode_cursor(cursor)[1]
+    if offset < 0:
+        raise PaginationError('Invalid cursor')
+
+    return offset
+
+# Parse an ISO 8601 query parameter into a naive UTC datetime
+def parse_datetime_arg(args, name):
+    value = args.get(name)
+    if value is None:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise PaginationError(f"Invalid '{name}' datetime")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(pytz.utc).replace(tzinfo=None)
+
+    return parsed
+
+def parse_limit(args):
+    try:
+        limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise PaginationError("Invalid 'limit'")
+    if limit < 1:
+        raise PaginationError("'limit' must be positive")
+
+    return min(limit, MAX_PAGE_SIZE)
+
+# Rows strictly after the cursor in (sort_column, id_column) order. NULL sort
+# values come first, matching ascending order on both MySQL and SQLite.
+def _after(sort_column, id_column, sort_value, row_id):
+    if sort_value is None:
+        return or_(
+            and_(sort_column.is_(None), id_column > row_id),
+            sort_column.is_not(None)
+        )
+
+    return or_(
+        sort_column > sort_value,
+        and_(sort_column == sort_value, id_column > row_id)
+    )
+
+# Fetch one page with keyset pagination. The cost of a page depends only on
+# its size, not on how deep the client has paged. Returns the rows and the
+# cursor for the next page (None on the last page).
+def keyset_page(query, sort_column, id_column, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    if cursor:
+        query = query.filter(_after(sort_column, id_column, *decode_cursor(cursor)))
+
+    rows = query.order_by(sort_column.asc(), id_column.asc()).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(
+            getattr(last, sort_column.key), getattr(last, id_column.key)
+        )
+
+    return rows, next_cursor
@@ -0,0 +1,134 @@
+from concurrent.futures import CancelledError, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from flask import current_app
+import multiprocessing
+import os
+import threading
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class PasswordPoolBusy(Exception):
+    """Raised when the hashing pool's queue stays full, or a call gets no
+    result, for the whole PASSWORD_HASH_TIMEOUT, or the pool had to be
+    restarted under it; the request should be retried later.
+    """
+
+
+# Run in the pool: verify the current password and, only if it matches,
+# hash the new one, in a single round-trip
+def _verify_and_hash(password_hash, password, new_password, method):
+    if not check_password_hash(password_hash, password):
+        return None
+
+    return generate_password_hash(new_password, method=method)
+
+
+class PasswordHasher:
+    """Runs password hashing and verification on a small process pool.
+
+    Key derivation is deliberately slow. Done inline, each hash occupies a
+    request worker for its whole duration, and a burst of signups can leave
+    none for other requests. The pool bounds hashing to 'workers' processes,
+    and at most 'queue_size' calls wait for them; beyond that callers fail
+    fast with PasswordPoolBusy. With 'workers' set to 0 everything runs
+    inline.
+
+    Pool processes are spawned, so they re-import the main script; scripts
+    that build the app should do so under "if __name__ == '__main__'".
+    """
+
+    def __init__(self, method, workers, queue_size, timeout):
+        self.method = method
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(workers + queue_size) if workers else None
+        self._pool = None
+        self._pool_pid = None
+        self._lock = threading.Lock()
+
+    # Created on first use, and again in a process forked after that (such
+    # as a pre-forking web server's workers), which cannot use its parent's
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                # Spawned, not forked: forking a threaded server is unsafe
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+                self._pool_pid = os.getpid()
+
+            return self._pool
+
+    # A pool whose worker died (e.g. killed for memory) accepts no more
+    # work; drop it so the next call starts a new one
+    def _discard_pool(self, pool):
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(self, func, *args):
+        pool = self._get_pool()
+        try:
+            return pool, pool.submit(func, *args)
+        except BrokenProcessPool:
+            self._discard_pool(pool)
+            pool = self._get_pool()
+            return pool, pool.submit(func, *args)
+
+    def _run(self, func, *args):
+        if not self.workers:
+            return func(*args)
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PasswordPoolBusy('Password hashing is busy')
+        try:
+            pool, future = self._submit(func, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        # The slot is held until the work is done, even when the caller
+        # stops waiting, so the queue bound holds
+        future.add_done_callback(lambda _: self._slots.release())
+
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            raise PasswordPoolBusy('Password hashing timed out')
+        except BrokenProcessPool:
+            self._discard_pool(pool)
+            raise PasswordPoolBusy('Password hashing was interrupted')
+        except CancelledError:
+            # Queued on a pool discarded since
+            raise PasswordPoolBusy('Password hashing was interrupted')
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify_and_hash(self, password_hash, password, new_password):
+        """The hash of 'new_password', or None if 'password' is wrong."""
+        return self._run(_verify_and_hash, password_hash, password, new_password, self.method)
+
+
+def get_password_hasher():
+    return current_app.extensions['password_hasher']
+
+def hash_password(password):
+    return get_password_hasher().hash(password)
+
+
+def init_app(app):
+    # Any 'generate_password_hash' method, e.g. 'scrypt:32768:8:1' or
+    # 'pbkdf2:sha256:600000'. Existing hashes keep verifying after a change.
+    app.config.setdefault('PASSWORD_HASH_METHOD', 'scrypt')
+    # Hashing processes per app process; 0 hashes inline
+    app.config.setdefault('PASSWORD_HASH_WORKERS', min(os.cpu_count() or 1, 2))
+    app.config.setdefault('PASSWORD_HASH_QUEUE_SIZE', 16)
+    app.config.setdefault('PASSWORD_HASH_TIMEOUT', 10)
+
+    app.extensions['password_hasher'] = PasswordHasher(
+        method=app.config['PASSWORD_HASH_METHOD'],
+        workers=app.config['PASSWORD_HASH_WORKERS'],
+        queue_size=app.config['PASSWORD_HASH_QUEUE_SIZE'],
+        timeout=app.config['PASSWORD_HASH_TIMEOUT']
+    )
@@ -0,0 +1,122 @@
+from . import db
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+import time
+from .models import User, Task, Reminder, ReminderArchive, Notification, UserPurge
+
+
+# Mark a user for deletion and schedule the purge. The caller commits.
+def schedule_user_deletion(user):
+    user.deleted_at = datetime.utcnow()
+    purge = UserPurge(user_id=user.user_id, status='Pending')
+    db.session.add(purge)
+
+    return purge
+
+# Claim the next purge that is pending, or running without a recent
+# heartbeat (its worker died). Compare-and-set, so workers never share one.
+def claim_purge():
+    stale = datetime.utcnow() - timedelta(
+        seconds=current_app.config['PURGE_LEASE_SECONDS']
+    )
+    candidates = db.session.execute(
+        db.select(UserPurge.purge_id, UserPurge.status, UserPurge.heartbeat_at)
+        .where(db.or_(
+            UserPurge.status == 'Pending',
+            db.and_(UserPurge.status == 'Running', UserPurge.heartbeat_at < stale)
+        ))
+        .order_by(UserPurge.purge_id)
+        .limit(10)
+    ).all()
+
+    for purge_id, status, heartbeat_at in candidates:
+        result = db.session.execute(
+            db.update(UserPurge)
+            .where(
+                UserPurge.purge_id == purge_id,
+                UserPurge.status == status,
+                (UserPurge.heartbeat_at == heartbeat_at)
+                if heartbeat_at is not None else UserPurge.heartbeat_at.is_(None)
+            )
+            .values(status='Running', heartbeat_at=datetime.utcnow())
+        )
+        db.session.commit()
+        if result.rowcount == 1:
+            return db.session.get(UserPurge, purge_id)
+
+    return None
+
+# Delete up to 'chunk_size' rows of 'model' owned by the user in one short
+# transaction, recording progress in the purge's 'counter' column. Returns
+# the number of rows deleted.
+def _delete_chunk(purge, model, id_column, counter, chunk_size):
+    ids = db.session.execute(
+        db.select(id_column).where(model.user_id == purge.user_id).limit(chunk_size)
+    ).scalars().all()
+    if ids:
+        db.session.execute(
+            db.delete(model)
+            .where(id_column.in_(ids))
+            .execution_options(synchronize_session=False)
+        )
+        setattr(purge, counter, getattr(purge, counter) + len(ids))
+    purge.heartbeat_at = datetime.utcnow()
+    db.session.commit()
+
+    return len(ids)
+
+def purge_user(purge, chunk_size):
+    """Remove a user's data in bounded chunks, children first, then the user
+    row itself. Progress is recorded on 'purge' after every chunk, and a
+    purge that is interrupted can simply be run again.
+    """
+    for model, id_column, counter in (
+        (Reminder, Reminder.reminder_id, 'reminders_deleted'),
+        (ReminderArchive, ReminderArchive.reminder_id, 'reminders_deleted'),
+        (Notification, Notification.notification_id, 'notifications_deleted'),
+        (Task, Task.task_id, 'tasks_deleted'),
+    ):
+        while _delete_chunk(purge, model, id_column, counter, chunk_size):
+            current_app.logger.info(
+                'Purge %s (user %s): %s %s',
+                purge.purge_id, purge.user_id, getattr(purge, counter), counter
+            )
+
+    # Anything still referencing the user goes with the database cascade
+    db.session.execute(db.delete(User).where(User.user_id == purge.user_id))
+    purge.status = 'Completed'
+    purge.completed_at = datetime.utcnow()
+    db.session.commit()
+
+def run_purges(once=False):
+    chunk_size = current_app.config['PURGE_CHUNK_SIZE']
+    while True:
+        purge = claim_purge()
+        if purge is not None:
+            try:
+                purge_user(purge, chunk_size)
+            except Exception:
+                db.session.rollback()
+                current_app.logger.exception('Purge %s failed', purge.purge_id)
+            continue
+        if once:
+            return
+        time.sleep(current_app.config['PURGE_POLL_INTERVAL'])
+
+
+@click.command('purge-users')
+@click.option('--once', is_flag=True, help='Exit when no purge is pending.')
+@with_appcontext
+def purge_users_command(once):
+    """Delete the data of accounts scheduled for deletion."""
+    run_purges(once=once)
+
+
+def init_app(app):
+    app.config.setdefault('PURGE_CHUNK_SIZE', 1000)
+    app.config.setdefault('PURGE_POLL_INTERVAL', 30)
+    app.config.setdefault('PURGE_LEASE_SECONDS', 600)
+
+    app.cli.add_command(purge_users_command)
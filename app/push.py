@@ -0,0 +1,251 @@
+from . import db
+from abc import ABC, abstractmethod
+import asyncio
+from collections import defaultdict
+from flask import current_app
+import json
+import threading
+from .models import User
+
+
+class Broker(ABC):
+    """Publish/subscribe interface between whatever fires reminders and the
+    SSE connections waiting for them. Channels are user IDs.
+
+    'publish' may be called from any thread; 'subscribe' and 'unsubscribe'
+    are called from the event loop serving the connection.
+    """
+
+    @abstractmethod
+    def publish(self, channel, message):
+        pass
+
+    @abstractmethod
+    def subscribe(self, channel):
+        pass
+
+    @abstractmethod
+    def unsubscribe(self, channel, queue):
+        pass
+
+
+class LocalBroker(Broker):
+    """In-process broker: each subscriber is an asyncio.Queue.
+
+    Only reaches connections served by this process, so the reminder
+    dispatcher has to run in the same process (see 'PushApp'). A subscriber
+    that falls 'queue_size' messages behind misses the newest ones.
+    """
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._subscribers = defaultdict(dict)  # Channel -> {queue: loop}
+        self._lock = threading.Lock()
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, {}).items())
+        for queue, loop in subscribers:
+            loop.call_soon_threadsafe(self._deliver, queue, message)
+
+        return len(subscribers)
+
+    @staticmethod
+    def _deliver(queue, message):
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            pass
+
+    def subscribe(self, channel):
+        queue = asyncio.Queue(self.queue_size)
+        with self._lock:
+            self._subscribers[channel][queue] = asyncio.get_running_loop()
+
+        return queue
+
+    def unsubscribe(self, channel, queue):
+        with self._lock:
+            subscribers = self._subscribers.get(channel)
+            if subscribers is not None:
+                subscribers.pop(queue, None)
+                if not subscribers:
+                    del self._subscribers[channel]
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(queues) for queues in self._subscribers.values())
+
+
+def get_broker():
+    return current_app.extensions['push_broker']
+
+# Push a fired reminder to the user's open connections. Returns the number
+# of connections it was handed to.
+def publish_reminder(user_id, reminder_id, reminder_time, title):
+    message = json.dumps({
+        'reminder_id': reminder_id,
+        'title': title,
+        'reminder_time': reminder_time.isoformat(),
+    })
+
+    return get_broker().publish(user_id, message)
+
+
+class PushApp:
+    """ASGI application streaming reminders to logged-in users as
+    Server-Sent Events at 'GET /api/push'.
+
+    Each open connection is a coroutine parked on its queue, so idle
+    connections cost a few kilobytes rather than a thread. Users are
+    authenticated with the Flask session cookie. When
+    PUSH_RUN_DISPATCHER is set, the reminder dispatcher runs in a
+    background thread of this process, which is what a LocalBroker needs.
+    """
+
+    path = '/api/push'
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.broker = flask_app.extensions['push_broker']
+        self.heartbeat = flask_app.config['PUSH_HEARTBEAT_SECONDS']
+        self._dispatcher_thread = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] != 'http':
+            return
+
+        if scope['path'] != self.path or scope['method'] != 'GET':
+            return await self._respond(send, 404, {'error': 'Not found'})
+        user_id = await asyncio.to_thread(self._authenticate, scope)
+        if user_id is None:
+            return await self._respond(send, 401, {'error': 'User not logged in'})
+
+        await self._stream(user_id, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                if self.flask_app.config['PUSH_RUN_DISPATCHER']:
+                    self._start_dispatcher()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def _start_dispatcher(self):
+        from .dispatcher import ReminderDispatcher
+        dispatcher = ReminderDispatcher(self.flask_app)
+        self._dispatcher_thread = threading.Thread(
+            target=dispatcher.run, name='push-dispatcher', daemon=True
+        )
+        self._dispatcher_thread.start()
+
+    # Read the user ID from the Flask session cookie; None if the cookie is
+    # missing or invalid, or the account is gone or scheduled for deletion
+    def _authenticate(self, scope):
+        app = self.flask_app
+        cookie_name = app.config['SESSION_COOKIE_NAME']
+        cookies = {}
+        for name, value in scope['headers']:
+            if name == b'cookie':
+                for pair in value.decode('latin-1').split(';'):
+                    key, _, val = pair.strip().partition('=')
+                    cookies[key] = val
+
+        serializer = app.session_interface.get_signing_serializer(app)
+        if serializer is None or cookie_name not in cookies:
+            return None
+        try:
+            session = serializer.loads(
+                cookies[cookie_name],
+                max_age=int(app.permanent_session_lifetime.total_seconds())
+            )
+        except Exception:
+            return None
+        user_id = session.get('user_id')
+        if user_id is None:
+            return None
+
+        with app.app_context():
+            user = db.session.get(User, user_id)
+            if user is None or user.deleted_at is not None:
+                return None
+
+            return user.user_id
+
+    async def _stream(self, user_id, receive, send):
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),  # Stop nginx from buffering
+            ],
+        })
+        await send({
+            'type': 'http.response.body',
+            'body': f'retry: {self.heartbeat * 1000}\n\n'.encode(),
+            'more_body': True,
+        })
+
+        queue = self.broker.subscribe(user_id)
+        disconnected = asyncio.ensure_future(self._wait_for_disconnect(receive))
+        getter = None
+        try:
+            while True:
+                if getter is None:
+                    getter = asyncio.ensure_future(queue.get())
+                done, _ = await asyncio.wait(
+                    (getter, disconnected), timeout=self.heartbeat,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                if disconnected in done:
+                    return
+                if getter in done:
+                    chunk = f'event: reminder\ndata: {getter.result()}\n\n'
+                    getter = None
+                else:
+                    chunk = ': keep-alive\n\n'  # Comment line; keeps proxies from timing out
+                await send({
+                    'type': 'http.response.body',
+                    'body': chunk.encode(),
+                    'more_body': True,
+                })
+        except OSError:
+            pass  # The client went away mid-send
+        finally:
+            self.broker.unsubscribe(user_id, queue)
+            disconnected.cancel()
+            if getter is not None:
+                getter.cancel()
+
+    @staticmethod
+    async def _wait_for_disconnect(receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    @staticmethod
+    async def _respond(send, status, body):
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'application/json')],
+        })
+        await send({'type': 'http.response.body', 'body': json.dumps(body).encode()})
+
+
+def init_app(app):
+    # Any object implementing 'Broker'; defaults to a LocalBroker
+    app.config.setdefault('PUSH_BROKER', None)
+    app.config.setdefault('PUSH_QUEUE_SIZE', 100)
+    app.config.setdefault('PUSH_HEARTBEAT_SECONDS', 15)
+    app.config.setdefault('PUSH_RUN_DISPATCHER', True)
+
+    app.extensions['push_broker'] = (
+        app.config['PUSH_BROKER'] or LocalBroker(app.config['PUSH_QUEUE_SIZE'])
+    )
@@ -0,0 +1,47 @@
+from datetime import timedelta
+
+
+# Interval between occurrences for each 'Task.recurrence' value
+RECURRENCE_STEPS = {
+    'Daily': timedelta(days=1),
+    'Weekly': timedelta(weeks=1),
+}
+
+# Widest window a single request may expand
+MAX_RANGE_DAYS = 366
+
+def is_recurring(recurrence):
+    return recurrence in RECURRENCE_STEPS
+
+def _overlaps(start, duration, window_start, window_end):
+    if start >= window_end:
+        return False
+    if duration:
+        return start + duration > window_start
+
+    return start >= window_start  # Point-in-time task
+
+def expand_occurrences(start, end, recurrence, window_start, window_end):
+    """Lazily yield the (start, end) of each occurrence of a task that
+    overlaps [window_start, window_end), in chronological order.
+
+    Occurrences before the window are skipped arithmetically, so the cost
+    depends only on how many occurrences fall inside the window.
+    """
+    if start is None:
+        return
+    duration = end - start if end is not None and end > start else timedelta(0)
+
+    step = RECURRENCE_STEPS.get(recurrence)
+    if step is None:
+        if _overlaps(start, duration, window_start, window_end):
+            yield start, start + duration
+        return
+
+    # Jump to (at most one step before) the first overlapping occurrence
+    skipped = max((window_start - start - duration) // step, 0)
+    occurrence = start + skipped * step
+    while occurrence < window_end:
+        if _overlaps(occurrence, duration, window_start, window_end):
+            yield occurrence, occurrence + duration
+        occurrence += step
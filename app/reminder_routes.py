@@ -1,30 +1,28 @@
 from . import db
+from .archive import reminder_history
 from datetime import datetime
-from flask import Blueprint, jsonify, request, session
-from .models import User, Task, Reminder
+from flask import Blueprint, g, jsonify, request
+from .auth import login_required
+from .conditional import etag_headers, not_modified, precondition_failed, resource_etag, user_list_etag, user_sync_version
+from .conflicts import as_utc_datetime
+from .hot_cache import cached_payload
+from .bulk import load_chunk, read_ndjson_chunks
+from .models import Task, Reminder
 import pytz
 from .schemas import ReminderSchema
-from .utils import send_email
+from .serializers import fast_serialization_enabled, FastSerializer
+from .notifications import enqueue_email
+from .sync import stamp_rows
+from .pagination import keyset_page, PaginationError, parse_datetime_arg, parse_limit
 
 
 reminder_schema = ReminderSchema()
 reminders_schema = ReminderSchema(many=True)
+reminder_serializer = FastSerializer(reminder_schema, Reminder)
 
 # Create a Blueprint for the user routes
 reminder_bp = Blueprint('reminders', __name__)
 
-# Helper function to verify if the user exists and is logged in
-def verify_user():
-    user_id = session.get('user_id') # Fetch the logged-in user's ID
-    if not user_id:
-        return None, jsonify({'error': 'User not logged in'}), 401
-
-    user = User.query.get(user_id)
-    if not user:
-        return None, jsonify({'error': 'User not found'}), 404
-
-    return user, None, None  # Return user, response, and status code
-
 # Helper function to fetch a reminder by ID, or return 404
 def get_reminder(reminder_id, user_id):
     reminder = Reminder.query.filter_by(reminder_id=reminder_id, user_id=user_id)\
@@ -34,18 +32,17 @@ def get_reminder(reminder_id, user_id):
 
 # Route for creating a new reminder
 @reminder_bp.route('/reminders', methods=['POST'])
+@login_required
 def create_reminder():
-    user, error_response, status_code = verify_user() # Verify user's existence and login before action
-    if error_response:
-        return error_response, status_code
+    user = g.user
 
     data = request.json
     # Ensure a time is set for every reminder
     if 'reminder_time' not in data:
         return jsonify({'error': 'Missing reminder time'}), 400
-    # Ensure every reminder is associated with a task
+    # Ensure every reminder is associated with one of the user's tasks
     task = Task.query.get(data['task_id'])
-    if not task:
+    if not task or task.user_id != user.user_id:
         return jsonify({'error': 'Task not found'}), 404
     
     reminder_time = data.get('reminder_time')
@@ -62,63 +59,176 @@ def create_reminder():
     try:
         new_reminder = Reminder(
             task_id=data['task_id'],  # Ensure a valid task ID is provided and exists
+            user_id=user.user_id,
             reminder_time=reminder_time_utc,
             # The rest columns are nullable
-            sent=data.get('sent', None),
+            sent=data.get('sent', False),
             sent_time=data.get('sent_time', None)
         )
 
         db.session.add(new_reminder)
-        db.session.commit()
+        db.session.flush()  # Assign the reminder ID for the notification
 
-        # Send an email notification
+        # Queue an email notification, committed together with the reminder
         email_subject = "New Reminder Created"
-        email_body = f"Dear {User.username},\n\nYou have a new reminder set for {new_reminder.reminder_time}."
-        recipient = [User.email]
+        email_body = f"Dear {user.username},\n\nYou have a new reminder set for {new_reminder.reminder_time}."
+        enqueue_email(user, email_subject, email_body, reminder_id=new_reminder.reminder_id)
 
-        if send_email(email_subject, recipient, email_body):
-            return jsonify(reminder_schema.dump(new_reminder)), 201
-        else:
-            return jsonify({'message': 'Reminder created, but failed to send email notification'}), 500
+        db.session.commit()
+
+        return jsonify(reminder_schema.dump(new_reminder)), 201
 
     except Exception as e:
         db.session.rollback()
         return jsonify({'message': 'Failed to create reminder', 'error': str(e)}), 500
 
-# Route for querying all reminders for a user 
+# Route for importing many reminders for the logged-in user from NDJSON
+# (One reminder object per line; each chunk is validated and committed
+# together. No notification emails are queued for imported reminders.)
+@reminder_bp.route('/reminders/bulk', methods=['POST'])
+@login_required
+def create_reminders_bulk():
+    user = g.user
+
+    inserted, errors = 0, []
+    for chunk in read_ndjson_chunks(request.stream):
+        rows, chunk_errors = load_chunk(reminder_schema, chunk)
+        errors.extend(chunk_errors)
+
+        # Check task ownership for the whole chunk in one query
+        task_ids = {data['task_id'] for _, data in rows}
+        owned = set(db.session.execute(
+            db.select(Task.task_id).where(
+                Task.task_id.in_(task_ids), Task.user_id == user.user_id
+            )
+        ).scalars()) if task_ids else set()
+
+        values = []
+        for line_number, data in rows:
+            if data['task_id'] not in owned:
+                errors.append({'line': line_number, 'error': 'Task not found'})
+                continue
+            values.append({
+                'task_id': data['task_id'],
+                'user_id': user.user_id,
+                'reminder_time': as_utc_datetime(data['reminder_time']),
+                'sent': data.get('sent', False),
+                'sent_time': as_utc_datetime(data.get('sent_time')),
+            })
+        if not values:
+            continue
+
+        try:
+            db.session.execute(db.insert(Reminder), stamp_rows(user.user_id, values))
+            db.session.commit()
+            inserted += len(values)
+        except Exception as e:
+            db.session.rollback()
+            errors.append({'error': str(e), 'rows': len(values)})
+
+    return jsonify({'inserted': inserted, 'errors': errors}), 200
+
+# True when the request asks for archived reminders too ('?history=1')
+def wants_history():
+    return request.args.get('history', '').lower() in ('1', 'true')
+
+# Columns of the reminder schema, for reading from the history subquery
+def _history_columns():
+    return [column.key for column in reminder_serializer.columns]
+
+# Route for querying the reminders of a user, one page at a time
+# (Optional filters: sent, from/to on reminder_time; history=1 includes
+# archived reminders)
 @reminder_bp.route('/reminders', methods=['GET'])
+@login_required
 def get_all_reminders():
-    user, error_response, status_code = verify_user() # Verify user's existence and login before action
-    if error_response:
-        return error_response, status_code
+    user = g.user
+
+    try:
+        sent = request.args['sent'].lower() in ('1', 'true') if 'sent' in request.args else None
+        time_from = parse_datetime_arg(request.args, 'from')
+        time_to = parse_datetime_arg(request.args, 'to')
+
+        def criteria(model):
+            clauses = [model.user_id == user.user_id]
+            if sent is not None:
+                clauses.append(model.sent == sent)
+            if time_from is not None:
+                clauses.append(model.reminder_time >= time_from)
+            if time_to is not None:
+                clauses.append(model.reminder_time < time_to)
+            return clauses
+
+        if wants_history():
+            history = reminder_history(_history_columns(), criteria)
+            query, columns = db.session.query(history), history.c
+        # Column-only rows and a precompiled encoder when fast serialization is on
+        elif fast_serialization_enabled():
+            query, columns = reminder_serializer.query().filter(*criteria(Reminder)), Reminder
+        else:
+            query, columns = Reminder.query.filter(*criteria(Reminder)), Reminder
+        dump = reminder_serializer.dump if fast_serialization_enabled() else reminders_schema.dump
 
-    reminders = Reminder.query.filter_by(user_id=user.id).all()
-    if reminders is None:
-        return jsonify({'message': 'You have no reminders'}), 200
+        reminders, next_cursor = keyset_page(
+            query, columns.reminder_time, columns.reminder_id,
+            cursor=request.args.get('cursor'),
+            limit=parse_limit(request.args)
+        )
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
 
-    return jsonify(reminders_schema.dump(reminders)), 200
+    return jsonify({'reminders': dump(reminders), 'next_cursor': next_cursor}), 200
 
 # Route for querying reminders by task
+# (history=1 includes archived reminders)
 @reminder_bp.route('/tasks/<int:task_id>/reminders', methods=['GET'])
+@login_required
 def get_reminders_by_task(task_id):
-    user, error_response, status_code = verify_user() # Verify user's existence and login before action
-    if error_response:
-        return error_response, status_code
+    user = g.user
+
+    sync_version = user_sync_version(user.user_id)
+    etag = user_list_etag(f'task-{task_id}-reminders', user.user_id, sync_version)
+    cached = not_modified(etag)
+    if cached:
+        return cached
 
-    reminders = Reminder.query.filter_by(task_id=task_id, user_id=user.id).all()
-    if reminders is None:
-        return jsonify({'message': 'You have no reminders for this task'}), 200
+    def criteria(model):
+        return [model.task_id == task_id, model.user_id == user.user_id]
 
-    return jsonify(reminders_schema.dump(reminders)), 200
+    dump = reminder_serializer.dump if fast_serialization_enabled() else reminders_schema.dump
+
+    if wants_history():
+        history = reminder_history(_history_columns(), criteria)
+        reminders = dump(db.session.query(history).order_by(history.c.reminder_id).all())
+    else:
+        # Live reminders come from the hot cache when it has them
+        def load():
+            if fast_serialization_enabled():
+                query = reminder_serializer.query().filter(*criteria(Reminder))
+            else:
+                query = Reminder.query.filter(*criteria(Reminder))
+            return dump(query.all())
+
+        reminders = cached_payload(
+            user.user_id, f'task-reminders:{task_id}', load, sync_version
+        )
+
+    return jsonify(reminders), 200, etag_headers(etag)
 
 # Route for updating a reminder
 @reminder_bp.route('/reminders/<int:reminder_id>', methods=['PUT'])
+@login_required
 def update_reminder(reminder_id):
-    user, error_response, status_code = verify_user() # Verify user's existence and login before action
-    if error_response:
-        return error_response, status_code
+    user = g.user
+
+    reminder = get_reminder(reminder_id, user.user_id)
 
-    reminder = get_reminder(reminder_id, user.id)
+    # Optimistic concurrency: the client's 'If-Match' must be the current ETag
+    failed = precondition_failed(
+        resource_etag('reminder', reminder.reminder_id, reminder.version)
+    )
+    if failed:
+        return failed
 
     data = request.json
 
@@ -135,17 +245,15 @@ def update_reminder(reminder_id):
     reminder.sent_time = data.get('sent_time', reminder.sent_time)
 
     try:
-        db.session.commit()
-
-        # Send an email notification when the reminder is updated
+        # Queue an email notification, committed together with the update
         email_subject = "Reminder Updated"
-        email_body = f"Dear {User.username},\n\nYour reminder has been updated to {reminder.reminder_time}."
-        recipient = [User.email]
+        email_body = f"Dear {user.username},\n\nYour reminder has been updated to {reminder.reminder_time}."
+        enqueue_email(user, email_subject, email_body, reminder_id=reminder.reminder_id)
 
-        if send_email(email_subject, recipient, email_body):
-            return jsonify(reminder_schema.dump(reminder)), 200
-        else:
-            return jsonify({'message': 'Reminder updated, but failed to send email notification'}), 500
+        db.session.commit()
+
+        etag = resource_etag('reminder', reminder.reminder_id, reminder.version)
+        return jsonify(reminder_schema.dump(reminder)), 200, etag_headers(etag, reminder.updated_at)
 
     except Exception as e:
         db.session.rollback()
@@ -153,12 +261,17 @@ def update_reminder(reminder_id):
 
 # Route for deleting a reminder
 @reminder_bp.route('/reminders/<int:reminder_id>', methods=['DELETE'])
+@login_required
 def delete_reminder(reminder_id):
-    user, error_response, status_code = verify_user() # Verify user's existence and login before action
-    if error_response:
-        return error_response, status_code
+    user = g.user
+
+    reminder = get_reminder(reminder_id, user.user_id)
 
-    reminder = get_reminder(reminder_id, user.id)
+    failed = precondition_failed(
+        resource_etag('reminder', reminder.reminder_id, reminder.version)
+    )
+    if failed:
+        return failed
 
     try:
         db.session.delete(reminder)
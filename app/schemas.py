@@ -1,5 +1,6 @@
 from datetime import datetime
 from marshmallow import fields, Schema, validate, validates, ValidationError
+import pytz
 
 
 class UserSchema(Schema):
@@ -26,18 +27,23 @@ class TaskSchema(Schema):
     title = fields.String(
         required=True, validate=validate.Length(min=1, max=45)
     )
-    description = fields.String(required=False)
-    start_time = fields.DateTime(required=False)
-    end_time = fields.DateTime(required=False)
-    location = fields.String(required=False)
+    # Nullable columns accept null, so exported tasks load back as dumped
+    description = fields.String(required=False, allow_none=True)
+    start_time = fields.DateTime(required=False, allow_none=True)
+    end_time = fields.DateTime(required=False, allow_none=True)
+    location = fields.String(required=False, allow_none=True)
     priority = fields.String(
-        validate=validate.OneOf(['Low', 'Medium', 'High'])
+        validate=validate.OneOf(['Low', 'Medium', 'High']), allow_none=True
+    )
+    status = fields.String(
+        validate=validate.OneOf(['Pending', 'Completed']), allow_none=True
     )
-    status = fields.String(validate=validate.OneOf(['Pending', 'Completed']))
     recurrence = fields.String(
-        validate=validate.OneOf(['None', 'Daily', 'Weekly'])
+        validate=validate.OneOf(['None', 'Daily', 'Weekly']), allow_none=True
     )
-    reminder_time = fields.Time(required=False)
+    reminder_time = fields.DateTime(required=False, allow_none=True)  # Matches the TIMESTAMP column
+    version = fields.Int(dump_only=True)
+    updated_at = fields.DateTime(dump_only=True)
 
 
 class ReminderSchema(Schema):
@@ -45,11 +51,19 @@ class ReminderSchema(Schema):
     task_id = fields.Integer(required=True)
     reminder_time = fields.DateTime(format='%Y-%m-%dT%H:%M:%S%z', timezone='UTC', required=True) # Use UTC for timezone
     sent = fields.Boolean(default=False)
-    sent_time = fields.DateTime(required=False)
+    sent_time = fields.DateTime(required=False, allow_none=True)
+    version = fields.Int(dump_only=True)
+    updated_at = fields.DateTime(dump_only=True)
 
     @validates('reminder_time')
     def validate_reminder_time(self, value):
-        """Ensure the reminder time is not in the past and is in UTC."""
+        """Ensure the reminder time is not in the past and is in UTC.
+        Restoring an export (context 'restore') keeps past reminders.
+        """
+        if self.context.get('restore'):
+            return
         current_time = datetime.utcnow()  # Current time in UTC
+        if value.tzinfo is not None:
+            value = value.astimezone(pytz.utc).replace(tzinfo=None)
         if value < current_time:
             raise ValidationError("Reminder time cannot be in the past.")
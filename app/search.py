@@ -0,0 +1,93 @@
+from . import db
+import click
+from flask.cli import with_appcontext
+import re
+from sqlalchemy.dialects.mysql import match
+from .models import Task, TASKS_FTS_DDL
+
+
+# Deepest result a client can page to; ranked results past this are noise
+MAX_SEARCH_RESULTS = 1000
+
+SEARCH_COLUMNS = (Task.title, Task.description, Task.location)
+
+
+class SearchError(ValueError):
+    pass
+
+
+# Split user input into words, dropping anything with meaning to the
+# search syntax of either backend
+def search_terms(q):
+    terms = re.findall(r'\w+', q or '')
+    if not terms:
+        raise SearchError("'q' must contain at least one word")
+
+    return terms[:16]
+
+# Every term must match, as a prefix ('meet' finds 'meeting')
+def _sqlite_query(terms, user_id):
+    fts = db.table('tasks_fts', db.column('rowid'))
+    rank = db.func.bm25(db.literal_column('tasks_fts'))  # Lower is better
+    expression = ' '.join(f'"{term}"*' for term in terms)
+
+    return (
+        db.select(Task)
+        .join(fts, fts.c.rowid == Task.task_id)
+        .where(
+            db.literal_column('tasks_fts').op('MATCH')(expression),
+            Task.user_id == user_id
+        )
+        .order_by(rank, Task.task_id)
+    )
+
+def _mysql_query(terms, user_id):
+    relevance = match(*SEARCH_COLUMNS, against=' '.join(
+        f'+{term}*' for term in terms
+    )).in_boolean_mode()
+
+    return (
+        db.select(Task)
+        .where(relevance > 0, Task.user_id == user_id)
+        .order_by(relevance.desc(), Task.task_id)
+    )
+
+def search_tasks(user_id, q, offset, limit):
+    """One page of the user's tasks matching 'q', best match first.
+    Returns the tasks and whether more results follow.
+    """
+    terms = search_terms(q)
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        query = _sqlite_query(terms, user_id)
+    elif dialect in ('mysql', 'mariadb'):
+        query = _mysql_query(terms, user_id)
+    else:
+        raise SearchError(f'Search is not available on {dialect}')
+
+    limit = max(min(limit, MAX_SEARCH_RESULTS - offset), 0)
+    tasks = db.session.execute(
+        query.offset(offset).limit(limit + 1)
+    ).scalars().all()
+
+    has_more = len(tasks) > limit and offset + limit < MAX_SEARCH_RESULTS
+
+    return tasks[:limit], has_more
+
+
+@click.command('rebuild-search-index')
+@with_appcontext
+def rebuild_search_index_command():
+    """Rebuild the SQLite full-text index from the tasks table."""
+    if db.engine.dialect.name != 'sqlite':
+        click.echo('Only SQLite keeps a separate search index; nothing to do')
+        return
+    with db.engine.begin() as connection:
+        for statement in TASKS_FTS_DDL:
+            connection.exec_driver_sql(statement)
+        connection.exec_driver_sql("INSERT INTO tasks_fts(tasks_fts) VALUES ('rebuild')")
+    click.echo('Search index rebuilt')
+
+
+def init_app(app):
+    app.cli.add_command(rebuild_search_index_command)
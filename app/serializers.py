@@ -0,0 +1,117 @@
+from . import db
+from flask import current_app
+from flask.json.provider import DefaultJSONProvider
+from marshmallow import fields
+
+try:
+    import orjson
+except ImportError:  # Optional; the standard library encoder is used instead
+    orjson = None
+
+
+# Expression producing the same value as each marshmallow field's
+# '_serialize', for a non-None column value 'v'
+def _field_expression(field, var, constants):
+    # Order matters: Email is a String, Integer is a Number
+    if isinstance(field, fields.Boolean):
+        return f'bool({var})'
+    if isinstance(field, fields.Integer) and not field.as_string:
+        return f'int({var})'
+    if isinstance(field, fields.String):
+        return f'str({var})'
+    if isinstance(field, fields.DateTime) and not isinstance(field, (fields.NaiveDateTime, fields.AwareDateTime)):
+        data_format = field.format or field.DEFAULT_FORMAT
+        if data_format in ('iso', 'iso8601'):
+            return f'{var}.isoformat()'
+        if data_format in field.SERIALIZATION_FUNCS:
+            raise TypeError(f'Unsupported DateTime format {data_format!r}')
+        constants.append(data_format)
+        return f'{var}.strftime(_c{len(constants) - 1})'
+
+    raise TypeError(f'No fast encoder for {field.__class__.__name__}')
+
+def compile_encoder(schema):
+    """Generate a function turning a row (or any object with the schema's
+    attributes) into the same dict as 'schema.dump'.
+
+    Only the field types used by this app's schemas are supported; a
+    TypeError is raised for anything else.
+    """
+    constants = []
+    lines, items = [], []
+    for index, (name, field) in enumerate(schema.dump_fields.items()):
+        var = f'v{index}'
+        attribute = field.attribute or name
+        if not attribute.isidentifier():
+            raise TypeError(f'Unsupported attribute {attribute!r}')
+        expression = _field_expression(field, var, constants)
+        lines.append(f'    {var} = row.{attribute}')
+        items.append(
+            f'        {field.data_key or name!r}: '
+            f'None if {var} is None else {expression},'
+        )
+
+    source = '\n'.join(
+        ['def encode(row):'] + lines + ['    return {'] + items + ['    }']
+    )
+    namespace = {f'_c{i}': constant for i, constant in enumerate(constants)}
+    exec(compile(source, f'<encoder {schema.__class__.__name__}>', 'exec'), namespace)
+
+    return namespace['encode']
+
+
+class FastSerializer:
+    """Serializes column-only query rows with a precompiled encoder.
+
+    Selecting just the schema's columns skips ORM instance construction and
+    identity-map bookkeeping; the encoder skips marshmallow's per-field
+    dispatch. The output is identical to 'schema.dump'.
+    """
+
+    def __init__(self, schema, model):
+        self.encode = compile_encoder(schema)
+        self.columns = [
+            getattr(model, field.attribute or name)
+            for name, field in schema.dump_fields.items()
+        ]
+
+    def query(self):
+        return db.session.query(*self.columns)
+
+    def dump(self, rows):
+        encode = self.encode
+        return [encode(row) for row in rows]
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """JSON provider that uses orjson when it is installed, producing the
+    same bytes as Flask's default provider.
+    """
+
+    def dumps(self, obj, **kwargs):
+        # orjson only writes compact output; anything else (such as
+        # pretty-printing in debug mode) goes through the standard library
+        if orjson is None or kwargs != {'separators': (',', ':')}:
+            return super().dumps(obj, **kwargs)
+
+        encoded = orjson.dumps(
+            obj,
+            default=self.default,
+            # Dates are left to 'default' to keep Flask's HTTP date format
+            option=orjson.OPT_SORT_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        )
+        # orjson cannot escape non-ASCII text the way 'ensure_ascii' does
+        if not encoded.isascii():
+            return super().dumps(obj, **kwargs)
+
+        return encoded.decode()
+
+
+def fast_serialization_enabled():
+    return current_app.config['FAST_SERIALIZATION']
+
+def init_app(app):
+    app.config.setdefault('FAST_SERIALIZATION', False)
+
+    if app.config['FAST_SERIALIZATION']:
+        app.json = FastJSONProvider(app)
@@ -0,0 +1,258 @@
+from . import db
+from collections import Counter
+from datetime import date, datetime
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import event, inspect
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm.attributes import NO_VALUE
+from .models import User, Task, TaskDailyStat, JobCheckpoint
+
+
+# Rollup day for tasks without a start_time
+UNSCHEDULED_DAY = date(1970, 1, 1)
+# Rollup value for a NULL priority or status
+UNSET = 'Unset'
+
+BACKFILL_JOB = 'stats-backfill'
+
+def rollup_key(user_id, start_time, priority, status):
+    day = start_time.date() if start_time is not None else UNSCHEDULED_DAY
+
+    return user_id, day, priority or UNSET, status or UNSET
+
+# Add 'deltas' ({rollup key: change in count}) to the rollup rows with one
+# upsert, in the session's transaction
+def apply_deltas(session, deltas):
+    rows = [
+        {'user_id': user_id, 'day': day, 'priority': priority, 'status': status, 'task_count': delta}
+        for (user_id, day, priority, status), delta in deltas.items() if delta
+    ]
+    if not rows:
+        return
+
+    table = TaskDailyStat.__table__
+    dialect = session.get_bind().dialect.name
+    if dialect in ('mysql', 'mariadb'):
+        statement = mysql_insert(table).values(rows)
+        statement = statement.on_duplicate_key_update(
+            task_count=table.c.task_count + statement.inserted.task_count
+        )
+    else:
+        insert = postgresql_insert if dialect == 'postgresql' else sqlite_insert
+        statement = insert(table).values(rows)
+        statement = statement.on_conflict_do_update(
+            index_elements=[c.name for c in table.primary_key],
+            set_={'task_count': table.c.task_count + statement.excluded.task_count}
+        )
+    session.execute(statement)
+
+# Rollup key of a task as last loaded from the database
+def _committed_key(task):
+    committed = inspect(task).committed_state
+
+    def old(name):
+        value = committed.get(name, NO_VALUE)
+        return getattr(task, name) if value is NO_VALUE else value
+
+    return rollup_key(old('user_id'), old('start_time'), old('priority'), old('status'))
+
+def update_rollups(session, flush_context, instances):
+    """Before every flush, move the counts of new, changed and deleted
+    tasks between rollup rows.
+    """
+    deltas = Counter()
+    for task in session.new:
+        if isinstance(task, Task):
+            deltas[rollup_key(task.user_id, task.start_time, task.priority, task.status)] += 1
+    for task in session.dirty:
+        if isinstance(task, Task) and session.is_modified(task, include_collections=False):
+            old_key = _committed_key(task)
+            new_key = rollup_key(task.user_id, task.start_time, task.priority, task.status)
+            if old_key != new_key:
+                deltas[old_key] -= 1
+                deltas[new_key] += 1
+    for task in session.deleted:
+        if isinstance(task, Task):
+            deltas[_committed_key(task)] -= 1
+
+    apply_deltas(session, deltas)
+
+# Count rows about to be bulk inserted with 'db.insert', which bypasses the
+# flush hook
+def count_inserted_tasks(rows):
+    apply_deltas(db.session, Counter(
+        rollup_key(row['user_id'], row.get('start_time'), row.get('priority'), row.get('status'))
+        for row in rows
+    ))
+
+    return rows
+
+
+# Lengths of the current and longest runs of consecutive periods
+def _streaks(periods, current_period):
+    longest = run = 0
+    previous = None
+    for period in sorted(periods):
+        run = run + 1 if previous is not None and period == previous + 1 else 1
+        longest = max(longest, run)
+        previous = period
+    # A run that ended last period is still alive until this one is over
+    current = run if previous is not None and previous >= current_period - 1 else 0
+
+    return {'current': current, 'longest': longest}
+
+STREAK_PERIODS = {
+    'day': lambda d: d.toordinal(),
+    'week': lambda d: (d.toordinal() - d.weekday()) // 7,
+    'month': lambda d: d.year * 12 + d.month - 1,
+}
+
+# Rollup counts computed from the tasks table: {rollup key: count}
+def _task_counts(user_ids):
+    day = db.func.date(Task.start_time)
+    counts = Counter()
+    for user_id, task_day, priority, status, count in db.session.execute(
+        db.select(Task.user_id, day, Task.priority, Task.status, db.func.count())
+        .where(Task.user_id.in_(user_ids))
+        .group_by(Task.user_id, day, Task.priority, Task.status)
+    ):
+        # SQLite returns DATE() as text
+        if isinstance(task_day, str):
+            task_day = date.fromisoformat(task_day)
+        counts[(
+            user_id, task_day or UNSCHEDULED_DAY, priority or UNSET, status or UNSET
+        )] += count
+
+    return counts
+
+def user_stats(user_id, day_from=None, day_to=None, today=None, from_rollups=True):
+    """Completion numbers for a user, read from the rollup rows only.
+    'day_from'/'day_to' limit them to scheduled tasks in [day_from, day_to).
+    Without 'from_rollups' (a user not backfilled yet, whose rollups miss
+    their older tasks) they are counted from the tasks table instead.
+    """
+    today = today or datetime.utcnow().date()
+    if from_rollups:
+        query = db.select(
+            TaskDailyStat.day, TaskDailyStat.priority, TaskDailyStat.status,
+            TaskDailyStat.task_count
+        ).where(TaskDailyStat.user_id == user_id, TaskDailyStat.task_count != 0)
+        if day_from is not None:
+            query = query.where(TaskDailyStat.day >= day_from, TaskDailyStat.day != UNSCHEDULED_DAY)
+        if day_to is not None:
+            query = query.where(TaskDailyStat.day < day_to, TaskDailyStat.day != UNSCHEDULED_DAY)
+        rows = db.session.execute(query).all()
+    else:
+        rows = [
+            (day, priority, status, count)
+            for (_, day, priority, status), count in _task_counts([user_id]).items()
+            if day_from is None and day_to is None or (
+                day != UNSCHEDULED_DAY
+                and (day_from is None or day >= day_from)
+                and (day_to is None or day < day_to)
+            )
+        ]
+
+    by_status, by_priority = Counter(), Counter()
+    completed_days = set()
+    for day, priority, status, count in rows:
+        by_status[status] += count
+        by_priority[priority] += count
+        if status == 'Completed' and day != UNSCHEDULED_DAY and day <= today:
+            completed_days.add(day)
+
+    total = sum(by_status.values())
+    completed = by_status['Completed']
+
+    return {
+        'total': total,
+        'completed': completed,
+        'completion_rate': round(completed / total, 4) if total else None,
+        'by_status': dict(by_status),
+        'by_priority': dict(by_priority),
+        'streaks': {
+            name: _streaks({period(d) for d in completed_days}, period(today))
+            for name, period in STREAK_PERIODS.items()
+        },
+    }
+
+
+def backfill_stats(chunk_size, restart=False):
+    """Rebuild the rollups of all users from the tasks table, 'chunk_size'
+    users per transaction. Progress is checkpointed after every chunk, so
+    an interrupted backfill resumes where it stopped. Returns the number of
+    users processed in this run.
+    """
+    checkpoint = db.session.get(JobCheckpoint, BACKFILL_JOB)
+    if checkpoint is None:
+        checkpoint = JobCheckpoint(name=BACKFILL_JOB, position=0)
+        db.session.add(checkpoint)
+    if restart:
+        checkpoint.position = 0
+        checkpoint.completed_at = None
+    if checkpoint.completed_at is not None:
+        return 0
+
+    position = checkpoint.position
+    # Each chunk's transaction must start with the lock below: under
+    # REPEATABLE READ, an earlier read would fix the snapshot the task
+    # counts are taken from before concurrent writers are shut out
+    db.session.commit()
+
+    processed = 0
+    while True:
+        # Lock the chunk's users first, as task writes do (see 'app/sync.py').
+        # A write to their tasks waits until the chunk is rebuilt, so its
+        # rollup delta is neither lost nor counted twice.
+        user_ids = db.session.execute(
+            db.select(User.user_id)
+            .where(User.user_id > position)
+            .order_by(User.user_id)
+            .limit(chunk_size)
+            .with_for_update()
+        ).scalars().all()
+        if not user_ids:
+            checkpoint.completed_at = datetime.utcnow()
+            db.session.commit()
+            return processed
+
+        db.session.execute(
+            db.delete(TaskDailyStat).where(TaskDailyStat.user_id.in_(user_ids))
+        )
+        apply_deltas(db.session, _task_counts(user_ids))
+        db.session.execute(
+            db.update(User)
+            .where(User.user_id.in_(user_ids), User.stats_ready == db.false())
+            .values(stats_ready=True)
+        )
+
+        position = user_ids[-1]
+        checkpoint.position = position
+        checkpoint.updated_at = datetime.utcnow()
+        db.session.commit()
+        processed += len(user_ids)
+        current_app.logger.info('Stats backfill: through user %s', position)
+
+
+@click.command('backfill-stats')
+@click.option('--chunk-size', type=int, default=None, help='Users per transaction.')
+@click.option('--restart', is_flag=True, help='Start over instead of resuming.')
+@with_appcontext
+def backfill_stats_command(chunk_size, restart):
+    """Build task statistics rollups from existing tasks."""
+    processed = backfill_stats(
+        chunk_size or current_app.config['STATS_BACKFILL_CHUNK_SIZE'], restart=restart
+    )
+    click.echo(f'Rebuilt statistics for {processed} users')
+
+
+def init_app(app):
+    app.config.setdefault('STATS_BACKFILL_CHUNK_SIZE', 500)
+
+    if not event.contains(db.session, 'before_flush', update_rollups):
+        event.listen(db.session, 'before_flush', update_rollups)
+    app.cli.add_command(backfill_stats_command)
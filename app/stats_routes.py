@@ -0,0 +1,33 @@
+from flask import Blueprint, g, jsonify, request
+from .auth import login_required
+from datetime import date
+from .stats import user_stats
+
+
+# Create a Blueprint for the stats routes
+stats_bp = Blueprint('stats', __name__)
+
+def _parse_day_arg(name):
+    value = request.args.get(name)
+    if value is None:
+        return None
+
+    return date.fromisoformat(value)
+
+# Route for the logged-in user's task completion statistics: totals, counts
+# by status and priority, and day/week/month completion streaks
+# (Optional: from, to as YYYY-MM-DD dates; 'to' is exclusive and a range
+# leaves out unscheduled tasks)
+@stats_bp.route('/stats', methods=['GET'])
+@login_required
+def get_stats():
+    try:
+        day_from, day_to = _parse_day_arg('from'), _parse_day_arg('to')
+    except ValueError:
+        return jsonify({'error': "'from' and 'to' must be YYYY-MM-DD dates"}), 400
+    if day_from is not None and day_to is not None and day_to <= day_from:
+        return jsonify({'error': "'to' must be after 'from'"}), 400
+
+    stats = user_stats(g.user.user_id, day_from, day_to, from_rollups=g.user.stats_ready)
+
+    return jsonify(stats), 200
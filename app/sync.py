@@ -0,0 +1,150 @@
+from . import db
+import base64
+from collections import defaultdict
+from datetime import datetime
+from itertools import groupby
+import json
+from sqlalchemy import event
+from .models import User, Task, Reminder, SyncTombstone
+
+
+SYNCED_MODELS = (Task, Reminder)
+
+
+class SyncTokenError(ValueError):
+    pass
+
+
+# Tokens are opaque to clients: base64 of the position of the last change
+# they have seen, [version, kind, id]. Rows written before versioning all
+# have version 0, so the version alone cannot mark a place among them.
+# Tokens holding only [version] (as issued before) are still accepted.
+def encode_sync_token(version, kind=None, row_id=None):
+    position = [version] if kind is None else [version, kind, row_id]
+    raw = json.dumps(position, separators=(',', ':'))
+
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+# The (version, kind, id) of a token; kind and id are None in old tokens
+def decode_sync_token(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        position = json.loads(base64.urlsafe_b64decode(padded))
+        if not isinstance(position, list) or len(position) not in (1, 3):
+            raise ValueError
+        if len(position) == 1:
+            return int(position[0]), None, None
+        return tuple(int(value) for value in position)
+    except (ValueError, TypeError):
+        raise SyncTokenError('Invalid sync token')
+
+def allocate_versions(session, user_id, count):
+    """Reserve 'count' consecutive versions in a user's change feed and
+    return the first.
+
+    The UPDATE locks the user's row until the transaction ends, so writers
+    for the same user commit in version order and a client never sees a
+    version appear below one it has already synced past.
+    """
+    users = User.__table__
+    session.execute(
+        users.update()
+        .where(users.c.user_id == user_id)
+        .values(sync_version=users.c.sync_version + count)
+    )
+    last = session.execute(
+        db.select(users.c.sync_version).where(users.c.user_id == user_id)
+    ).scalar_one()
+
+    return last - count + 1
+
+# Stamp rows about to be bulk inserted with 'db.insert', which bypasses the
+# flush hook below. All rows must belong to 'user_id'.
+def stamp_rows(user_id, rows):
+    version = allocate_versions(db.session, user_id, len(rows))
+    now = datetime.utcnow()
+    for offset, row in enumerate(rows):
+        row['version'] = version + offset
+        row['updated_at'] = now
+
+    return rows
+
+# Give rows changed by a bulk UPDATE new versions, user by user
+def touch_rows(model, id_column, ids):
+    rows = db.session.execute(
+        db.select(model.user_id, id_column)
+        .where(id_column.in_(ids))
+        .order_by(model.user_id, id_column)
+    ).all()
+    now = datetime.utcnow()
+    for user_id, user_rows in groupby(rows, key=lambda row: row[0]):
+        user_rows = list(user_rows)
+        version = allocate_versions(db.session, user_id, len(user_rows))
+        db.session.execute(
+            db.update(model),
+            [
+                {id_column.key: row_id, 'version': version + offset, 'updated_at': now}
+                for offset, (_, row_id) in enumerate(user_rows)
+            ]
+        )
+
+# Tombstones for everything a flush deletes, including the reminders of
+# deleted tasks, which the database cascade removes without the ORM knowing
+def _deleted_entities(session):
+    deleted = {}
+    task_owners = {}
+    for obj in session.deleted:
+        if isinstance(obj, Task):
+            deleted[('task', obj.task_id)] = obj.user_id
+            task_owners[obj.task_id] = obj.user_id
+        elif isinstance(obj, Reminder):
+            deleted[('reminder', obj.reminder_id)] = obj.user_id
+
+    if task_owners:
+        cascaded = session.execute(
+            db.select(Reminder.reminder_id, Reminder.user_id)
+            .where(Reminder.task_id.in_(list(task_owners)))
+        ).all()
+        for reminder_id, user_id in cascaded:
+            deleted[('reminder', reminder_id)] = user_id
+
+    return deleted
+
+def stamp_versions(session, flush_context, instances):
+    """Before every flush, give each new, changed or deleted task and
+    reminder the next version in its owner's change feed.
+    """
+    changed = defaultdict(list)
+    for obj in session.new:
+        if isinstance(obj, SYNCED_MODELS):
+            changed[obj.user_id].append(obj)
+    for obj in session.dirty:
+        if isinstance(obj, SYNCED_MODELS) and session.is_modified(obj, include_collections=False):
+            changed[obj.user_id].append(obj)
+
+    deleted = defaultdict(list)
+    for (entity, entity_id), user_id in _deleted_entities(session).items():
+        deleted[user_id].append((entity, entity_id))
+
+    now = datetime.utcnow()
+    # Lock users in a fixed order so concurrent flushes cannot deadlock
+    for user_id in sorted(set(changed) | set(deleted), key=lambda u: (u is None, u)):
+        if user_id is None:
+            continue  # No owner yet; the NOT NULL constraint will reject it
+        objects, tombstones = changed[user_id], deleted[user_id]
+        version = allocate_versions(session, user_id, len(objects) + len(tombstones))
+        for obj in objects:
+            obj.version = version
+            obj.updated_at = now
+            version += 1
+        for entity, entity_id in sorted(tombstones):
+            session.add(SyncTombstone(
+                user_id=user_id, entity=entity, entity_id=entity_id,
+                version=version, deleted_at=now
+            ))
+            version += 1
+
+
+def init_app(app):
+    if not event.contains(db.session, 'before_flush', stamp_versions):
+        event.listen(db.session, 'before_flush', stamp_versions)
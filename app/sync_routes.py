@@ -0,0 +1,98 @@
+from flask import Blueprint, g, jsonify, request
+from . import db
+from .auth import login_required
+import heapq
+from .models import Task, Reminder, SyncTombstone
+from .pagination import PaginationError, parse_limit
+from .reminder_routes import reminder_serializer, reminders_schema
+from .serializers import fast_serialization_enabled
+from .sync import decode_sync_token, encode_sync_token, SyncTokenError
+from .task_routes import task_serializer, tasks_schema
+
+
+# Create a Blueprint for the sync routes
+sync_bp = Blueprint('sync', __name__)
+
+# Changes are ordered by (version, kind, ID). Rows written before versioning
+# all have version 0, so the kind and ID break ties between them.
+CHANGE_KINDS = ('task', 'reminder', 'deleted')
+
+# Up to 'limit' + 1 of the user's rows after the position 'since' (all rows
+# when 'since' is None), in (version, ID) order
+def _changed_since(query, model, id_column, kind, user_id, since, limit):
+    query = query.filter(model.user_id == user_id)
+    if since is not None:
+        version, after_kind, after_id = since
+        rank = CHANGE_KINDS.index(kind)
+        if after_kind is None or rank < after_kind:
+            query = query.filter(model.version > version)
+        elif rank == after_kind:
+            query = query.filter(db.or_(
+                model.version > version,
+                db.and_(model.version == version, id_column > after_id)
+            ))
+        else:
+            query = query.filter(model.version >= version)
+
+    return query.order_by(model.version, id_column).limit(limit + 1).all()
+
+# Route for fetching what changed since the client's last sync
+# (Without 'since' the whole dataset is returned, one page at a time; keep
+# calling with the returned 'next_token' while 'has_more' is true.)
+@sync_bp.route('/sync', methods=['GET'])
+@login_required
+def get_changes():
+    user_id = g.user.user_id
+    try:
+        since = request.args.get('since')
+        since = decode_sync_token(since) if since else None
+        limit = parse_limit(request.args)
+    except (PaginationError, SyncTokenError) as e:
+        return jsonify({'error': str(e)}), 400
+
+    if fast_serialization_enabled():
+        task_query, dump_tasks = task_serializer.query(), task_serializer.dump
+        reminder_query, dump_reminders = reminder_serializer.query(), reminder_serializer.dump
+    else:
+        task_query, dump_tasks = Task.query, tasks_schema.dump
+        reminder_query, dump_reminders = Reminder.query, reminders_schema.dump
+
+    tasks = _changed_since(task_query, Task, Task.task_id, 'task', user_id, since, limit)
+    reminders = _changed_since(
+        reminder_query, Reminder, Reminder.reminder_id, 'reminder', user_id, since, limit
+    )
+    # A full sync starts from an empty client, so past deletes are irrelevant
+    tombstones = [] if since is None else _changed_since(
+        db.session.query(
+            SyncTombstone.tombstone_id, SyncTombstone.entity,
+            SyncTombstone.entity_id, SyncTombstone.version
+        ),
+        SyncTombstone, SyncTombstone.tombstone_id, 'deleted', user_id, since, limit
+    )
+
+    # All three share the user's version sequence; keep the first 'limit'
+    changes = list(heapq.merge(
+        ((row.version, 0, row.task_id, row) for row in tasks),
+        ((row.version, 1, row.reminder_id, row) for row in reminders),
+        ((row.version, 2, row.tombstone_id, row) for row in tombstones),
+        key=lambda change: change[:3]
+    ))
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+
+    changed = {kind: [] for kind in CHANGE_KINDS}
+    for _, rank, _, row in changes:
+        changed[CHANGE_KINDS[rank]].append(row)
+
+    return jsonify({
+        'tasks': dump_tasks(changed['task']),
+        'reminders': dump_reminders(changed['reminder']),
+        'deleted': [
+            {'type': row.entity, 'id': row.entity_id}
+            for row in changed['deleted']
+        ],
+        'next_token': encode_sync_token(
+            *(changes[-1][:3] if changes else since or (0,))
+        ),
+        'has_more': has_more,
+    }), 200
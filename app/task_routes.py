@@ -1,88 +1,281 @@
-from flask import Blueprint, jsonify, request
+from flask import abort, Blueprint, current_app, g, jsonify, request
 from . import db
+from .auth import login_required
+from .conflicts import as_utc_datetime, CONFLICT_MODES, find_conflicts, get_interval_index, occurrence_dict, with_utc_task_times
+from datetime import datetime, timedelta
+from .conditional import etag_headers, not_modified, precondition_failed, resource_etag, user_list_etag, user_sync_version
+from .hot_cache import cached_entry, cached_payload, get_hot_cache
+from .bulk import load_chunk, read_ndjson_chunks
 from .models import Task
+from .occurrences import schedule_task, SCHEDULE_FIELDS
+from .recurrence import is_recurring, MAX_RANGE_DAYS
+from .pagination import decode_offset_cursor, encode_cursor, keyset_page, PaginationError, parse_datetime_arg, parse_limit
 from .schemas import TaskSchema
+from .search import search_tasks, SearchError
+from .serializers import fast_serialization_enabled, FastSerializer
+from .stats import count_inserted_tasks
+from .sync import stamp_rows
 
 
 task_schema = TaskSchema()
 tasks_schema = TaskSchema(many=True)
+task_serializer = FastSerializer(task_schema, Task)
 
 # Create a Blueprint for the user routes
 task_bp = Blueprint('tasks', __name__)
 
-# Helper function to fetch a task by ID, or return 404
+# Helper function to fetch one of the logged-in user's tasks by ID, or return 404
 def get_task(task_id):
-    task = Task.query.filter_by(task_id=task_id)\
+    task = Task.query.filter_by(task_id=task_id, user_id=g.user.user_id)\
                 .first_or_404(description=f'Task with ID {task_id} not found')
 
     return task
 
+# Look up overlaps for a task about to be written, according to the
+# '?conflicts=' argument or TASK_CONFLICTS. Returns the conflicts and, when
+# the write must not go ahead, an error response.
+def check_conflicts(start_time, end_time, recurrence, exclude_task_id=None):
+    mode = request.args.get('conflicts', current_app.config['TASK_CONFLICTS'])
+    if mode not in CONFLICT_MODES:
+        error = f"'conflicts' must be one of {', '.join(CONFLICT_MODES)}"
+        return None, (jsonify({'error': error}), 400)
+    if mode == 'ignore':
+        return None, None
+
+    # Keep the session out of it: an autoflush here would write the task
+    with db.session.no_autoflush:
+        conflicts = find_conflicts(
+            g.user.user_id, start_time, end_time, recurrence, exclude_task_id
+        )
+    if conflicts and mode == 'reject':
+        return conflicts, (jsonify({
+            'error': 'Task overlaps existing tasks', 'conflicts': conflicts
+        }), 409)
+
+    return conflicts, None
+
+def with_conflicts(body, conflicts):
+    if conflicts is not None:
+        body['conflicts'] = conflicts
+
+    return body
+
 # Route for creating a new task
 @task_bp.route('/tasks', methods=['POST'])
+@login_required
 def create_task():
     data = request.json
     # Ensure every task has a title
     if 'title' not in data:
         return jsonify({'message': 'Missing title'}), 400
 
+    # Times are stored as naive UTC, the form conflict checks compare
+    try:
+        start_time = as_utc_datetime(data.get('start_time'))
+        end_time = as_utc_datetime(data.get('end_time'))
+        reminder_time = as_utc_datetime(data.get('reminder_time'))
+    except (TypeError, ValueError):
+        return jsonify({'message': 'Invalid start_time, end_time or reminder_time'}), 400
+
+    conflicts, error = check_conflicts(start_time, end_time, data.get('recurrence'))
+    if error:
+        return error
+
     try:
         new_task = Task(
+            user_id=g.user.user_id,
             title=data['title'],
             # The rest columns are nullable
             description=data.get('description', None),
-            start_time=data.get('start_time', None),
-            end_time=data.get('end_time', None),
+            start_time=start_time,
+            end_time=end_time,
             location=data.get('location', None),
             priority=data.get('priority', None),
             status=data.get('status', None),
             recurrence=data.get('recurrence', None),
-            reminder_time=data.get('reminder_time', None)
+            reminder_time=reminder_time
         )
 
         db.session.add(new_task)
+        if is_recurring(new_task.recurrence):
+            db.session.flush()  # Assign the task ID for its occurrences
+            schedule_task(new_task)
         db.session.commit()
 
-        return jsonify(task_schema.dump(new_task)), 201
+        return jsonify(with_conflicts(task_schema.dump(new_task), conflicts)), 201
     except Exception as e:
         db.session.rollback()
         return jsonify({'message': 'Failed to create task', 'error': str(e)}), 500
 
+# Route for importing many tasks for the logged-in user from NDJSON
+# (One task object per line; each chunk is validated and committed together)
+@task_bp.route('/tasks/bulk', methods=['POST'])
+@login_required
+def create_tasks_bulk():
+    user = g.user
+
+    inserted, errors = 0, []
+    for chunk in read_ndjson_chunks(request.stream):
+        rows, chunk_errors = load_chunk(task_schema, chunk)
+        errors.extend(chunk_errors)
+        if not rows:
+            continue
+
+        try:
+            values = [dict(with_utc_task_times(data), user_id=user.user_id) for _, data in rows]
+            db.session.execute(
+                db.insert(Task), count_inserted_tasks(stamp_rows(user.user_id, values))
+            )
+            db.session.commit()
+            inserted += len(rows)
+        except Exception as e:
+            db.session.rollback()
+            errors.append({'lines': [line for line, _ in rows], 'error': str(e)})
+
+    return jsonify({'inserted': inserted, 'errors': errors}), 200
+
+# Route for listing every pair of the logged-in user's overlapping tasks,
+# recurring occurrences included
+# (Optional: from, to as ISO 8601 datetimes; defaults to the coming
+# CONFLICT_HORIZON_DAYS)
+@task_bp.route('/tasks/conflicts', methods=['GET'])
+@login_required
+def get_task_conflicts():
+    try:
+        window_start = parse_datetime_arg(request.args, 'from') or datetime.utcnow()
+        window_end = parse_datetime_arg(request.args, 'to') or window_start + timedelta(
+            days=current_app.config['CONFLICT_HORIZON_DAYS']
+        )
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+    if window_end <= window_start:
+        return jsonify({'error': "'to' must be after 'from'"}), 400
+    if window_end - window_start > timedelta(days=MAX_RANGE_DAYS):
+        return jsonify({'error': f'Range cannot exceed {MAX_RANGE_DAYS} days'}), 400
+
+    index = get_interval_index(g.user.user_id)
+    conflicts = [
+        {'first': occurrence_dict(*first), 'second': occurrence_dict(*second)}
+        for first, second in index.conflicts(window_start, window_end)
+    ]
+
+    return jsonify({'conflicts': conflicts}), 200
+
+# Route for full-text search over the logged-in user's task titles,
+# descriptions and locations, best match first
+# (Query parameters: q, plus limit and cursor for paging)
+@task_bp.route('/tasks/search', methods=['GET'])
+@login_required
+def search_user_tasks():
+    try:
+        limit = parse_limit(request.args)
+        cursor = request.args.get('cursor')
+        offset = decode_offset_cursor(cursor) if cursor else 0
+        tasks, has_more = search_tasks(g.user.user_id, request.args.get('q'), offset, limit)
+    except (PaginationError, SearchError) as e:
+        return jsonify({'error': str(e)}), 400
+
+    next_cursor = encode_cursor(None, offset + len(tasks)) if has_more else None
+
+    return jsonify({'tasks': tasks_schema.dump(tasks), 'next_cursor': next_cursor}), 200
+
 # Route for querying a specific task by ID
 @task_bp.route('/tasks/<int:task_id>', methods=['GET'])
+@login_required
 def get_task_by_id(task_id):
-    task = get_task(task_id)
+    user_id = g.user.user_id
+    key = f'task:{task_id}'
+
+    # The serialized task comes from the hot cache when it has it. Otherwise
+    # only the columns the ETag needs are read, and the task is loaded and
+    # serialized only if the client's copy is out of date.
+    sync_version = user_sync_version(user_id) if get_hot_cache() else None
+    task = cached_entry(user_id, key, sync_version)
+    if task is None:
+        row = db.session.execute(
+            db.select(Task.version, Task.updated_at)
+            .filter_by(task_id=task_id, user_id=user_id)
+        ).first()
+        if row is None:
+            abort(404, description=f'Task with ID {task_id} not found')
+
+        cached = not_modified(resource_etag('task', task_id, row.version), row.updated_at)
+        if cached:
+            return cached
 
-    return jsonify(task_schema.dump(task)), 200
+        task = cached_payload(
+            user_id, key, lambda: task_schema.dump(get_task(task_id)), sync_version
+        )
+    updated_at = datetime.fromisoformat(task['updated_at'])
+
+    etag = resource_etag('task', task['task_id'], task['version'])
+    cached = not_modified(etag, updated_at)
+    if cached:
+        return cached
+
+    return jsonify(task), 200, etag_headers(etag, updated_at)
 
 # Route for updating a task
 @task_bp.route('/tasks/<int:task_id>', methods=['PUT'])
+@login_required
 def update_task(task_id):
     task = get_task(task_id)
 
+    # Optimistic concurrency: the client's 'If-Match' must be the current ETag
+    failed = precondition_failed(resource_etag('task', task.task_id, task.version))
+    if failed:
+        return failed
+
     data = request.json
+    try:
+        start_time = as_utc_datetime(data.get('start_time', task.start_time))
+        end_time = as_utc_datetime(data.get('end_time', task.end_time))
+        reminder_time = as_utc_datetime(data.get('reminder_time', task.reminder_time))
+    except (TypeError, ValueError):
+        return jsonify({'message': 'Invalid start_time, end_time or reminder_time'}), 400
+
+    schedule = {field: getattr(task, field) for field in SCHEDULE_FIELDS}
     task.title = data.get('title', task.title)
     task.description = data.get('description', task.description)
-    task.start_time = data.get('start_time', task.start_time)
-    task.end_time = data.get('end_time', task.end_time)
+    task.start_time = start_time
+    task.end_time = end_time
     task.location = data.get('location', task.location)
     task.priority = data.get('priority', task.priority)
     task.status = data.get('status', task.status)
     task.recurrence = data.get('recurrence', task.recurrence)
-    task.reminder_time = data.get('reminder_time', task.reminder_time)
+    task.reminder_time = reminder_time
+
+    conflicts, error = check_conflicts(
+        task.start_time, task.end_time, task.recurrence, exclude_task_id=task.task_id
+    )
+    if error:
+        db.session.rollback()
+        return error
 
     try:
+        # Only the future occurrences of the edited task are regenerated
+        if schedule != {field: getattr(task, field) for field in SCHEDULE_FIELDS}:
+            db.session.flush()
+            schedule_task(task)
         db.session.commit()
 
-        return jsonify(task_schema.dump(task)), 200
+        etag = resource_etag('task', task.task_id, task.version)
+        body = with_conflicts(task_schema.dump(task), conflicts)
+        return jsonify(body), 200, etag_headers(etag, task.updated_at)
     except Exception as e:
         db.session.rollback()
         return jsonify({'message': 'Failed to update task', 'error': str(e)}), 500
 
 # Route for deleting a task
 @task_bp.route('/tasks/<int:task_id>', methods=['DELETE'])
+@login_required
 def delete_task(task_id):
     task = get_task(task_id)
 
+    failed = precondition_failed(resource_etag('task', task.task_id, task.version))
+    if failed:
+        return failed
+
     try:
         db.session.delete(task)
         db.session.commit()
@@ -92,10 +285,45 @@ def delete_task(task_id):
         db.session.rollback()
         return jsonify({'message': 'Failed to delete task', 'error': str(e)}), 500
 
-# Route for querying all tasks of a user
+# Route for querying the tasks of a user, one page at a time
+# (Optional filters: status, priority, from/to on start_time)
 @task_bp.route('/tasks/user/<int:user_id>', methods=['GET'])
+@login_required
 def get_tasks_by_user(user_id):
-    # Get the user's ID from the URL path and query their tasks
-    tasks = Task.query.filter_by(user_id=user_id).all()
+    # Users may only list their own tasks
+    if user_id != g.user.user_id:
+        return jsonify({'error': 'Not allowed to view tasks of another user'}), 403
+
+    etag = user_list_etag('tasks', user_id)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    # Column-only rows and a precompiled encoder when fast serialization is on
+    if fast_serialization_enabled():
+        query, dump = task_serializer.query(), task_serializer.dump
+    else:
+        query, dump = Task.query, tasks_schema.dump
+    query = query.filter_by(user_id=user_id)
+
+    try:
+        if 'status' in request.args:
+            query = query.filter_by(status=request.args['status'])
+        if 'priority' in request.args:
+            query = query.filter_by(priority=request.args['priority'])
+        start_from = parse_datetime_arg(request.args, 'from')
+        if start_from is not None:
+            query = query.filter(Task.start_time >= start_from)
+        start_to = parse_datetime_arg(request.args, 'to')
+        if start_to is not None:
+            query = query.filter(Task.start_time < start_to)
+
+        tasks, next_cursor = keyset_page(
+            query, Task.start_time, Task.task_id,
+            cursor=request.args.get('cursor'),
+            limit=parse_limit(request.args)
+        )
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
 
-    return jsonify(tasks_schema.dump(tasks)), 200
+    return jsonify({'tasks': dump(tasks), 'next_cursor': next_cursor}), 200, etag_headers(etag)
@@ -1,26 +1,46 @@
-from flask import Blueprint, jsonify, request, session
+from flask import Blueprint, g, jsonify, request, Response, session, stream_with_context
 from . import db
-from .models import User
-from .schemas import UserSchema
-from werkzeug.security import check_password_hash, generate_password_hash
+from .archive import ARCHIVED_COLUMNS, reminder_history
+from .auth import get_current_user_model, invalidate_user, login_required
+from .bulk import load_chunk, ndjson_line, read_ndjson_chunks
+from .conditional import etag_headers, not_modified, value_etag
+from .conflicts import as_utc_datetime, with_utc_task_times
+from .models import User, Task, Reminder
+from .passwords import get_password_hasher, hash_password, PasswordPoolBusy
+from .purge import schedule_user_deletion
+from marshmallow import ValidationError
+import pytz
+from .schemas import UserSchema, TaskSchema, ReminderSchema
+from sqlalchemy.exc import IntegrityError
+from .sync import stamp_rows
 
 
 user_schema = UserSchema()
+task_schema = TaskSchema()
+reminder_schema = ReminderSchema()
+# Loads exported reminders, whose times may be in the past
+restore_reminder_schema = ReminderSchema(context={'restore': True})
+
+# Rows fetched per round-trip while exporting
+EXPORT_BATCH_SIZE = 1000
 
 # Create a Blueprint for the user routes
 user_bp = Blueprint('users', __name__)
 
-# Helper function to verify if the user exists and is logged in
-def verify_user():
-    user_id = session.get('user_id') # Fetch the logged-in user's ID
-    if not user_id:
-        return None, jsonify({'error': 'User not logged in'}), 401
-
-    user = User.query.get(user_id)
-    if not user:
-        return None, jsonify({'error': 'User not found'}), 404
+# Error for whichever of the email and username is already registered, in
+# one query; None if both are free
+def _taken_error(email, username):
+    taken = db.session.execute(
+        db.select(User.email, User.username)
+        .where(db.or_(User.email == email, User.username == username))
+        .limit(2)
+    ).all()
+    if any(row.email.lower() == email.lower() for row in taken):
+        return {'error': 'Email already in use'}
+    if taken:
+        return {'error': 'Username already taken'}
 
-    return user, None, None  # Return user, response, and status code
+    return None
 
 # Create a new user
 @user_bp.route('/users', methods=['POST'])
@@ -29,21 +49,20 @@ def create_user():
     # Ensure required fields are added
     if 'username' not in data or 'email' not in data or 'password' not in data:
         return jsonify({'error': 'Missing required fields-username, email or password'}), 400
-    
-    if User.query.filter_by(email=data.get('email')).first():
-        return jsonify({'error': 'Email already in use'}), 400
-
-    if User.query.filter_by(username=data.get('username')).first():
-        return jsonify({'error': 'Username already taken'}), 400
 
     if len(data.get('password')) < 8:
         return jsonify({'error': 'Password should be at least 8 characters long'}), 400
 
+    # Checked before hashing, so taken names never cost a hash
+    taken = _taken_error(data.get('email'), data.get('username'))
+    if taken:
+        return jsonify(taken), 400
+
     try:
         new_user = User(
             username=data.get('username'),
             email=data.get('email'),
-            password=generate_password_hash(data.get('password')),
+            password=hash_password(data.get('password')),
             notification_preference=data.get('notification_preference', None) # Because it is nullable
         )
 
@@ -51,26 +70,36 @@ def create_user():
         db.session.commit()
 
         return jsonify({'message': 'User created successfully'}), 201
+    except PasswordPoolBusy as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
+    except IntegrityError:
+        # Another signup took the email or username since the check
+        db.session.rollback()
+        taken = _taken_error(data.get('email'), data.get('username'))
+        return jsonify(taken or {'error': 'Email or username already in use'}), 400
     except Exception as e:
         db.session.rollback()
         return jsonify({'message': 'Failed to create user', 'error': str(e)}), 500
 
 # Get the logged-in user's profile details
 @user_bp.route('/users', methods=['GET'])
+@login_required
 def get_user_profile():
-    user, error_response, status_code = verify_user() # Verify user's existence and login before action
-    if error_response:
-        return error_response, status_code
+    # The profile is served from the cached user record, so its ETag is too
+    etag = value_etag('user', g.user)
+    cached = not_modified(etag)
+    if cached:
+        return cached
 
-    return jsonify(user_schema.dump(user)), 200
+    return jsonify(user_schema.dump(g.user)), 200, etag_headers(etag)
     
 # Update the logged-in user's details
 # (Password isn't updated here. Check the next route)
 @user_bp.route('/users', methods=['PUT'])
+@login_required
 def update_user():
-    user, error_response, status_code = verify_user()
-    if error_response:
-        return error_response, status_code
+    user = get_current_user_model()
 
     data = request.json
     # Update user details from request body
@@ -83,6 +112,7 @@ def update_user():
 
     try:
         db.session.commit()
+        invalidate_user(user.user_id)
 
         return jsonify({'message': 'User updated successfully'}), 200
     except Exception as e:
@@ -92,10 +122,9 @@ def update_user():
 # Update the logged-in user's password
 # (Was separated because it needs more checks)
 @user_bp.route('/users/password', methods=['PUT'])
+@login_required
 def update_password():
-    user, error_response, status_code = verify_user()
-    if error_response:
-        return error_response, status_code
+    user = get_current_user_model()
 
     data = request.json
     if 'current_password' not in data:
@@ -105,17 +134,23 @@ def update_password():
     current_password = data.get('current_password')
     new_password = data.get('new_password')
 
-    # Verify the current password
-    if not check_password_hash(user.password, current_password):
-        return jsonify({'error': 'Current password is incorrect'}), 401
-    
-    if len(data.get('new_password')) < 8:
+    if len(new_password) < 8:
         return jsonify({'error': 'Password should be at least 8 characters long'}), 400
 
-    # Hash and update the new password
-    user.password = generate_password_hash(new_password)
+    try:
+        # Verify the current password and hash the new one in one pool call
+        new_hash = get_password_hasher().verify_and_hash(
+            user.password, current_password, new_password
+        )
+    except PasswordPoolBusy as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
+    if new_hash is None:
+        return jsonify({'error': 'Current password is incorrect'}), 401
+
+    user.password = new_hash
     try:
         db.session.commit()
+        invalidate_user(user.user_id)
 
         return jsonify({'message': 'Password updated successfully'}), 200
     except Exception as e:
@@ -124,10 +159,9 @@ def update_password():
 
 # Delete the logged-in user's account
 @user_bp.route('/users', methods=['DELETE'])
+@login_required
 def delete_user():
-    user, error_response, status_code = verify_user()
-    if error_response:
-        return error_response, status_code
+    user = get_current_user_model()
     
     # Retrieve the confirmation flag from the request body
     confirm_delete = request.json.get('confirm_delete', False)
@@ -137,13 +171,119 @@ def delete_user():
         return jsonify({'error': 'Account deletion not confirmed'}), 400
 
     try:
-        # Delete the user and their associated tasks and reminders
-        db.session.delete(user)
+        # Mark the user as deleted; their tasks and reminders are removed in
+        # the background by 'flask purge-users'
+        schedule_user_deletion(user)
         db.session.commit()
+        invalidate_user(user.user_id)
 
         session.clear()  # Clear the user's session after deletion
 
-        return jsonify({'message': 'User deleted successfully'}), 200
+        return jsonify({'message': 'User deletion scheduled'}), 202
     except Exception as e:
         db.session.rollback()
         return jsonify({'message': 'Failed to delete user', 'error': str(e)}), 500
+
+# Export the logged-in user's tasks and reminders, archived ones included,
+# as NDJSON
+# (Rows are streamed from a server-side cursor, so memory use stays flat)
+@user_bp.route('/export', methods=['GET'])
+@login_required
+def export_user_data():
+    user_id = g.user.user_id
+
+    def generate():
+        tasks = db.session.execute(
+            db.select(Task).where(Task.user_id == user_id)
+            .order_by(Task.task_id)
+            .execution_options(yield_per=EXPORT_BATCH_SIZE)
+        ).scalars()
+        for task in tasks:
+            yield ndjson_line(dict(task_schema.dump(task), type='task'))
+
+        # Archived reminders too, so backups keep the whole history
+        history = reminder_history(ARCHIVED_COLUMNS, lambda model: [model.user_id == user_id])
+        reminders = db.session.execute(
+            db.select(history)
+            .order_by(history.c.reminder_id)
+            .execution_options(yield_per=EXPORT_BATCH_SIZE)
+        )
+        for reminder in reminders:
+            yield ndjson_line(_export_reminder(reminder))
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+# Dump a reminder in the format 'POST /api/import' loads: the schema's load
+# format needs the UTC offset, which naive times are dumped without
+def _export_reminder(reminder):
+    record = reminder_schema.dump(reminder)
+    record['reminder_time'] = pytz.utc.localize(reminder.reminder_time).strftime(
+        reminder_schema.fields['reminder_time'].format
+    )
+    record['type'] = 'reminder'
+
+    return record
+
+# Restore tasks and reminders from the NDJSON of 'GET /api/export'
+# (Tasks get new IDs, and reminders are attached to the new IDs of their
+# tasks, so the tasks must come first, as they do in an export. Each chunk
+# is committed together; past reminders are kept as they are.)
+@user_bp.route('/import', methods=['POST'])
+@login_required
+def import_user_data():
+    user_id = g.user.user_id
+
+    task_ids = {}  # Exported task ID -> imported task ID
+    inserted = {'tasks': 0, 'reminders': 0}
+    errors = []
+    for chunk in read_ndjson_chunks(request.stream):
+        records = dict(chunk)
+        task_lines, reminder_lines = [], []
+        for line_number, record in chunk:
+            kind = None if isinstance(record, ValidationError) else record.get('type')
+            if kind == 'reminder':
+                reminder_lines.append((line_number, record))
+            elif kind == 'task' or isinstance(record, ValidationError):
+                task_lines.append((line_number, record))
+            else:
+                errors.append({'line': line_number, 'error': "'type' must be 'task' or 'reminder'"})
+        task_rows, task_errors = load_chunk(task_schema, task_lines)
+        reminder_rows, reminder_errors = load_chunk(restore_reminder_schema, reminder_lines)
+        errors.extend(task_errors + reminder_errors)
+
+        try:
+            # Added through the session for their new IDs
+            tasks = []
+            for line_number, data in task_rows:
+                task = Task(user_id=user_id, **with_utc_task_times(data))
+                db.session.add(task)
+                tasks.append((records[line_number].get('task_id'), task))
+            db.session.flush()
+            chunk_task_ids = {old_id: task.task_id for old_id, task in tasks if old_id is not None}
+
+            values = []
+            for line_number, data in reminder_rows:
+                task_id = chunk_task_ids.get(data['task_id'], task_ids.get(data['task_id']))
+                if task_id is None:
+                    errors.append({'line': line_number, 'error': 'Task not found in the import'})
+                    continue
+                values.append({
+                    'task_id': task_id,
+                    'user_id': user_id,
+                    'reminder_time': as_utc_datetime(data['reminder_time']),
+                    'sent': data.get('sent', False),
+                    'sent_time': as_utc_datetime(data.get('sent_time')),
+                })
+            if values:
+                db.session.execute(db.insert(Reminder), stamp_rows(user_id, values))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            errors.append({'lines': [line for line, _ in task_rows + reminder_rows], 'error': str(e)})
+            continue
+
+        task_ids.update(chunk_task_ids)
+        inserted['tasks'] += len(tasks)
+        inserted['reminders'] += len(values)
+
+    return jsonify({'inserted': inserted, 'errors': errors}), 200
@@ -0,0 +1,180 @@
+"""Load-test the API with concurrent clients and report latency percentiles.
+
+Builds the app with create_app() against a throwaway database (a temporary
+SQLite file unless --database-url is given), seeds it, then drives each
+endpoint with --clients concurrent test clients. Per-endpoint p50/p95/p99
+latency and requests/sec are printed and written to a JSON file; pass
+--baseline with an earlier file to flag regressions. --hot-cache picks the
+backend of the task/reminder read cache: 'local' (the default), 'loopback'
+(an external cache stand-in, with --cache-latency per call) or 'off'.
+
+    python -m bench.api_load --users 20 --tasks-per-user 500 --clients 8
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from app import db
+from app.cache import LoopbackBackend
+from app.models import Task
+from bench.common import make_app, seed, summarize, write_results
+
+
+def _window():
+    start = datetime.utcnow() + timedelta(days=1)
+    return {'from': start.isoformat(), 'to': (start + timedelta(days=7)).isoformat()}
+
+# (name, method, build(ctx) -> (path, kwargs)). 'ctx' holds the client's
+# user ID and a few of their task IDs.
+SCENARIOS = [
+    ('GET /users', 'get', lambda ctx: ('/api/users', {})),
+    ('GET /tasks/user/<id>', 'get', lambda ctx: (
+        f"/api/tasks/user/{ctx['user_id']}", {'query_string': {'limit': 50}}
+    )),
+    ('GET /tasks/<id>', 'get', lambda ctx: (
+        f"/api/tasks/{random.choice(ctx['task_ids'])}", {}
+    )),
+    ('POST /tasks', 'post', lambda ctx: ('/api/tasks', {'json': {
+        'title': 'Load test', 'priority': 'Low', 'status': 'Pending'
+    }})),
+    ('PUT /tasks/<id>', 'put', lambda ctx: (
+        f"/api/tasks/{random.choice(ctx['task_ids'])}", {'json': {'status': 'Completed'}}
+    )),
+    ('GET /reminders', 'get', lambda ctx: ('/api/reminders', {'query_string': {'limit': 50}})),
+    ('GET /tasks/<id>/reminders', 'get', lambda ctx: (
+        f"/api/tasks/{random.choice(ctx['task_ids'])}/reminders", {}
+    )),
+    ('POST /reminders', 'post', lambda ctx: ('/api/reminders', {'json': {
+        'task_id': random.choice(ctx['task_ids']),
+        'reminder_time': (datetime.utcnow() + timedelta(days=2)).isoformat(),
+    }})),
+    ('GET /calendar', 'get', lambda ctx: ('/api/calendar', {'query_string': _window()})),
+    ('GET /tasks/search', 'get', lambda ctx: (
+        '/api/tasks/search', {'query_string': {'q': 'bench', 'limit': 20}}
+    )),
+]
+
+def run_scenario(app, contexts, method, build, requests, clients):
+    latencies, errors = [], []
+    lock = threading.Lock()
+    remaining = iter(range(requests))
+
+    def client_loop(ctx):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['user_id'] = ctx['user_id']
+        local = []
+        failed = 0
+        while True:
+            with lock:
+                if next(remaining, None) is None:
+                    break
+            path, kwargs = build(ctx)
+            started = time.perf_counter()
+            response = getattr(client, method)(path, **kwargs)
+            response.get_data()  # Drain streamed bodies
+            local.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                failed += 1
+        with lock:
+            latencies.extend(local)
+            errors.append(failed)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        list(executor.map(client_loop, contexts[:clients]))
+    elapsed = time.perf_counter() - started
+
+    return summarize(latencies, elapsed, sum(errors))
+
+# Print endpoints whose p95 or throughput got worse than the baseline
+def compare(results, baseline_path, tolerance):
+    with open(baseline_path) as f:
+        baseline = json.load(f)['results']
+
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        if current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {previous['p95_ms']} -> {current['p95_ms']} ms")
+        if current['rps'] < previous['rps'] * (1 - tolerance):
+            regressions.append(f"{name}: {previous['rps']} -> {current['rps']} req/s")
+
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', help='Defaults to a temporary SQLite file.')
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--tasks-per-user', type=int, default=200)
+    parser.add_argument('--reminders-per-task', type=int, default=1)
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=500, help='Requests per endpoint.')
+    parser.add_argument('--only', action='append', help='Run only the named endpoint(s).')
+    parser.add_argument('--output', help='Results file (default: bench/results/).')
+    parser.add_argument('--baseline', help='Earlier results file to compare against.')
+    parser.add_argument('--tolerance', type=float, default=0.10)
+    parser.add_argument('--hot-cache', choices=['local', 'loopback', 'off'], default='local')
+    parser.add_argument('--cache-latency', type=float, default=0.0005,
+                        help="Seconds per call to the 'loopback' cache.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = args.database_url or f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        app = make_app(
+            database_url,
+            # Let SQLite writers wait for each other instead of failing
+            SQLALCHEMY_ENGINE_OPTIONS={'connect_args': {'timeout': 30}}
+            if database_url.startswith('sqlite') else {},
+            HOT_CACHE_ENABLED=args.hot_cache != 'off',
+            HOT_CACHE_BACKEND=LoopbackBackend(args.cache_latency)
+            if args.hot_cache == 'loopback' else None
+        )
+
+        with app.app_context():
+            user_ids = seed(args.users, args.tasks_per_user, args.reminders_per_task)
+            contexts = []
+            for user_id in user_ids[:max(args.clients, 1)]:
+                task_ids = db.session.execute(
+                    db.select(Task.task_id).where(Task.user_id == user_id).limit(100)
+                ).scalars().all()
+                contexts.append({'user_id': user_id, 'task_ids': task_ids})
+        # Fewer users than clients: clients share users
+        while len(contexts) < args.clients:
+            contexts.append(contexts[len(contexts) % len(user_ids)])
+
+        results = {}
+        for name, method, build in SCENARIOS:
+            if args.only and name not in args.only:
+                continue
+            results[name] = run_scenario(
+                app, contexts, method, build, args.requests, args.clients
+            )
+            r = results[name]
+            print(
+                f"{name:<26} {r['rps']:>8} req/s  p50 {r['p50_ms']:>8} ms  "
+                f"p95 {r['p95_ms']:>8} ms  p99 {r['p99_ms']:>8} ms  errors {r['errors']}"
+            )
+
+    params = {k: v for k, v in vars(args).items() if k not in ('output', 'baseline')}
+    params['database'] = (args.database_url or 'sqlite').split(':', 1)[0]
+    print(f"Results written to {write_results('api_load', results, params, args.output)}")
+
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        for line in regressions:
+            print(f'REGRESSION {line}')
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""Shared helpers for the benchmark scripts."""
+from datetime import datetime, timedelta
+import json
+import math
+import os
+import platform
+import subprocess
+import time
+from app import create_app, db
+from app.mailer import LocalTransport
+from app.models import User, Task, Reminder
+from werkzeug.security import generate_password_hash
+
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+# Build the app against a local database with outgoing mail stubbed out
+def make_app(database_url, **config):
+    app = create_app(dict({
+        'SQLALCHEMY_DATABASE_URI': database_url,
+        'SECRET_KEY': 'bench',
+        'MAIL_SUPPRESS_SEND': True,
+        'MAIL_TRANSPORT': LocalTransport(),
+    }, **config))
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+    return app
+
+# Insert users, tasks and reminders with bulk INSERTs. Returns the user IDs.
+def seed(users, tasks_per_user, reminders_per_task, chunk_size=5000):
+    password = generate_password_hash('benchmark-password')
+    db.session.execute(db.insert(User), [
+        {'username': f'user{i}', 'email': f'user{i}@example.com', 'password': password}
+        for i in range(users)
+    ])
+    db.session.commit()
+    user_ids = db.session.execute(
+        db.select(User.user_id).order_by(User.user_id)
+    ).scalars().all()
+
+    start = datetime.utcnow().replace(microsecond=0) + timedelta(days=1)
+    rows = []
+    for user_id in user_ids:
+        for i in range(tasks_per_user):
+            rows.append({
+                'user_id': user_id,
+                'title': f'Task {i}',
+                'description': 'Seeded by the benchmark suite',
+                'start_time': start + timedelta(hours=i),
+                'end_time': start + timedelta(hours=i, minutes=30),
+                'priority': ('Low', 'Medium', 'High')[i % 3],
+                'status': ('Pending', 'Completed')[i % 2],
+                'recurrence': ('None', 'None', 'None', 'Daily', 'Weekly')[i % 5],
+            })
+    for offset in range(0, len(rows), chunk_size):
+        db.session.execute(db.insert(Task), rows[offset:offset + chunk_size])
+    db.session.commit()
+
+    if reminders_per_task:
+        tasks = db.session.execute(
+            db.select(Task.task_id, Task.user_id, Task.start_time)
+        ).all()
+        rows = [
+            {
+                'task_id': task_id,
+                'user_id': user_id,
+                'reminder_time': start_time - timedelta(minutes=15 * (j + 1)),
+                'sent': False,
+            }
+            for task_id, user_id, start_time in tasks
+            for j in range(reminders_per_task)
+        ]
+        for offset in range(0, len(rows), chunk_size):
+            db.session.execute(db.insert(Reminder), rows[offset:offset + chunk_size])
+        db.session.commit()
+
+    return user_ids
+
+# Nearest-rank percentile of an already sorted list
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    rank = math.ceil(fraction * len(sorted_values))
+
+    return sorted_values[min(max(rank, 1), len(sorted_values)) - 1]
+
+def summarize(latencies, elapsed, errors=0):
+    latencies = sorted(latencies)
+    to_ms = lambda value: None if value is None else round(value * 1000, 3)
+
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'p50_ms': to_ms(percentile(latencies, 0.50)),
+        'p95_ms': to_ms(percentile(latencies, 0.95)),
+        'p99_ms': to_ms(percentile(latencies, 0.99)),
+    }
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(__file__)
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# Write results as JSON, tagged with the commit and environment
+def write_results(name, results, params, path=None):
+    revision = git_revision()
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f'{name}-{revision or "unknown"}.json')
+
+    with open(path, 'w') as f:
+        json.dump({
+            'benchmark': name,
+            'revision': revision,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'python': platform.python_version(),
+            'params': params,
+            'results': results,
+        }, f, indent=2, sort_keys=True)
+
+    return path
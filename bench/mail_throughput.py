@@ -0,0 +1,68 @@
+"""Measure email delivery throughput against an in-process SMTP stand-in.
+
+Compares one connection per message (the old 'mail.send' path) with the
+pooled, batched delivery engine.
+
+    python -m bench.mail_throughput --messages 2000 --connect-latency 0.05
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import time
+from app import create_app
+from app.mailer import DeliveryEngine, LocalTransport
+from app.utils import build_message
+
+
+def unpooled(transport, messages):
+    for message in messages:
+        connection = transport.open()
+        transport.send(connection, message)
+        transport.close(connection)
+
+def pooled(transport, messages, pool_size, batch_size):
+    engine = DeliveryEngine(transport, pool_size=pool_size, batch_size=batch_size)
+    batches = [
+        messages[start:start + batch_size]
+        for start in range(0, len(messages), batch_size)
+    ]
+    with ThreadPoolExecutor(max_workers=pool_size) as executor:
+        list(executor.map(engine.send_batch, batches))
+    engine.close()
+
+def measure(name, func, transport, messages, *args):
+    started = time.perf_counter()
+    func(transport, messages, *args)
+    elapsed = time.perf_counter() - started
+    print(
+        f"{name:>10}: {len(messages) / elapsed:10.1f} msg/s "
+        f"({transport.connections_opened} connections)"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=1000)
+    parser.add_argument('--connect-latency', type=float, default=0.02)
+    parser.add_argument('--send-latency', type=float, default=0.001)
+    parser.add_argument('--pool-size', type=int, default=4)
+    parser.add_argument('--batch-size', type=int, default=50)
+    args = parser.parse_args()
+
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://'})
+    with app.app_context():
+        messages = [
+            build_message('Benchmark', [f'user{i}@example.com'], 'Hello')
+            for i in range(args.messages)
+        ]
+
+        def transport():
+            return LocalTransport(args.connect_latency, args.send_latency)
+
+        measure('unpooled', unpooled, transport(), messages)
+        measure(
+            'pooled', pooled, transport(), messages,
+            args.pool_size, args.batch_size
+        )
+
+
+if __name__ == '__main__':
+    main()
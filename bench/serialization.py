@@ -0,0 +1,97 @@
+"""Compare marshmallow and fast-path serialization of large task lists.
+
+Seeds an in-memory SQLite database, then times query + dump + JSON
+encoding of the same rows both ways and checks the bytes are identical.
+
+    python -m bench.serialization --rows 10000 --repeat 5
+"""
+import argparse
+from datetime import datetime, timedelta
+import time
+from app import create_app, db
+from app.models import User, Task
+from app.schemas import TaskSchema
+from app.serializers import FastJSONProvider, FastSerializer
+
+
+def seed(rows):
+    user = User(username='bench', email='bench@example.com', password='x')
+    db.session.add(user)
+    db.session.commit()
+
+    start = datetime(2030, 1, 1, 9)
+    db.session.execute(db.insert(Task), [
+        {
+            'user_id': user.user_id,
+            'title': f'Task {i}',
+            'description': 'Benchmark task ' * 4,
+            'start_time': start + timedelta(hours=i),
+            'end_time': start + timedelta(hours=i, minutes=30),
+            'location': 'Office',
+            'priority': ('Low', 'Medium', 'High')[i % 3],
+            'status': ('Pending', 'Completed')[i % 2],
+            'recurrence': 'None',
+        }
+        for i in range(rows)
+    ])
+    db.session.commit()
+
+    return user.user_id
+
+def best_of(repeat, func):
+    timings = []
+    for _ in range(repeat):
+        db.session.expunge_all()
+        started = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - started)
+
+    return min(timings), result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://'})
+    provider = FastJSONProvider(app)
+    tasks_schema = TaskSchema(many=True)
+    serializer = FastSerializer(TaskSchema(), Task)
+
+    with app.app_context():
+        db.create_all()
+        user_id = seed(args.rows)
+
+        def marshmallow_path(json):
+            tasks = Task.query.filter_by(user_id=user_id).order_by(Task.task_id).all()
+            return json.dumps(tasks_schema.dump(tasks), separators=(',', ':'))
+
+        def fast_path(json):
+            rows = serializer.query().filter_by(user_id=user_id).order_by(Task.task_id).all()
+            return json.dumps(serializer.dump(rows), separators=(',', ':'))
+
+        results = {}
+        for name, func, json in [
+            ('marshmallow + default JSON', marshmallow_path, app.json),
+            ('marshmallow + fast JSON', marshmallow_path, provider),
+            ('fast path + default JSON', fast_path, app.json),
+            ('fast path + fast JSON', fast_path, provider),
+        ]:
+            elapsed, body = best_of(args.repeat, lambda: func(json))
+            results[name] = (elapsed, body)
+
+        baseline = results['marshmallow + default JSON'][0]
+        for name, (elapsed, _) in results.items():
+            print(f'{name:>28}: {elapsed * 1000:8.1f} ms  ({baseline / elapsed:4.1f}x)')
+
+        for json_name in ('default JSON', 'fast JSON'):
+            assert (
+                results[f'marshmallow + {json_name}'][1]
+                == results[f'fast path + {json_name}'][1]
+            ), f'Output differs with {json_name}'
+        print('Output is byte-for-byte identical')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""Measure signup throughput and its effect on task-endpoint latency.
+
+For each mode, concurrent clients create accounts for --duration seconds
+while other clients read tasks, and the reads' latency is compared with a
+run without signups. 'inline' hashes passwords on the request thread (the
+old path); 'pool' uses the PASSWORD_HASH_WORKERS process pool.
+
+    python -m bench.signup --signup-clients 8 --task-clients 4 --duration 10
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import itertools
+import os
+import random
+import tempfile
+import threading
+import time
+from app import db
+from app.models import Task
+from bench.common import make_app, seed, summarize, write_results
+
+
+def _signup_loop(app, stop, counter, latencies, errors):
+    client = app.test_client()
+    while not stop.is_set():
+        n = next(counter)
+        started = time.perf_counter()
+        response = client.post('/api/users', json={
+            'username': f'signup{n}', 'email': f'signup{n}@example.com',
+            'password': 'benchmark-password',
+        })
+        latencies.append(time.perf_counter() - started)
+        if response.status_code != 201:
+            errors.append(response.status_code)
+
+def _task_loop(app, stop, ctx, latencies, errors):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = ctx['user_id']
+    while not stop.is_set():
+        started = time.perf_counter()
+        response = client.get(f"/api/tasks/{random.choice(ctx['task_ids'])}")
+        latencies.append(time.perf_counter() - started)
+        if response.status_code != 200:
+            errors.append(response.status_code)
+
+def run_mode(app, contexts, signup_clients, duration):
+    stop = threading.Event()
+    counter = itertools.count()
+    signups, signup_errors = [], []
+    reads, read_errors = [], []
+
+    with ThreadPoolExecutor(max_workers=signup_clients + len(contexts)) as executor:
+        for _ in range(signup_clients):
+            executor.submit(_signup_loop, app, stop, counter, signups, signup_errors)
+        for ctx in contexts:
+            executor.submit(_task_loop, app, stop, ctx, reads, read_errors)
+        time.sleep(duration)
+        stop.set()
+
+    result = {'tasks': summarize(reads, duration, len(read_errors))}
+    if signup_clients:
+        result['signups'] = summarize(signups, duration, len(signup_errors))
+
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--signup-clients', type=int, default=8)
+    parser.add_argument('--task-clients', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds per mode.')
+    parser.add_argument('--hash-workers', type=int, default=2, help="Pool size for 'pool' mode.")
+    parser.add_argument('--hash-method', default='scrypt')
+    parser.add_argument('--output', help='Results file (default: bench/results/).')
+    args = parser.parse_args()
+
+    modes = [('idle', 0, 0), ('inline', args.signup_clients, 0), ('pool', args.signup_clients, args.hash_workers)]
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, signup_clients, hash_workers in modes:
+            app = make_app(
+                f"sqlite:///{os.path.join(tmp, f'{name}.db')}",
+                PASSWORD_HASH_WORKERS=hash_workers,
+                PASSWORD_HASH_METHOD=args.hash_method,
+                # Let SQLite writers wait for each other instead of failing
+                SQLALCHEMY_ENGINE_OPTIONS={'connect_args': {'timeout': 30}}
+            )
+            with app.app_context():
+                user_ids = seed(args.task_clients, 100, 0)
+                contexts = [
+                    {'user_id': user_id, 'task_ids': db.session.execute(
+                        db.select(Task.task_id).where(Task.user_id == user_id)
+                    ).scalars().all()}
+                    for user_id in user_ids
+                ]
+                # Start the pool before timing, as a long-running server would have
+                if hash_workers:
+                    app.extensions['password_hasher'].hash('warm-up-password')
+
+            result = results[name] = run_mode(app, contexts, signup_clients, args.duration)
+            line = (
+                f"{name:>6}: tasks {result['tasks']['rps']:>8} req/s  "
+                f"p50 {result['tasks']['p50_ms']:>8} ms  p95 {result['tasks']['p95_ms']:>8} ms"
+            )
+            if 'signups' in result:
+                line += (
+                    f"  | signups {result['signups']['rps']:>6} /s  "
+                    f"p95 {result['signups']['p95_ms']:>8} ms  errors {result['signups']['errors']}"
+                )
+            print(line)
+
+    params = {k: v for k, v in vars(args).items() if k != 'output'}
+    print(f"Results written to {write_results('signup', results, params, args.output)}")
+
+
+if __name__ == '__main__':
+    main()
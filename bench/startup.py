@@ -0,0 +1,128 @@
+"""Check the cold-start cost of each app profile against its budget.
+
+Every sample builds the app in a fresh interpreter run with '-X importtime'.
+The time to import Flask and Flask-SQLAlchemy is measured first and
+reported as the floor, since no profile can avoid it. The budget applies to
+the overhead on top of that floor, which keeps it roughly comparable
+between machines. A profile also fails if it imports a module on its
+forbidden list. Exits with status 1 when any profile is over budget.
+
+    python -m bench.startup --samples 5 --top 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from bench.common import write_results
+
+
+# Milliseconds of overhead over the Flask/SQLAlchemy floor, and modules
+# each profile must not import. Raise a budget only with a reason.
+BUDGETS = {
+    'api': {
+        'overhead_ms': 250,
+        'forbidden': ['alembic', 'flask_migrate'],
+    },
+    'worker': {
+        'overhead_ms': 200,
+        'forbidden': ['alembic', 'flask_migrate', 'marshmallow', 'app.task_routes'],
+    },
+    'full': {
+        'overhead_ms': 300,
+        'forbidden': ['alembic', 'flask_migrate'],
+    },
+}
+
+# Run in the child interpreter: time the floor, then the app
+_CHILD = """
+import json, sys, time
+started = time.perf_counter()
+import flask, flask_sqlalchemy
+floor = time.perf_counter()
+from app import create_app
+create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://', 'SECRET_KEY': 'startup'}, profile=sys.argv[1])
+done = time.perf_counter()
+print(json.dumps({
+    'floor_ms': (floor - started) * 1000,
+    'overhead_ms': (done - floor) * 1000,
+    'modules': sorted(sys.modules),
+}))
+"""
+
+# Parse '-X importtime' output into {module: (self_us, cumulative_us)}
+def parse_importtime(stderr):
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+
+    return times
+
+def sample(profile):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', _CHILD, profile],
+        capture_output=True, text=True, check=True, cwd=root,
+        env=dict(os.environ, PYTHONDONTWRITEBYTECODE='1')
+    )
+
+    return json.loads(completed.stdout), parse_importtime(completed.stderr)
+
+def check_profile(profile, samples, top):
+    runs = [sample(profile) for _ in range(samples)]
+    floor = statistics.median(run['floor_ms'] for run, _ in runs)
+    overhead = statistics.median(run['overhead_ms'] for run, _ in runs)
+    budget = BUDGETS[profile]
+    forbidden = [
+        module for module in budget['forbidden'] if module in runs[0][0]['modules']
+    ]
+
+    # Slowest modules by their own import time, from the last sample
+    slowest = sorted(runs[-1][1].items(), key=lambda item: -item[1][0])[:top]
+
+    return {
+        'floor_ms': round(floor, 1),
+        'overhead_ms': round(overhead, 1),
+        'budget_ms': budget['overhead_ms'],
+        'forbidden_imported': forbidden,
+        'ok': overhead <= budget['overhead_ms'] and not forbidden,
+        'slowest': [
+            {'module': name, 'self_ms': round(self_us / 1000, 1)}
+            for name, (self_us, _) in slowest
+        ],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--profile', action='append', choices=sorted(BUDGETS),
+                        help='Check only the named profile(s).')
+    parser.add_argument('--samples', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10, help='Slowest imports to list.')
+    parser.add_argument('--output', help='Results file (default: bench/results/).')
+    args = parser.parse_args()
+
+    results = {}
+    for profile in args.profile or BUDGETS:
+        result = results[profile] = check_profile(profile, args.samples, args.top)
+        print(
+            f"{profile:>6}: {result['overhead_ms']:7.1f} ms over a "
+            f"{result['floor_ms']:.1f} ms floor (budget {result['budget_ms']} ms)"
+            f"{'' if result['ok'] else '  OVER BUDGET'}"
+        )
+        if result['forbidden_imported']:
+            print(f"        imports {', '.join(result['forbidden_imported'])}")
+        for item in result['slowest']:
+            print(f"        {item['self_ms']:7.1f} ms  {item['module']}")
+
+    params = {'samples': args.samples}
+    print(f"Results written to {write_results('startup', results, params, args.output)}")
+
+    sys.exit(0 if all(result['ok'] for result in results.values()) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,10 @@
+from app import create_app
+from app.push import PushApp
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# ASGI entry point for Server-Sent Events, e.g. `uvicorn push_asgi:app`
+# (It serves no API routes, but runs the reminder dispatcher)
+app = PushApp(create_app(profile='worker'))
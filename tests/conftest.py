@@ -0,0 +1,38 @@
+import pytest
+from app import create_app, db
+from app.models import User
+
+
+# An API app by default; parametrize 'app' indirectly to pick the profile
+@pytest.fixture
+def app(request):
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+        'SECRET_KEY': 'test',
+        'PASSWORD_HASH_WORKERS': 0,
+    }, profile=getattr(request, 'param', 'api'))
+    with app.app_context():
+        db.create_all()
+        yield app
+
+# Creates a user and returns their ID
+@pytest.fixture
+def make_user(app):
+    def make_user(username):
+        user = User(username=username, email=f'{username}@example.com', password='x')
+        db.session.add(user)
+        db.session.commit()
+        return user.user_id
+
+    return make_user
+
+# A test client logged in as the given user
+@pytest.fixture
+def login(app):
+    def login(user_id):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['user_id'] = user_id
+        return client
+
+    return login
@@ -0,0 +1,33 @@
+import pytest
+from app import db, task_routes
+from app.models import Task
+
+
+@pytest.mark.parametrize('hot_cache', [True, False])
+def test_task_not_modified_without_serializing(app, make_user, login, monkeypatch, hot_cache):
+    if not hot_cache:
+        app.extensions['hot_cache'] = None
+    user_id = make_user('owner')
+    task = Task(user_id=user_id, title='Polled')
+    db.session.add(task)
+    db.session.commit()
+    client = login(user_id)
+    etag = client.get(f'/api/tasks/{task.task_id}').headers['ETag']
+
+    dumps = []
+    dump = task_routes.task_schema.dump
+    monkeypatch.setattr(task_routes.task_schema, 'dump', lambda obj: dumps.append(obj) or dump(obj))
+    # A miss: the entry for the version being polled is gone
+    if hot_cache:
+        app.extensions['hot_cache'].backend.clear()
+
+    response = client.get(f'/api/tasks/{task.task_id}', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert dumps == []
+
+    # A changed task is loaded and serialized again
+    client.put(f'/api/tasks/{task.task_id}', json={'title': 'Changed'})
+    response = client.get(f'/api/tasks/{task.task_id}', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.get_json()['title'] == 'Changed'
+    assert len(dumps) == 2  # The PUT's response and the GET
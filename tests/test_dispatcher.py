@@ -0,0 +1,56 @@
+from datetime import datetime, timedelta
+import pytest
+from app import db
+from app.dispatcher import dispatch_due_reminders
+from app.models import User, Task, Reminder, Notification
+from app.push import LocalBroker
+
+
+class ConnectedBroker(LocalBroker):
+    """Every user has one open connection."""
+
+    def __init__(self):
+        super().__init__()
+        self.published = []
+
+    def publish(self, channel, message):
+        self.published.append(channel)
+        return 1
+
+
+def _due_push_reminder(make_user):
+    user_id = make_user('pushed')
+    db.session.get(User, user_id).notification_preference = 'Push notifications'
+    task = Task(user_id=user_id, title='Stand-up')
+    db.session.add(task)
+    db.session.flush()
+    reminder = Reminder(
+        task_id=task.task_id, user_id=user_id,
+        reminder_time=datetime.utcnow() - timedelta(minutes=1)
+    )
+    db.session.add(reminder)
+    db.session.commit()
+
+    return reminder.reminder_id
+
+@pytest.mark.parametrize('app', ['worker'], indirect=True)
+def test_push_without_connections_is_emailed(app, make_user):
+    reminder_id = _due_push_reminder(make_user)
+
+    assert dispatch_due_reminders(10) == 1
+
+    assert db.session.get(Reminder, reminder_id).sent
+    notification = db.session.execute(db.select(Notification)).scalar_one()
+    assert notification.reminder_id == reminder_id
+    assert notification.subject == 'Reminder: Stand-up'
+
+@pytest.mark.parametrize('app', ['worker'], indirect=True)
+def test_delivered_push_is_not_emailed(app, make_user):
+    broker = app.extensions['push_broker'] = ConnectedBroker()
+    reminder_id = _due_push_reminder(make_user)
+
+    assert dispatch_due_reminders(10) == 1
+
+    assert db.session.get(Reminder, reminder_id).sent
+    assert len(broker.published) == 1
+    assert db.session.execute(db.select(Notification)).first() is None
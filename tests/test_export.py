@@ -0,0 +1,94 @@
+from datetime import datetime, timedelta
+import json
+from app import db
+from app.archive import archive_batch
+from app.models import Task, Reminder
+
+
+def test_export_round_trips_through_import(make_user, login):
+    owner = make_user('owner')
+    now = datetime.utcnow().replace(microsecond=0)
+    full = Task(
+        user_id=owner, title='Full', description='All fields', location='Home',
+        priority='High', status='Pending', recurrence='Weekly',
+        start_time=now + timedelta(days=1), end_time=now + timedelta(days=1, hours=1),
+        reminder_time=now + timedelta(hours=20)
+    )
+    bare = Task(user_id=owner, title='Only a title')
+    db.session.add_all([full, bare])
+    db.session.flush()
+    db.session.add_all([
+        Reminder(task_id=full.task_id, user_id=owner, reminder_time=now + timedelta(hours=20)),
+        # Already sent, so in the past
+        Reminder(task_id=bare.task_id, user_id=owner, reminder_time=now - timedelta(days=3),
+                 sent=True, sent_time=now - timedelta(days=3)),
+    ])
+    db.session.commit()
+    # Move the sent one to the archive; it is exported all the same
+    assert archive_batch(now - timedelta(days=1), 10) == 1
+
+    exported = login(owner).get('/api/export').get_data(as_text=True)
+    assert [json.loads(line)['type'] for line in exported.splitlines()] == [
+        'task', 'task', 'reminder', 'reminder'
+    ]
+
+    restorer = make_user('restorer')
+    response = login(restorer).post('/api/import', data=exported)
+    assert response.status_code == 200
+    assert response.get_json() == {'inserted': {'tasks': 2, 'reminders': 2}, 'errors': []}
+
+    # The same export, apart from IDs and versions, with reminders attached
+    # to the restored tasks
+    restored = login(restorer).get('/api/export').get_data(as_text=True)
+
+    def normalized(ndjson):
+        records = [json.loads(line) for line in ndjson.splitlines()]
+        titles = {r['task_id']: r['title'] for r in records if r['type'] == 'task'}
+        for record in records:
+            if record['type'] == 'reminder':
+                record['task_id'] = titles[record['task_id']]
+                del record['reminder_id']
+            else:
+                del record['task_id']
+            del record['version'], record['updated_at']
+        return records
+
+    assert normalized(restored) == normalized(exported)
+
+def test_import_reports_reminders_of_unknown_tasks(make_user, login):
+    user_id = make_user('owner')
+    line = json.dumps({
+        'type': 'reminder', 'task_id': 999, 'reminder_id': 1,
+        'reminder_time': '2030-01-01T09:00:00+0000', 'sent': False, 'sent_time': None,
+    })
+
+    response = login(user_id).post('/api/import', data=line + '\n')
+
+    assert response.get_json() == {
+        'inserted': {'tasks': 0, 'reminders': 0},
+        'errors': [{'line': 1, 'error': 'Task not found in the import'}],
+    }
+
+def test_bulk_routes_store_times_as_utc(make_user, login):
+    user_id = make_user('owner')
+    client = login(user_id)
+    task = {
+        'title': 'Offset', 'start_time': '2030-01-01T10:00:00+02:00',
+        'end_time': '2030-01-01T11:00:00+02:00', 'reminder_time': '2030-01-01T09:30:00+02:00',
+    }
+
+    client.post('/api/tasks', json=task)
+    client.post('/api/tasks/bulk', data=json.dumps(task) + '\n')
+    client.post('/api/import', data=json.dumps(dict(task, type='task')) + '\n')
+    task_ids = db.session.execute(db.select(Task.task_id)).scalars().all()
+    client.post('/api/reminders/bulk', data=json.dumps({
+        'task_id': task_ids[0], 'reminder_time': '2030-01-01T09:45:00+0200',
+    }) + '\n')
+
+    db.session.expire_all()
+    assert db.session.execute(
+        db.select(Task.start_time, Task.end_time, Task.reminder_time)
+    ).all() == [(datetime(2030, 1, 1, 8), datetime(2030, 1, 1, 9), datetime(2030, 1, 1, 7, 30))] * 3
+    assert db.session.execute(db.select(Reminder.reminder_time)).scalars().all() == [
+        datetime(2030, 1, 1, 7, 45)
+    ]
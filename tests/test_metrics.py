@@ -0,0 +1,21 @@
+from urllib.request import urlopen
+import pytest
+from app.metrics import observe_mail, start_metrics_server
+
+
+@pytest.mark.parametrize('app', ['worker'], indirect=True)
+def test_worker_serves_mail_metrics(app):
+    assert start_metrics_server(app) is None  # No port configured
+
+    server = start_metrics_server(app, port=0)
+    try:
+        observe_mail(0.02, failed=True)
+        with urlopen(f'http://127.0.0.1:{server.server_address[1]}/metrics') as response:
+            body = response.read().decode()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert 'dayminder_mail_send_seconds_count' in body
+    assert 'dayminder_mail_failures_total' in body
+    assert 'dayminder_db_pool_connections' in body
@@ -0,0 +1,31 @@
+from datetime import datetime, timedelta
+from app import db
+from app.models import Task, TaskOccurrence, Reminder
+from app.occurrences import materialize
+
+
+def test_occurrences_closer_than_the_lead_get_no_reminder(make_user):
+    now = datetime(2030, 1, 1, 8)
+    # Daily at 08:30, reminded an hour before
+    task = Task(
+        user_id=make_user('owner'), title='Stand-up', recurrence='Daily',
+        start_time=datetime(2030, 1, 1, 8, 30), end_time=datetime(2030, 1, 1, 9),
+        reminder_time=datetime(2030, 1, 1, 7, 30)
+    )
+    db.session.add(task)
+    db.session.flush()
+
+    materialize([task], now + timedelta(days=3), now)
+    db.session.commit()
+
+    occurrences = db.session.execute(
+        db.select(TaskOccurrence.start_time, Reminder.reminder_time)
+        .outerjoin(Reminder, Reminder.occurrence_id == TaskOccurrence.occurrence_id)
+        .order_by(TaskOccurrence.start_time)
+    ).all()
+    # Today's reminder would already be due, so only later days get one
+    assert occurrences[0] == (datetime(2030, 1, 1, 8, 30), None)
+    assert occurrences[1:] and all(
+        reminder_time == start_time - timedelta(hours=1)
+        for start_time, reminder_time in occurrences[1:]
+    )
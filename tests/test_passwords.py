@@ -0,0 +1,55 @@
+import os
+import time
+import pytest
+from werkzeug.security import check_password_hash
+from app import db
+from app.models import User
+from app.passwords import PasswordHasher, PasswordPoolBusy
+
+
+@pytest.fixture
+def hasher(app):
+    hasher = app.extensions['password_hasher'] = PasswordHasher(
+        'pbkdf2:sha256:1000', workers=1, queue_size=1, timeout=30
+    )
+    yield hasher
+    if hasher._pool is not None:
+        hasher._pool.shutdown(cancel_futures=True)
+
+def _signup(app, username):
+    return app.test_client().post('/api/users', json={
+        'username': username, 'email': f'{username}@example.com', 'password': 'correct horse'
+    })
+
+def _all_slots_free(hasher):
+    acquired = 0
+    while hasher._slots.acquire(blocking=False):
+        acquired += 1
+    for _ in range(acquired):
+        hasher._slots.release()
+    return acquired == hasher.workers + 1  # Plus the queue_size of 1
+
+def test_pool_is_replaced_after_a_worker_dies(app, hasher):
+    assert _signup(app, 'first').status_code == 201
+    broken = hasher._pool
+    for process in list(broken._processes.values()):
+        process.kill()
+    deadline = time.monotonic() + 10
+    while not broken._broken and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert broken._broken
+
+    # The next signup starts a new pool instead of failing
+    assert _signup(app, 'second').status_code == 201
+    assert hasher._pool is not broken
+    user = db.session.execute(db.select(User).filter_by(username='second')).scalar_one()
+    assert check_password_hash(user.password, 'correct horse')
+    assert _all_slots_free(hasher)
+
+def test_call_interrupted_by_a_dying_worker_is_busy(app, hasher):
+    # The worker exits in the middle of the call
+    with pytest.raises(PasswordPoolBusy):
+        hasher._run(os._exit, 1)
+
+    assert _signup(app, 'after').status_code == 201
+    assert _all_slots_free(hasher)
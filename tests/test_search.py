@@ -0,0 +1,30 @@
+import base64
+import json
+import pytest
+from app import db
+from app.models import Task
+
+
+def _cursor(value):
+    raw = json.dumps([None, value]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+@pytest.mark.parametrize('offset', [-1, 'ten', [1]])
+def test_search_rejects_invalid_offsets(make_user, login, offset):
+    client = login(make_user('owner'))
+
+    response = client.get('/api/tasks/search', query_string={'q': 'x', 'cursor': _cursor(offset)})
+
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Invalid cursor'}
+
+@pytest.mark.parametrize('app', ['worker'], indirect=True)
+def test_tasks_written_by_workers_are_indexed(app, make_user):
+    user_id = make_user('owner')
+    db.session.add(Task(user_id=user_id, title='Quarterly review'))
+    db.session.commit()
+
+    rowids = db.session.execute(
+        db.text("SELECT rowid FROM tasks_fts WHERE tasks_fts MATCH 'quarterly'")
+    ).scalars().all()
+    assert len(rowids) == 1
@@ -0,0 +1,54 @@
+from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.dialects import mysql
+from app import db
+from app.models import User, Task, TaskDailyStat
+from app.stats import backfill_stats
+
+
+def _legacy_user(make_user, titles):
+    user_id = make_user('legacy')
+    # From before the rollups: not backfilled, and no rollup rows
+    db.session.get(User, user_id).stats_ready = False
+    db.session.execute(db.insert(Task), [
+        {'user_id': user_id, 'title': title, 'status': 'Completed', 'start_time': datetime(2030, 1, 1)}
+        for title in titles
+    ])
+    db.session.commit()
+
+    return user_id
+
+def test_stats_are_counted_from_tasks_until_backfilled(make_user, login):
+    user_id = _legacy_user(make_user, ['One', 'Two', 'Three'])
+    client = login(user_id)
+    task_id = db.session.execute(db.select(Task.task_id).limit(1)).scalar()
+
+    # The delete takes the missing rollup row to -1
+    assert client.delete(f'/api/tasks/{task_id}').status_code == 204
+    assert client.get('/api/stats').get_json()['by_status'] == {'Completed': 2}
+
+    assert backfill_stats(10) == 1
+    assert db.session.get(User, user_id).stats_ready
+    assert db.session.execute(
+        db.select(TaskDailyStat.task_count).where(TaskDailyStat.user_id == user_id)
+    ).scalars().all() == [2]
+    assert client.get('/api/stats').get_json()['by_status'] == {'Completed': 2}
+
+def test_backfill_locks_each_chunk_of_users(app, make_user):
+    _legacy_user(make_user, ['One'])
+    make_user('other')
+    user_selects = []
+
+    @event.listens_for(db.session, 'do_orm_execute')
+    def record(state):
+        if state.is_select and User.__table__ in state.statement.get_final_froms():
+            user_selects.append(str(state.statement.compile(dialect=mysql.dialect())))
+
+    try:
+        assert backfill_stats(1) == 2
+    finally:
+        event.remove(db.session, 'do_orm_execute', record)
+
+    # Two chunks and the final empty one, each read under a row lock
+    assert len(user_selects) == 3
+    assert all(select.endswith('FOR UPDATE') for select in user_selects)
@@ -0,0 +1,45 @@
+from datetime import datetime
+from app import db
+from app.models import Task, Reminder
+
+
+def _sync_pages(client, since=None):
+    changes = []
+    while True:
+        query = {'limit': 2}
+        if since:
+            query['since'] = since
+        page = client.get('/api/sync', query_string=query).get_json()
+        changes += [('task', t['task_id']) for t in page['tasks']]
+        changes += [('reminder', r['reminder_id']) for r in page['reminders']]
+        since = page['next_token']
+        if not page['has_more']:
+            return changes, since
+
+def test_full_sync_pages_through_rows_sharing_a_version(make_user, login):
+    user_id = make_user('owner')
+    # Written before versioning: every row has version 0
+    db.session.execute(db.insert(Task), [
+        {'user_id': user_id, 'title': f'Legacy {n}', 'version': 0} for n in range(5)
+    ])
+    task_ids = db.session.execute(db.select(Task.task_id)).scalars().all()
+    db.session.execute(db.insert(Reminder), [
+        {'user_id': user_id, 'task_id': task_ids[0], 'reminder_time': datetime(2030, 1, 1, 9), 'version': 0}
+        for _ in range(3)
+    ])
+    db.session.commit()
+    client = login(user_id)
+
+    changes, token = _sync_pages(client)
+
+    assert sorted(changes) == sorted(
+        [('task', task_id) for task_id in task_ids]
+        + [('reminder', reminder_id) for reminder_id in db.session.execute(
+            db.select(Reminder.reminder_id)
+        ).scalars()]
+    )
+    assert len(changes) == len(set(changes)) == 8
+
+    # Only later writes follow the final token
+    new_task = client.post('/api/tasks', json={'title': 'After'}).get_json()
+    assert _sync_pages(client, token)[0] == [('task', new_task['task_id'])]